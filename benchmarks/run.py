@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Микробенчмарки разбора таблиц, запросов bot/db.py и построения текстов экранов
+на синтетической школе (benchmarks/synthetic.py).
+
+    python benchmarks/run.py                                   # замер, вывод в консоль
+    python benchmarks/run.py --save benchmarks/baselines/medium.json
+    python benchmarks/run.py --compare benchmarks/baselines/medium.json
+
+При --compare случаи, ставшие медленнее baseline больше чем на --threshold, помечаются
+как регрессия, и скрипт завершается с кодом 1.
+"""
+
+import argparse
+import csv
+import datetime
+import io
+import inspect
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import timeit
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot import clock, db
+from bot.config import DAYS
+from bot.timetable import TimetableSnapshot
+from bot.utils import (
+    get_current_next_lesson,
+    format_class_display,
+    format_main_menu_text,
+    format_week_text,
+    format_replacements_page
+)
+from scripts.update_schedule import parse_schedule_data
+from scripts.update_replacements import parse_replacements
+from scripts.csv_stream import parse_csv
+from benchmarks.synthetic import SCALES, School, SchoolConfig, populate
+
+# Функции bot/db.py, которые не замеряются по отдельности
+DB_SKIPPED = {
+    'get_connection', 'open_thread_connection', 'init_db', 'sync_indexes', '_bump_data_version',
+    # разрушают данные остальных случаев
+    'clear_schedule',
+    # разовые ночные операции: после первого вызова работы уже нет
+    'compact_sent_notifications', 'clear_old_replacements',
+    # замеряется вместе с load_schedule_staging (db.reload_schedule)
+    'swap_schedule_from_staging',
+}
+
+
+def measure(func, repeat: int) -> dict:
+    """Лучшее и медианное время одного вызова (секунды)"""
+    timer = timeit.Timer(func)
+    loops, _ = timer.autorange()
+    times = [t / loops for t in timer.repeat(repeat, loops)]
+    return {'best': min(times), 'median': statistics.median(times), 'loops': loops}
+
+
+def db_cases(school: School) -> dict:
+    class_name, profile = school.classes[len(school.classes) // 2]
+    user_id = school.users[0][0]
+    today = school.today.isoformat()
+    records = school.schedule_records()
+    staging = [r for r in records if r[0] == class_name]
+    replacements = school.replacement_records()
+    delivered = [(u, 1) for u, _c, _p, notify in school.users[:200] if notify]
+    fsm_key = f"1:{user_id}:{user_id}:::default"
+    fsm_batch = [(f"1:{u}:{u}:::default", 'ClassChoice:waiting_for_letter', '{"chosen_parallel": "10"}', 1.0e12)
+                 for u, _c, _p, _n in school.users[:50]]
+
+    def reload_schedule():
+        db.load_schedule_staging(staging)
+        db.swap_schedule_from_staging([staging[0][6]])
+
+    return {
+        'db.add_schedule': lambda: db.add_schedule(class_name, profile, DAYS[0], 1, 'Математика', '101'),
+        'db.load_schedule_staging': lambda: db.load_schedule_staging(staging),
+        'db.reload_schedule': reload_schedule,
+        'db.get_schedule': lambda: db.get_schedule(class_name, profile, DAYS[0]),
+        'db.get_schedule.week': lambda: db.get_schedule(class_name, profile),
+        'db.get_all_schedule': db.get_all_schedule,
+        'db.get_data_version': lambda: db.get_data_version('schedule'),
+        'db.get_source_cache': db.get_source_cache,
+        'db.set_source_cache': lambda: db.set_source_cache([('schedule_5', 'http://example/5.csv', '"etag"', None, 'hash')]),
+        'db.set_user': lambda: db.set_user(user_id, class_name, profile),
+        'db.get_user': lambda: db.get_user(user_id),
+        'db.get_all_users_with_notify': db.get_all_users_with_notify,
+        'db.get_subscribers_by_classes': lambda: db.get_subscribers_by_classes([c for c, _p in school.classes[:3]]),
+        'db.set_notify': lambda: db.set_notify(user_id, True),
+        'db.get_notify_status': lambda: db.get_notify_status(user_id),
+        'db.mark_notification_sent': lambda: db.mark_notification_sent(user_id, 3),
+        'db.check_notification_sent': lambda: db.check_notification_sent(user_id, 3),
+        'db.get_notified_user_ids': lambda: db.get_notified_user_ids(today, 1),
+        'db.record_notifications': lambda: db.record_notifications(today, 4, delivered),
+        'db.claim_notifications': lambda: db.claim_notifications(today, 5, [u for u, _n in delivered],
+                                                                 'bench', time.time(), 960.0),
+        'db.release_notifications': lambda: db.release_notifications(today, 5, [u for u, _n in delivered], 'bench'),
+        'db.claim_notifier_shards': lambda: db.claim_notifier_shards('bench', 8, time.time(), 30.0),
+        'db.release_notifier_shards': lambda: db.release_notifier_shards('bench'),
+        'db.set_last_notification': lambda: db.set_last_notification(user_id, 2),
+        'db.get_last_notification': lambda: db.get_last_notification(user_id),
+        'db.get_last_notifications': db.get_last_notifications,
+        'db.clear_last_notification': lambda: db.clear_last_notification(user_id),
+        'db.add_replacement': lambda: db.add_replacement(today, 8, class_name, 'Физика', None, '214'),
+        'db.apply_replacements_diff': lambda: db.apply_replacements_diff(replacements, today),
+        'db.get_replacement_changes': lambda: db.get_replacement_changes(0, 100),
+        'db.get_change_cursor': lambda: db.get_change_cursor('replacements_push'),
+        'db.set_change_cursor': lambda: db.set_change_cursor('replacements_push', 1),
+        'db.get_replacements_seq': db.get_replacements_seq,
+        'db.get_replacements_for_date': lambda: db.get_replacements_for_date(today),
+        'db.get_replacements_for_date_and_class': lambda: db.get_replacements_for_date_and_class(today, class_name),
+        'db.get_class_replacements_page': lambda: db.get_class_replacements_page(class_name, today, 16),
+        'db.get_other_replacements_page': lambda: db.get_other_replacements_page(class_name, today, 16, 32),
+        'db.get_fsm_record': lambda: db.get_fsm_record(fsm_key),
+        'db.save_fsm_records': lambda: db.save_fsm_records(fsm_batch, []),
+        'db.delete_expired_fsm': lambda: db.delete_expired_fsm(0.0),
+    }
+
+
+def csv_bytes(rows: list[list[str]], encoding: str) -> bytes:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue().encode(encoding)
+
+
+def cases(school: School) -> dict:
+    schedule_csv = {grade: school.schedule_rows(grade) for grade in school.config.grades}
+    replacement_csv = school.replacement_rows()
+    # Таблицы в том виде, в каком их отдаёт сервер (Google Sheets — UTF-8, старые выгрузки — windows-1251)
+    schedule_utf8 = {grade: csv_bytes(rows, 'utf-8') for grade, rows in schedule_csv.items()}
+    replacement_cp1251 = csv_bytes(replacement_csv, 'windows-1251')
+    snapshot_rows = [r[:6] for r in school.schedule_records()]
+    snapshot = TimetableSnapshot(snapshot_rows, version=1)
+
+    class_name, profile = school.classes[len(school.classes) // 2]
+    schedule_today = snapshot.get_schedule(class_name, profile, DAYS[0])
+    replacements_today = {lesson: (teacher, room)
+                          for date, lesson, cls, _s, teacher, room in school.replacement_records()
+                          if cls == class_name and date == school.today.isoformat()}
+    week = snapshot.get_schedule(class_name, profile)
+    week_dates = {day: (school.today + datetime.timedelta(days=i)).isoformat() for i, day in enumerate(DAYS)}
+    by_day = {day: {lesson: (teacher, room)
+                    for date, lesson, cls, _s, teacher, room in school.replacement_records()
+                    if cls == class_name and date == week_dates[day]}
+              for day in DAYS}
+    records = sorted(school.replacement_records())
+    mine = [(d, n, s, t, r) for d, n, c, s, t, r in records if c == class_name][:15]
+    others = [r for r in records if r[2] != class_name][:15]
+    # Середина третьего урока: результат не зависит от того, когда запущен замер
+    during_lesson = clock.lesson_start(school.today, 3) + datetime.timedelta(minutes=20)
+    current_info, next_info = get_current_next_lesson(schedule_today, replacements_today, at=during_lesson)
+
+    result = {
+        'parse.schedule_data': lambda: [parse_schedule_data(rows, f"schedule_{g}") for g, rows in schedule_csv.items()],
+        'parse.replacements': lambda: parse_replacements(replacement_csv),
+        'parse.csv_schedule_utf8': lambda: [parse_csv(content, f"schedule_{g}", lambda rows: parse_schedule_data(rows, ''))
+                                            for g, content in schedule_utf8.items()],
+        'parse.csv_replacements_cp1251': lambda: parse_csv(replacement_cp1251, 'replacements', parse_replacements),
+        'timetable.build_snapshot': lambda: TimetableSnapshot(snapshot_rows, version=1),
+        'timetable.get_schedule': lambda: snapshot.get_schedule(class_name, profile, DAYS[0]),
+        'clock.state': clock.state,
+        'render.get_current_next_lesson': lambda: get_current_next_lesson(schedule_today, replacements_today,
+                                                                          at=during_lesson),
+        'render.format_main_menu_text': lambda: format_main_menu_text(
+            user_name='Ученик',
+            class_display=format_class_display(class_name, profile),
+            current_info=current_info,
+            next_info=next_info,
+            no_lessons_message="😴 Сегодня уроков нет."
+        ),
+        'render.week_text': lambda: format_week_text(class_name, profile, week, week_dates, by_day),
+        'render.replacements_text': lambda: format_replacements_page(mine, others, 0, 0, True, True),
+    }
+    result.update(db_cases(school))
+    return result
+
+
+def check_coverage(db_names) -> list[str]:
+    defined = {name for name, func in inspect.getmembers(db, inspect.isfunction) if func.__module__ == db.__name__}
+    covered = {name.split('.')[1] for name in db_names}
+    return sorted(defined - covered - DB_SKIPPED)
+
+
+def run(config: SchoolConfig, only: str | None, repeat: int) -> dict:
+    school = School(config)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, 'bench.db')
+        db.init_db()
+        conn = db.open_thread_connection()
+        populate(conn, school)
+
+        all_cases = cases(school)
+        for name in check_coverage(n for n in all_cases if n.startswith('db.')):
+            print(f"! db.{name} не замеряется (добавьте случай в db_cases или в DB_SKIPPED)")
+        for name, func in all_cases.items():
+            if only and only not in name:
+                continue
+            results[name] = measure(func, repeat)
+            print(f"{name:45} {format_time(results[name]['best']):>10}")
+        conn.close()
+        db._local.conn = None
+    return results
+
+
+def format_time(seconds: float) -> str:
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:.1f} µs"
+    if seconds < 1:
+        return f"{seconds * 1e3:.2f} ms"
+    return f"{seconds:.2f} s"
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> int:
+    """Печатает сравнение с baseline и возвращает число регрессий"""
+    if baseline['meta'].get('school') != results['meta']['school']:
+        print("! Параметры синтетической школы отличаются от baseline, сравнение неточное")
+    regressions = 0
+    print(f"\n{'случай':45} {'baseline':>10} {'сейчас':>10} {'изм.':>8}")
+    for name, current in results['results'].items():
+        old = baseline['results'].get(name)
+        if old is None:
+            print(f"{name:45} {'—':>10} {format_time(current['best']):>10}     новый")
+            continue
+        ratio = current['best'] / old['best']
+        mark = ''
+        if ratio > 1 + threshold:
+            mark = '  РЕГРЕССИЯ'
+            regressions += 1
+        elif ratio < 1 - threshold:
+            mark = '  быстрее'
+        print(f"{name:45} {format_time(old['best']):>10} {format_time(current['best']):>10} {ratio - 1:>+7.0%}{mark}")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Микробенчмарки бота расписания")
+    parser.add_argument('--scale', choices=SCALES, default='medium', help="готовый размер школы")
+    parser.add_argument('--grades', help="параллели, например 5-11")
+    parser.add_argument('--letters', type=int, help="классов в параллели")
+    parser.add_argument('--users', type=int)
+    parser.add_argument('--replacements', type=int)
+    parser.add_argument('--filter', help="замерять только случаи, содержащие эту подстроку")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--save', help="сохранить результаты как baseline (JSON)")
+    parser.add_argument('--compare', help="сравнить с baseline (JSON)")
+    parser.add_argument('--threshold', type=float, default=0.15, help="допустимое замедление (доля)")
+    args = parser.parse_args()
+
+    # Разбор и запросы подробно логируют каждый вызов
+    logging.disable(logging.INFO)
+
+    config = SCALES[args.scale]
+    overrides = {}
+    if args.grades:
+        first, _, last = args.grades.partition('-')
+        overrides['grades'] = tuple(range(int(first), int(last or first) + 1))
+    for field in ('letters', 'users', 'replacements'):
+        if getattr(args, field) is not None:
+            overrides[field] = getattr(args, field)
+    config = SchoolConfig(**{**config.as_dict(), **overrides})
+
+    results = {
+        'meta': {
+            'created': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'school': config.as_dict(),
+        },
+        'results': run(config, args.filter, args.repeat),
+    }
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\nBaseline сохранён в {args.save}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\nРегрессий: {regressions}")
+            return 1
+        print("\nРегрессий нет")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+Синтетическая школа для бенчмарков: CSV расписания в формате школьных таблиц,
+таблица замен, пользователи и отметки об уведомлениях.
+Генерация детерминирована (seed), кроме дат замен — они отсчитываются от сегодня.
+"""
+
+import datetime
+import random
+from dataclasses import dataclass
+
+from bot.config import DAYS
+
+LETTERS = 'аеиюэстяб'
+SUBJECTS = [
+    'Математика', 'Алгебра', 'Геометрия', 'Русский язык', 'Литература', 'Английский язык',
+    'История', 'Обществознание', 'Физика', 'Химия', 'Биология', 'География',
+    'Информатика', 'Физическая культура', 'ОБЗР', 'Музыка', 'Технология', 'Вероятность и статистика',
+]
+PROFILES = ['техн', 'универс', 'соц', 'ест', 'гум']
+TEACHERS = ['Иванова Н.П.', 'Петров А.С.', 'Смирнова О.В.', 'Кузнецов И.И.', 'вакансия']
+
+
+@dataclass
+class SchoolConfig:
+    grades: tuple = tuple(range(5, 12))
+    letters: int = 4
+    # Профили есть у классов с этой параллели и старше
+    profile_from: int = 10
+    lessons_per_day: int = 7
+    users: int = 2000
+    replacements: int = 300
+    replacement_days: int = 14
+    seed: int = 44
+
+    def as_dict(self) -> dict:
+        return {
+            'grades': list(self.grades),
+            'letters': self.letters,
+            'profile_from': self.profile_from,
+            'lessons_per_day': self.lessons_per_day,
+            'users': self.users,
+            'replacements': self.replacements,
+            'replacement_days': self.replacement_days,
+            'seed': self.seed,
+        }
+
+
+SCALES = {
+    'small': SchoolConfig(grades=(5, 10), letters=2, users=200, replacements=40),
+    'medium': SchoolConfig(),
+    'large': SchoolConfig(letters=8, users=20000, replacements=3000),
+}
+
+
+class School:
+    def __init__(self, config: SchoolConfig):
+        self.config = config
+        rnd = random.Random(config.seed)
+        self.classes = []  # [(class_name, profile)]
+        for grade in config.grades:
+            for letter in LETTERS[:config.letters]:
+                profile = rnd.choice(PROFILES) if grade >= config.profile_from else None
+                self.classes.append((f"{grade}{letter}", profile))
+
+        self.timetable = {}  # (class_name, profile) -> {день: [(урок, предмет, кабинет)]}
+        for cls in self.classes:
+            self.timetable[cls] = {
+                day: [(n, rnd.choice(SUBJECTS), str(rnd.randint(101, 420)))
+                      for n in range(1, config.lessons_per_day + 1)]
+                for day in DAYS
+            }
+
+        self.users = [(10_000 + i, *rnd.choice(self.classes), rnd.random() < 0.8) for i in range(config.users)]
+
+        # Замены начинаются с сегодняшнего дня: прошедшие даты разбор таблицы замен отбрасывает
+        start = datetime.date.today()
+        self.replacements = {}
+        while len(self.replacements) < config.replacements:
+            date = start + datetime.timedelta(days=rnd.randrange(config.replacement_days))
+            if date.weekday() >= 5:
+                continue
+            class_name, _profile = rnd.choice(self.classes)
+            lesson = rnd.randint(1, config.lessons_per_day)
+            teacher = rnd.choice(TEACHERS)
+            room = rnd.choice([str(rnd.randint(101, 420)), 'каб'])
+            self.replacements[(date, class_name, lesson)] = (rnd.choice(SUBJECTS), teacher, room)
+        self.today = start
+
+    def schedule_rows(self, grade: int) -> list[list[str]]:
+        """Строки CSV одной параллели, как в выгрузке школьной таблицы"""
+        classes = [cls for cls in self.classes if cls[0].startswith(str(grade)) and cls[0][len(str(grade))].isalpha()]
+        header = ['', '']
+        for class_name, profile in classes:
+            header += [f"{class_name} ({profile})" if profile else class_name, 'каб']
+        rows = [
+            ['', '', '', '', '', 'УТВЕРЖДАЮ'],
+            [f"Расписание учебных занятий для {grade} классов"],
+            header,
+        ]
+        for day in DAYS:
+            rows.append([day])
+            for n in range(1, self.config.lessons_per_day + 1):
+                row = ['', str(n)]
+                for cls in classes:
+                    _num, subject, room = self.timetable[cls][day][n - 1]
+                    row += [subject, room]
+                rows.append(row + [str(n)])
+            rows.append([''] * len(header))
+        return rows
+
+    def replacement_rows(self) -> list[list[str]]:
+        """Строки CSV таблицы замен (с заголовком)"""
+        rows = [['Замена уроков'], ['дата', 'урок', 'Класс', 'Предмет', 'Заменяющий учитель', 'Кабинет']]
+        for (date, class_name, lesson), (subject, teacher, room) in sorted(self.replacements.items()):
+            rows.append([date.strftime('%d.%m.%Y'), str(lesson), class_name, subject, teacher, room])
+        return rows
+
+    def schedule_records(self) -> list[tuple]:
+        """Записи для таблицы schedule: (class_name, profile, day, lesson_number, subject, room, source)"""
+        return [
+            (class_name, profile, day, n, subject, room, f"schedule_{class_name[:-1]}")
+            for (class_name, profile), days in self.timetable.items()
+            for day, lessons in days.items()
+            for n, subject, room in lessons
+        ]
+
+    def replacement_records(self) -> list[tuple]:
+        """Записи для таблицы replacements: (date, lesson_number, class_name, subject, teacher, room)"""
+        return [
+            (date.isoformat(), lesson, class_name, subject, None if teacher == 'вакансия' else teacher,
+             None if room == 'каб' else room)
+            for (date, class_name, lesson), (subject, teacher, room) in self.replacements.items()
+        ]
+
+
+def populate(conn, school: School):
+    """Заполняет пустую БД (после init_db) данными школы"""
+    cur = conn.cursor()
+    cur.executemany(
+        'INSERT INTO schedule (class_name, profile, day, lesson_number, subject, room, source) VALUES (?, ?, ?, ?, ?, ?, ?)',
+        school.schedule_records()
+    )
+    cur.executemany(
+        'INSERT INTO replacements (date, lesson_number, class_name, subject, teacher, room) VALUES (?, ?, ?, ?, ?, ?)',
+        school.replacement_records()
+    )
+    cur.executemany(
+        'INSERT INTO users (user_id, class_name, profile, notify) VALUES (?, ?, ?, ?)',
+        school.users
+    )
+    notified = [user_id for user_id, _c, _p, notify in school.users if notify]
+    cur.executemany(
+        'INSERT INTO sent_notifications (user_id, date, lesson_number) VALUES (?, ?, ?)',
+        [(user_id, (school.today - datetime.timedelta(days=d)).isoformat(), n)
+         for d in range(3) for n in (1, 2) for user_id in notified]
+    )
+    cur.executemany(
+        'INSERT INTO last_notification (user_id, message_id) VALUES (?, ?)',
+        [(user_id, 1) for user_id in notified]
+    )
+    conn.commit()
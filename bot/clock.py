@@ -0,0 +1,107 @@
+"""
+Школьные часы: текущие дата, день недели и урок по московскому времени (TIMEZONE),
+а не по часам сервера. Текущий и следующий урок находятся бинарным поиском по таблице
+границ уроков; результат держится до ближайшей границы (начала или конца урока, полуночи).
+"""
+import bisect
+import datetime
+from zoneinfo import ZoneInfo
+
+from bot.config import TIMEZONE, LESSON_TIMES, WEEKDAY_MAP
+
+tz = ZoneInfo(TIMEZONE)
+
+
+def _seconds(t: datetime.time) -> int:
+    return t.hour * 3600 + t.minute * 60 + t.second
+
+
+# Границы уроков в секундах от полуночи: начало 1-го, конец 1-го, начало 2-го, ...
+# Нечётный номер промежутка (bisect_right) — идёт урок, чётный — перемена или вне уроков
+BOUNDARIES = tuple(s for start, end in LESSON_TIMES for s in (_seconds(start), _seconds(end)))
+
+
+class SchoolTime:
+    """Состояние часов между двумя соседними границами"""
+    __slots__ = ('date', 'date_str', 'weekday', 'day_name', 'current', 'next', 'valid_from', 'valid_until')
+
+    def __init__(self, date: datetime.date, current: int | None, next_: int | None,
+                 valid_from: datetime.datetime, valid_until: datetime.datetime):
+        self.date = date
+        self.date_str = date.isoformat()
+        self.weekday = date.weekday()
+        self.day_name = WEEKDAY_MAP[self.weekday]
+        self.current = current      # номер идущего урока или None
+        self.next = next_           # номер следующего урока сегодня или None
+        self.valid_from = valid_from
+        self.valid_until = valid_until
+
+    @property
+    def is_school_day(self) -> bool:
+        return self.weekday < 5
+
+
+def now() -> datetime.datetime:
+    return datetime.datetime.now(tz)
+
+
+def _compute(at: datetime.datetime) -> SchoolTime:
+    date = at.date()
+    midnight = datetime.datetime.combine(date, datetime.time(), tzinfo=tz)
+    seconds = (at - midnight).total_seconds()
+    index = bisect.bisect_right(BOUNDARIES, seconds)
+    lesson = index // 2 + 1
+    if index % 2:
+        current, next_ = lesson, (lesson + 1 if lesson < len(LESSON_TIMES) else None)
+    else:
+        current, next_ = None, (lesson if lesson <= len(LESSON_TIMES) else None)
+    valid_from = midnight + datetime.timedelta(seconds=BOUNDARIES[index - 1]) if index else midnight
+    if index < len(BOUNDARIES):
+        valid_until = midnight + datetime.timedelta(seconds=BOUNDARIES[index])
+    else:
+        valid_until = datetime.datetime.combine(date + datetime.timedelta(days=1), datetime.time(), tzinfo=tz)
+    return SchoolTime(date, current, next_, valid_from, valid_until)
+
+
+_state: SchoolTime | None = None
+
+
+def state(at: datetime.datetime | None = None) -> SchoolTime:
+    """
+    Состояние часов на момент at (по умолчанию сейчас). Текущее состояние кешируется
+    и пересчитывается только после границы; явный at кеш не трогает.
+    """
+    global _state
+    if at is not None:
+        # Дата и урок — по школьному времени, в каком бы поясе ни был at
+        return _compute(at.astimezone(tz))
+    at = now()
+    cached = _state
+    if cached is not None and cached.valid_from <= at < cached.valid_until:
+        return cached
+    _state = _compute(at)
+    return _state
+
+
+def today() -> datetime.date:
+    return state().date
+
+
+def lesson_start(date: datetime.date, lesson_number: int) -> datetime.datetime:
+    return datetime.datetime.combine(date, LESSON_TIMES[lesson_number - 1][0], tzinfo=tz)
+
+
+def lesson_end(date: datetime.date, lesson_number: int) -> datetime.datetime:
+    return datetime.datetime.combine(date, LESSON_TIMES[lesson_number - 1][1], tzinfo=tz)
+
+
+def lesson_progress(lesson_number: int, at: datetime.datetime) -> tuple[int, int]:
+    """(процент прошедшего времени урока, сколько минут осталось)"""
+    at = at.astimezone(tz)
+    start = lesson_start(at.date(), lesson_number)
+    end = lesson_end(at.date(), lesson_number)
+    total = (end - start).total_seconds()
+    elapsed = (at - start).total_seconds()
+    progress = min(100, int(elapsed / total * 100)) if total > 0 else 0
+    remaining_min = max(0, int((end - at).total_seconds() // 60))
+    return progress, remaining_min
@@ -7,6 +7,92 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DB_PATH = os.path.join(BASE_DIR, "schedule.db")
 DATA_DIR = os.path.join(BASE_DIR, "data")
 
+# Пул соединений с БД: число потоков-читателей (писатель всегда один)
+DB_POOL_READERS = 4
+# Запросы дольше этого порога пишутся в лог как медленные (мс)
+DB_SLOW_QUERY_MS = 100
+
+# Обработка обновления дольше этого порога пишется в лог вместе с разбивкой по БД и Bot API (мс)
+SLOW_TRACE_MS = 500
+# Токен для отладочных HTTP-эндпоинтов (/debug/profile); без него они отключены
+DEBUG_TOKEN = os.environ.get("DEBUG_TOKEN")
+# Профилирование по запросу: максимальная длительность (с) и период снятия стеков (с)
+PROFILE_MAX_SECONDS = 60
+PROFILE_INTERVAL = 0.005
+
+# --- Получение обновлений ---
+# "polling" — бот сам опрашивает getUpdates; "webhook" — Telegram присылает обновления на наш HTTP-сервер
+UPDATES_MODE = os.environ.get("UPDATES_MODE", "polling")
+# Публичный адрес HTTP-сервера для webhook (Render задаёт RENDER_EXTERNAL_URL сам)
+WEBHOOK_BASE_URL = os.environ.get("WEBHOOK_BASE_URL") or os.environ.get("RENDER_EXTERNAL_URL")
+WEBHOOK_PATH = "/telegram/webhook"
+# Секрет, который Telegram присылает в заголовке X-Telegram-Bot-Api-Secret-Token;
+# если не задан, при каждом запуске генерируется новый (подходит для одного экземпляра)
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET")
+# Не больше стольких обновлений обрабатывается одновременно (число обработчиков очереди)
+WEBHOOK_MAX_IN_FLIGHT = 200
+# Принятые, но ещё не взятые в обработку обновления; при переполнении новые отбрасываются
+# (Telegram получает 200 сразу, а нажатие, прождавшее в очереди дольше, всё равно устарело бы)
+WEBHOOK_QUEUE_SIZE = 1000
+# Одновременных соединений от Telegram к webhook (1-100)
+WEBHOOK_MAX_CONNECTIONS = 40
+
+# --- Исходящие сообщения (лимиты Telegram) ---
+# Не больше стольких сообщений в секунду на бота
+OUTBOUND_GLOBAL_RATE = 30
+# Не чаще одного сообщения в один чат за столько секунд
+OUTBOUND_CHAT_INTERVAL = 1.0
+# Доля лимита, которую уведомления и рассылки не занимают, пока пользователи нажимают
+# кнопки: она остаётся ответам на нажатия, даже посреди волны уведомлений
+OUTBOUND_INTERACTIVE_RESERVE = 0.3
+# Воркеров очереди и повторов после ответа 429 (Retry-After)
+OUTBOUND_WORKERS = 16
+OUTBOUND_MAX_RETRIES = 3
+
+# Как часто бот сверяет версии расписания и замен в БД с тем, что держит в памяти (с):
+# так подхватываются данные, загруженные scripts/update_*.py в отдельном процессе
+DATA_CHECK_INTERVAL = 15
+
+# --- Процессы-уведомители ---
+# 0 — уведомления рассылает сам бот. N > 0 — подписчики делятся на N долей по user_id,
+# рассылают отдельные процессы (scripts/notifier_workers.py), доли распределяются через БД
+NOTIFIER_SHARDS = int(os.environ.get("NOTIFIER_SHARDS", 0))
+# Аренда доли без пульса истекает через столько секунд, и долю забирает другой процесс
+NOTIFIER_LEASE_SECONDS = 30
+# Лимит OUTBOUND_GLOBAL_RATE — на токен бота, а не на процесс, поэтому при NOTIFIER_SHARDS > 0
+# он делится: NOTIFIER_GLOBAL_RATE получают процессы-уведомители (поровну между собой),
+# остаток BOT_GLOBAL_RATE — сам бот на ответы пользователям и рассылку замен
+NOTIFIER_GLOBAL_RATE = OUTBOUND_GLOBAL_RATE * 2 / 3 if NOTIFIER_SHARDS else 0
+BOT_GLOBAL_RATE = OUTBOUND_GLOBAL_RATE - NOTIFIER_GLOBAL_RATE
+
+# Сколько дней хранить построчные отметки об отправленных уведомлениях
+# (более старые сворачиваются в дневные счётчики)
+NOTIFICATION_RETENTION_DAYS = 14
+
+# Строк замен на одной странице — отдельно для своего класса и для остальных
+REPLACEMENTS_PAGE_SIZE = 15
+
+# Лимит Telegram на длину текста сообщения (в UTF-16 символах)
+MAX_MESSAGE_LENGTH = 4096
+# Длиннее этого предмет, учитель и кабинет в строке замены обрезаются:
+# иначе одна кривая ячейка таблицы не даёт странице уложиться в лимит
+REPLACEMENT_FIELD_LIMIT = 48
+
+# Сколько готовых текстов экранов (неделя, сегодня, замены) держать в кэше
+RENDER_CACHE_SIZE = 512
+
+# После каждого обновления замен присылать подписчикам затронутых классов, что у них изменилось
+PUSH_REPLACEMENTS = True
+
+# Состояния диалогов (выбор класса): сколько держать в памяти, через сколько секунд
+# брошенный выбор забывается и как часто изменения пишутся в БД
+FSM_CACHE_SIZE = 10000
+FSM_TTL = 24 * 3600
+FSM_FLUSH_INTERVAL = 2.0
+
+# Потоков для задач обновления расписания и замен (выполняются вне event loop)
+INGEST_WORKERS = 2
+
 DAYS = ["понедельник", "вторник", "среда", "четверг", "пятница"]
 WEEKDAY_MAP = {
     0: "понедельник",
@@ -44,4 +130,12 @@ SCHEDULE_URLS = {
     "9": "https://docs.google.com/spreadsheets/d/1u117ewxXm5KavaFK2y2UFSOV8Qn5AejrXzNeUG3aIOs/export?format=csv&gid=1531352472",
     "10": "https://docs.google.com/spreadsheets/d/1u117ewxXm5KavaFK2y2UFSOV8Qn5AejrXzNeUG3aIOs/export?format=csv&gid=689182908",
     "11": "https://docs.google.com/spreadsheets/d/1u117ewxXm5KavaFK2y2UFSOV8Qn5AejrXzNeUG3aIOs/export?format=csv&gid=932298242",
-}
\ No newline at end of file
+}
+
+# --- Скачивание таблиц ---
+# Одновременных соединений при скачивании всех таблиц
+FETCH_CONCURRENCY = 4
+# Попыток на один источник и базовая пауза между ними (удваивается), секунды
+FETCH_RETRIES = 3
+FETCH_BACKOFF = 1.0
+FETCH_TIMEOUT = 30
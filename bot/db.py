@@ -1,15 +1,55 @@
 import sqlite3
-import re
 import datetime
 import logging
+import threading
 from typing import List, Tuple, Optional
 from .config import DB_PATH
+from . import clock
 
 logger = logging.getLogger(__name__)
 
+# Вторичные индексы под запросы этого модуля (имя -> таблица и колонки).
+# init_db создаёт недостающие и удаляет idx_* не из этого списка;
+# scripts/check_query_plans.py проверяет, что ни один запрос не читает таблицу целиком.
+INDEXES = {
+    # get_all_users_with_notify
+    'idx_users_notify': 'users (notify)',
+    # get_subscribers_by_classes
+    'idx_users_class_notify': 'users (class_name, notify)',
+    # get_notified_user_ids, compact_sent_notifications
+    'idx_sent_notifications_date_lesson': 'sent_notifications (date, lesson_number)',
+    # swap_schedule_from_staging
+    'idx_schedule_source': 'schedule (source)',
+    # get_class_replacements_page (остальные классы идут по UNIQUE(date, class_name, lesson_number))
+    'idx_replacements_class_date': 'replacements (class_name, date, lesson_number)',
+    # apply_replacements_diff (удаление записей журнала за прошедшие дни)
+    'idx_replacement_changes_date': 'replacement_changes (date)',
+    # delete_expired_fsm
+    'idx_fsm_state_updated': 'fsm_state (updated_at)',
+}
+
+# Долгоживущие соединения потоков пула (см. bot/db_pool.py)
+_local = threading.local()
+
 def get_connection():
+    """
+    Возвращает соединение текущего потока пула, если оно открыто,
+    иначе — новое соединение (скрипты, запуск из командной строки).
+    """
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        return conn
     return sqlite3.connect(DB_PATH)
 
+def open_thread_connection() -> sqlite3.Connection:
+    """Открывает соединение, которое живёт вместе с потоком пула"""
+    conn = sqlite3.connect(DB_PATH, timeout=30, check_same_thread=False)
+    # WAL: читатели не ждут писателя (и скриптов обновления), запись не ждёт читателей
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    _local.conn = conn
+    return conn
+
 def init_db():
     with get_connection() as conn:
         cur = conn.cursor()
@@ -31,18 +71,44 @@ def init_db():
                 lesson_number INTEGER NOT NULL,
                 subject TEXT NOT NULL,
                 room TEXT NOT NULL,
+                source TEXT,
                 UNIQUE(class_name, profile, day, lesson_number)
             )
         ''')
+        # Старые базы: колонка source (из какой таблицы-источника пришла строка) добавлена позже
+        cur.execute('PRAGMA table_info(schedule)')
+        if 'source' not in [row[1] for row in cur.fetchall()]:
+            cur.execute('ALTER TABLE schedule ADD COLUMN source TEXT')
         cur.execute('''
             CREATE TABLE IF NOT EXISTS sent_notifications (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 user_id INTEGER,
                 date TEXT,
                 lesson_number INTEGER,
+                delivered INTEGER NOT NULL DEFAULT 1,
+                claimed_by TEXT,
+                claimed_at REAL,
                 UNIQUE(user_id, date, lesson_number)
             )
         ''')
+        # Старые базы: отметки занятия получателей (claim_notifications) добавлены позже;
+        # все прежние строки — уже отправленные уведомления
+        cur.execute('PRAGMA table_info(sent_notifications)')
+        columns = [row[1] for row in cur.fetchall()]
+        if 'delivered' not in columns:
+            cur.execute('ALTER TABLE sent_notifications ADD COLUMN delivered INTEGER NOT NULL DEFAULT 1')
+        if 'claimed_by' not in columns:
+            cur.execute('ALTER TABLE sent_notifications ADD COLUMN claimed_by TEXT')
+            cur.execute('ALTER TABLE sent_notifications ADD COLUMN claimed_at REAL')
+        # Сжатая история: сколько уведомлений отправлено за день по каждому уроку
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS notification_daily_stats (
+                date TEXT NOT NULL,
+                lesson_number INTEGER NOT NULL,
+                sent_count INTEGER NOT NULL,
+                PRIMARY KEY (date, lesson_number)
+            )
+        ''')
         cur.execute('''
             CREATE TABLE IF NOT EXISTS replacements (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -55,6 +121,35 @@ def init_db():
                 UNIQUE(date, class_name, lesson_number)
             )
         ''')
+        # Журнал изменений замен: каждая применённая правка получает возрастающий seq
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS replacement_changes (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                op TEXT NOT NULL,
+                date TEXT NOT NULL,
+                lesson_number INTEGER NOT NULL,
+                class_name TEXT NOT NULL,
+                subject TEXT,
+                teacher TEXT,
+                room TEXT,
+                created_at TEXT NOT NULL
+            )
+        ''')
+        # Докуда (seq) потребители журналов изменений уже обработали записи
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS change_cursors (
+                name TEXT PRIMARY KEY,
+                seq INTEGER NOT NULL
+            )
+        ''')
+        # Версии данных, которые другие процессы держат в памяти: каждая запись в таблицу
+        # увеличивает версию в той же транзакции (см. _bump_data_version)
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS data_versions (
+                name TEXT PRIMARY KEY,
+                version INTEGER NOT NULL
+            )
+        ''')
         # Новая таблица для хранения последнего отправленного уведомления
         cur.execute('''
             CREATE TABLE IF NOT EXISTS last_notification (
@@ -62,9 +157,73 @@ def init_db():
                 message_id INTEGER NOT NULL
             )
         ''')
+        # Валидаторы скачанных таблиц (ETag / Last-Modified / хэш содержимого)
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS source_cache (
+                source TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                content_hash TEXT,
+                updated_at TEXT
+            )
+        ''')
+        # Состояния диалогов (FSM) — см. bot/fsm_storage.py; data хранится в JSON
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS fsm_state (
+                key TEXT PRIMARY KEY,
+                state TEXT,
+                data TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        ''')
+        # Процессы-уведомители (см. bot/notifier_shards.py): кто жив и какие доли пользователей
+        # за кем закреплены; строки с истёкшим expires_at может забрать другой процесс
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS notifier_workers (
+                owner TEXT PRIMARY KEY,
+                expires_at REAL NOT NULL
+            )
+        ''')
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS notifier_leases (
+                shard INTEGER PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        ''')
+        sync_indexes(cur)
         conn.commit()
     logger.info("База данных инициализирована")
 
+def sync_indexes(cur):
+    """Приводит набор индексов idx_* в соответствие с INDEXES"""
+    cur.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'idx\\_%' ESCAPE '\\'")
+    existing = {row[0] for row in cur.fetchall()}
+    for name in existing - INDEXES.keys():
+        cur.execute(f'DROP INDEX {name}')
+        logger.info(f"Удалён устаревший индекс {name}")
+    for name, spec in INDEXES.items():
+        if name not in existing:
+            cur.execute(f'CREATE INDEX {name} ON {spec}')
+            logger.info(f"Создан индекс {name} ON {spec}")
+
+# ========== ВЕРСИИ ДАННЫХ ==========
+
+def _bump_data_version(cur, name: str):
+    cur.execute('''
+        INSERT INTO data_versions (name, version) VALUES (?, 1)
+        ON CONFLICT(name) DO UPDATE SET version = version + 1
+    ''', (name,))
+
+def get_data_version(name: str) -> int:
+    """Версия данных name (0, если их ещё не записывали); меняется при каждой записи"""
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute('SELECT version FROM data_versions WHERE name = ?', (name,))
+        row = cur.fetchone()
+        return row[0] if row else 0
+
 # ========== РАСПИСАНИЕ ==========
 
 def add_schedule(class_name: str, profile: Optional[str], day: str, lesson_number: int, subject: str, room: str):
@@ -74,6 +233,7 @@ def add_schedule(class_name: str, profile: Optional[str], day: str, lesson_numbe
             INSERT OR REPLACE INTO schedule (class_name, profile, day, lesson_number, subject, room)
             VALUES (?, ?, ?, ?, ?, ?)
         ''', (class_name, profile, day, lesson_number, subject, room))
+        _bump_data_version(cur, 'schedule')
         conn.commit()
     logger.debug(f"Добавлено расписание: {class_name} {profile} {day} {lesson_number} {subject} {room}")
 
@@ -81,38 +241,65 @@ def clear_schedule():
     with get_connection() as conn:
         cur = conn.cursor()
         cur.execute('DELETE FROM schedule')
+        _bump_data_version(cur, 'schedule')
         conn.commit()
     logger.info("Таблица schedule очищена")
 
-def get_classes_with_profiles() -> List[Tuple[str, Optional[str]]]:
+def load_schedule_staging(rows: List[Tuple[str, Optional[str], str, int, str, str, str]]) -> int:
+    """
+    Загружает разобранное расписание одной пачкой в промежуточную таблицу schedule_staging.
+    Строка: (class_name, profile, day, lesson_number, subject, room, source).
+    Живая таблица schedule при этом не трогается.
+    """
     with get_connection() as conn:
         cur = conn.cursor()
-        cur.execute('SELECT DISTINCT class_name, profile FROM schedule ORDER BY class_name, profile')
-        return cur.fetchall()
-
-def get_parallels() -> List[str]:
-    with get_connection() as conn:
-        cur = conn.cursor()
-        cur.execute('SELECT DISTINCT class_name FROM schedule')
-        rows = cur.fetchall()
-    parallels = set()
-    for (class_name,) in rows:
-        m = re.match(r'^(\d+)', class_name)
-        if m:
-            parallels.add(m.group(1))
-    return sorted(parallels, key=lambda x: int(x))
+        cur.execute('DROP TABLE IF EXISTS schedule_staging')
+        cur.execute('''
+            CREATE TABLE schedule_staging (
+                class_name TEXT NOT NULL,
+                profile TEXT,
+                day TEXT NOT NULL,
+                lesson_number INTEGER NOT NULL,
+                subject TEXT NOT NULL,
+                room TEXT NOT NULL,
+                source TEXT NOT NULL,
+                UNIQUE(class_name, profile, day, lesson_number)
+            )
+        ''')
+        cur.executemany('''
+            INSERT OR REPLACE INTO schedule_staging (class_name, profile, day, lesson_number, subject, room, source)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+        conn.commit()
+        cur.execute('SELECT COUNT(*) FROM schedule_staging')
+        count = cur.fetchone()[0]
+    logger.info(f"В schedule_staging загружено записей: {count}")
+    return count
 
-def get_letters_by_parallel(parallel: str) -> List[str]:
+def swap_schedule_from_staging(sources: List[str]):
+    """
+    В одной транзакции заменяет в schedule строки указанных источников данными из schedule_staging.
+    Строки остальных источников (не изменившихся или не скачавшихся) остаются как есть.
+    """
+    placeholders = ','.join('?' * len(sources))
     with get_connection() as conn:
         cur = conn.cursor()
-        cur.execute('SELECT DISTINCT class_name FROM schedule WHERE class_name LIKE ?', (parallel + '%',))
-        rows = cur.fetchall()
-    letters = []
-    for (class_name,) in rows:
-        m = re.match(r'^\d+([а-яА-Я]+)', class_name)
-        if m:
-            letters.append(m.group(1))
-    return sorted(letters)
+        cur.execute('BEGIN IMMEDIATE')
+        # Вместе с источником удаляем и строки его классов без источника (записанные до миграции)
+        cur.execute(f'''
+            DELETE FROM schedule
+            WHERE source IN ({placeholders})
+               OR class_name IN (SELECT class_name FROM schedule_staging)
+        ''', sources)
+        cur.execute('''
+            INSERT OR REPLACE INTO schedule (class_name, profile, day, lesson_number, subject, room, source)
+            SELECT class_name, profile, day, lesson_number, subject, room, source FROM schedule_staging
+        ''')
+        cur.execute('DROP TABLE schedule_staging')
+        # Боты, запущенные отдельно от скрипта обновления, увидят новую версию и перечитают снимок
+        _bump_data_version(cur, 'schedule')
+        conn.commit()
+    logger.info(f"В schedule заменены строки источников: {', '.join(sources)}")
 
 def get_schedule(class_name: str, profile: Optional[str], day: Optional[str] = None) -> List[Tuple]:
     with get_connection() as conn:
@@ -131,6 +318,33 @@ def get_schedule(class_name: str, profile: Optional[str], day: Optional[str] = N
             ''', (class_name, profile))
         return cur.fetchall()
 
+def get_all_schedule() -> List[Tuple[str, Optional[str], str, int, str, str]]:
+    """Всё расписание целиком — для построения снимка в bot/timetable.py"""
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute('SELECT class_name, profile, day, lesson_number, subject, room FROM schedule')
+        return cur.fetchall()
+
+# ========== ИСТОЧНИКИ ДАННЫХ ==========
+
+def get_source_cache() -> dict[str, Tuple[str, Optional[str], Optional[str], Optional[str]]]:
+    """{source: (url, etag, last_modified, content_hash)} для условных запросов"""
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute('SELECT source, url, etag, last_modified, content_hash FROM source_cache')
+        return {row[0]: row[1:] for row in cur.fetchall()}
+
+def set_source_cache(entries: List[Tuple[str, str, Optional[str], Optional[str], str]]):
+    """Сохраняет валидаторы (source, url, etag, last_modified, content_hash) после успешной записи данных"""
+    now = datetime.datetime.now().isoformat(timespec='seconds')
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.executemany('''
+            INSERT OR REPLACE INTO source_cache (source, url, etag, last_modified, content_hash, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', [entry + (now,) for entry in entries])
+        conn.commit()
+
 # ========== ПОЛЬЗОВАТЕЛИ ==========
 
 def set_user(user_id: int, class_name: str, profile: Optional[str]):
@@ -158,6 +372,19 @@ def get_all_users_with_notify() -> List[Tuple[int, str, Optional[str]]]:
         cur.execute('SELECT user_id, class_name, profile FROM users WHERE notify = 1')
         return cur.fetchall()
 
+def get_subscribers_by_classes(class_names: List[str]) -> List[Tuple[int, str]]:
+    """Пользователи с включёнными уведомлениями из указанных классов: (user_id, class_name)"""
+    if not class_names:
+        return []
+    placeholders = ','.join('?' * len(class_names))
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(f'''
+            SELECT user_id, class_name FROM users
+            WHERE class_name IN ({placeholders}) AND notify = 1
+        ''', list(class_names))
+        return cur.fetchall()
+
 def set_notify(user_id: int, enabled: bool):
     with get_connection() as conn:
         cur = conn.cursor()
@@ -173,7 +400,7 @@ def get_notify_status(user_id: int) -> bool:
         return bool(row[0]) if row else False
 
 def mark_notification_sent(user_id: int, lesson_number: int):
-    date = datetime.date.today().isoformat()
+    date = clock.today().isoformat()
     with get_connection() as conn:
         cur = conn.cursor()
         cur.execute('''
@@ -184,7 +411,7 @@ def mark_notification_sent(user_id: int, lesson_number: int):
     logger.debug(f"Отметка отправки уведомления user={user_id} lesson={lesson_number}")
 
 def check_notification_sent(user_id: int, lesson_number: int) -> bool:
-    date = datetime.date.today().isoformat()
+    date = clock.today().isoformat()
     with get_connection() as conn:
         cur = conn.cursor()
         cur.execute('''
@@ -193,6 +420,106 @@ def check_notification_sent(user_id: int, lesson_number: int) -> bool:
         ''', (user_id, date, lesson_number))
         return cur.fetchone() is not None
 
+def get_notified_user_ids(date: str, lesson_number: int) -> set[int]:
+    """Пользователи, которым уже отправлено уведомление об уроке в этот день — одним запросом"""
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute('''
+            SELECT user_id FROM sent_notifications
+            WHERE date = ? AND lesson_number = ?
+        ''', (date, lesson_number))
+        return {row[0] for row in cur.fetchall()}
+
+def record_notifications(date: str, lesson_number: int, delivered: List[Tuple[int, int]]):
+    """
+    Итог волны рассылки одной транзакцией: отметки об отправке и message_id
+    последних уведомлений для всех доставленных (user_id, message_id).
+    """
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.executemany('''
+            INSERT INTO sent_notifications (user_id, date, lesson_number)
+            VALUES (?, ?, ?)
+            ON CONFLICT(user_id, date, lesson_number) DO UPDATE SET delivered = 1
+        ''', [(user_id, date, lesson_number) for user_id, _ in delivered])
+        cur.executemany('''
+            INSERT OR REPLACE INTO last_notification (user_id, message_id)
+            VALUES (?, ?)
+        ''', delivered)
+        conn.commit()
+    logger.debug(f"Записаны итоги рассылки {date} урок {lesson_number}: {len(delivered)} получателей")
+
+def claim_notifications(date: str, lesson_number: int, user_ids: List[int],
+                        owner: str, now: float, claim_timeout: float) -> List[int]:
+    """
+    Отмечает отправку уведомления до самой отправки (delivered = 0, кто и когда занял)
+    и возвращает тех, кого удалось занять. Не попадают те, кому уже отправлено, и те,
+    кого сейчас отправляет живой процесс. Неподтверждённую отметку процесса, которого нет
+    среди живых в notifier_workers (упал посреди волны), или отметку старше claim_timeout
+    считаем снятой и занимаем заново — иначе эти получатели остались бы без уведомления.
+    """
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute('BEGIN IMMEDIATE')
+        cur.execute('SELECT owner FROM notifier_workers WHERE expires_at >= ?', (now,))
+        # Уведомитель в процессе бота в notifier_workers не отмечается: свои отметки он видит сам
+        live = {row[0] for row in cur.fetchall()} | {owner}
+        cur.execute('''
+            SELECT user_id, delivered, claimed_by, claimed_at FROM sent_notifications
+            WHERE date = ? AND lesson_number = ?
+        ''', (date, lesson_number))
+        taken = set()
+        stale = set()
+        for user_id, delivered, claimed_by, claimed_at in cur.fetchall():
+            if delivered or (claimed_by in live and claimed_at >= now - claim_timeout):
+                taken.add(user_id)
+            else:
+                stale.add(user_id)
+        claimed = [user_id for user_id in user_ids if user_id not in taken]
+        stale = len(stale.intersection(claimed))
+        cur.executemany('''
+            INSERT INTO sent_notifications (user_id, date, lesson_number, delivered, claimed_by, claimed_at)
+            VALUES (?, ?, ?, 0, ?, ?)
+            ON CONFLICT(user_id, date, lesson_number) DO UPDATE
+            SET claimed_by = excluded.claimed_by, claimed_at = excluded.claimed_at
+        ''', [(user_id, date, lesson_number, owner, now) for user_id in claimed])
+        conn.commit()
+    if stale:
+        logger.warning(f"{date} урок {lesson_number}: {stale} брошенных отметок (процесс упал или не уложился в срок) заняты заново")
+    return claimed
+
+def release_notifications(date: str, lesson_number: int, user_ids: List[int], owner: str):
+    """Снимает отметки claim_notifications процесса owner с тех, кому отправить не удалось"""
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.executemany('''
+            DELETE FROM sent_notifications
+            WHERE user_id = ? AND date = ? AND lesson_number = ? AND delivered = 0 AND claimed_by = ?
+        ''', [(user_id, date, lesson_number, owner) for user_id in user_ids])
+        conn.commit()
+
+def compact_sent_notifications(before_date: str) -> int:
+    """
+    Сворачивает отметки об отправке раньше before_date в дневные счётчики
+    notification_daily_stats и удаляет сами отметки. Возвращает число удалённых строк.
+    Освободившиеся страницы SQLite переиспользует, поэтому файл БД перестаёт расти.
+    """
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute('BEGIN IMMEDIATE')
+        cur.execute('''
+            INSERT INTO notification_daily_stats (date, lesson_number, sent_count)
+            SELECT date, lesson_number, COUNT(*) FROM sent_notifications
+            WHERE date < ? AND delivered = 1
+            GROUP BY date, lesson_number
+            ON CONFLICT(date, lesson_number) DO UPDATE SET sent_count = sent_count + excluded.sent_count
+        ''', (before_date,))
+        cur.execute('DELETE FROM sent_notifications WHERE date < ?', (before_date,))
+        deleted = cur.rowcount
+        conn.commit()
+    logger.info(f"Отметки об уведомлениях до {before_date} свёрнуты в дневную статистику: удалено {deleted}")
+    return deleted
+
 # ========== ПОСЛЕДНЕЕ УВЕДОМЛЕНИЕ (для удаления) ==========
 
 def set_last_notification(user_id: int, message_id: int):
@@ -214,6 +541,13 @@ def get_last_notification(user_id: int) -> Optional[int]:
         row = cur.fetchone()
         return row[0] if row else None
 
+def get_last_notifications() -> dict[int, int]:
+    """{user_id: message_id} последних уведомлений всех пользователей — одним запросом"""
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute('SELECT user_id, message_id FROM last_notification')
+        return dict(cur.fetchall())
+
 def clear_last_notification(user_id: int):
     """Удаляет запись о последнем уведомлении (например, если сообщение было удалено вручную)"""
     with get_connection() as conn:
@@ -242,6 +576,93 @@ def clear_old_replacements(before_date: str):
         conn.commit()
     logger.info(f"Удалены замены до {before_date}")
 
+def apply_replacements_diff(rows: List[Tuple[str, int, str, str, Optional[str], Optional[str]]], from_date: str) -> dict:
+    """
+    Приводит замены начиная с from_date к rows = [(date, lesson_number, class_name, subject, teacher, room)].
+    В одной транзакции сравнивает с текущими строками по ключу (дата, класс, урок), применяет только
+    добавленные, изменённые и удалённые замены и дописывает их в журнал replacement_changes.
+    Замены и записи журнала за дни раньше from_date удаляются без записи в журнал.
+    Возвращает {'added', 'changed', 'removed', 'seq'} — seq последней записи журнала.
+    """
+    new = {(date, class_name, lesson): (subject, teacher, room)
+           for date, lesson, class_name, subject, teacher, room in rows if date >= from_date}
+    now = datetime.datetime.now().isoformat(timespec='seconds')
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute('BEGIN IMMEDIATE')
+        cur.execute('DELETE FROM replacements WHERE date < ?', (from_date,))
+        cur.execute('DELETE FROM replacement_changes WHERE date < ?', (from_date,))
+        cur.execute('''
+            SELECT date, class_name, lesson_number, subject, teacher, room
+            FROM replacements
+            WHERE date >= ?
+        ''', (from_date,))
+        current = {(date, class_name, lesson): (subject, teacher, room)
+                   for date, class_name, lesson, subject, teacher, room in cur.fetchall()}
+
+        added = [key + value for key, value in new.items() if key not in current]
+        changed = [key + value for key, value in new.items() if key in current and current[key] != value]
+        removed = [key + value for key, value in current.items() if key not in new]
+
+        if removed:
+            cur.executemany(
+                'DELETE FROM replacements WHERE date = ? AND class_name = ? AND lesson_number = ?',
+                [row[:3] for row in removed]
+            )
+        if changed:
+            cur.executemany('''
+                UPDATE replacements SET subject = ?, teacher = ?, room = ?
+                WHERE date = ? AND class_name = ? AND lesson_number = ?
+            ''', [row[3:] + row[:3] for row in changed])
+        if added:
+            cur.executemany('''
+                INSERT INTO replacements (date, class_name, lesson_number, subject, teacher, room)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', added)
+        cur.executemany('''
+            INSERT INTO replacement_changes (op, date, class_name, lesson_number, subject, teacher, room, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [(op,) + row + (now,) for op, group in (('removed', removed), ('changed', changed), ('added', added))
+              for row in group])
+        cur.execute('SELECT MAX(seq) FROM replacement_changes')
+        seq = cur.fetchone()[0] or 0
+        conn.commit()
+    logger.info(f"Замены обновлены: добавлено {len(added)}, изменено {len(changed)}, удалено {len(removed)} (seq {seq})")
+    return {'added': len(added), 'changed': len(changed), 'removed': len(removed), 'seq': seq}
+
+def get_replacement_changes(after_seq: int, limit: int = 1000) -> List[Tuple[int, str, str, int, str, Optional[str], Optional[str], Optional[str]]]:
+    """Записи журнала после after_seq: (seq, op, date, lesson_number, class_name, subject, teacher, room)"""
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute('''
+            SELECT seq, op, date, lesson_number, class_name, subject, teacher, room
+            FROM replacement_changes
+            WHERE seq > ?
+            ORDER BY seq
+            LIMIT ?
+        ''', (after_seq, limit))
+        return cur.fetchall()
+
+def get_change_cursor(name: str) -> Optional[int]:
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute('SELECT seq FROM change_cursors WHERE name = ?', (name,))
+        row = cur.fetchone()
+        return row[0] if row else None
+
+def set_change_cursor(name: str, seq: int):
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute('INSERT OR REPLACE INTO change_cursors (name, seq) VALUES (?, ?)', (name, seq))
+        conn.commit()
+
+def get_replacements_seq() -> int:
+    """seq последнего изменения замен (0, если журнал пуст)"""
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute('SELECT MAX(seq) FROM replacement_changes')
+        return cur.fetchone()[0] or 0
+
 def get_replacements_for_date(date: str) -> List[Tuple[int, str, str, Optional[str], Optional[str]]]:
     with get_connection() as conn:
         cur = conn.cursor()
@@ -264,14 +685,109 @@ def get_replacements_for_date_and_class(date: str, class_name: str) -> dict[int,
         rows = cur.fetchall()
     return {row[0]: (row[1], row[2]) for row in rows}
 
-def get_all_future_replacements() -> List[Tuple[str, int, str, str, Optional[str], Optional[str]]]:
-    today = datetime.date.today().isoformat()
+def get_class_replacements_page(class_name: str, from_date: str, limit: int, offset: int = 0) -> List[Tuple[str, int, str, Optional[str], Optional[str]]]:
+    """Замены класса начиная с from_date: (дата, урок, предмет, учитель, кабинет), не больше limit строк"""
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute('''
+            SELECT date, lesson_number, subject, teacher, room
+            FROM replacements
+            WHERE class_name = ? AND date >= ?
+            ORDER BY date, lesson_number
+            LIMIT ? OFFSET ?
+        ''', (class_name, from_date, limit, offset))
+        return cur.fetchall()
+
+def get_other_replacements_page(class_name: str, from_date: str, limit: int, offset: int = 0) -> List[Tuple[str, int, str, str, Optional[str], Optional[str]]]:
+    """Замены остальных классов начиная с from_date: (дата, урок, класс, предмет, учитель, кабинет)"""
     with get_connection() as conn:
         cur = conn.cursor()
         cur.execute('''
             SELECT date, lesson_number, class_name, subject, teacher, room
             FROM replacements
-            WHERE date >= ?
+            WHERE date >= ? AND class_name != ?
             ORDER BY date, class_name, lesson_number
-        ''', (today,))
-        return cur.fetchall()
\ No newline at end of file
+            LIMIT ? OFFSET ?
+        ''', (from_date, class_name, limit, offset))
+        return cur.fetchall()
+
+# ========== ПРОЦЕССЫ-УВЕДОМИТЕЛИ ==========
+
+def claim_notifier_shards(owner: str, total: int, now: float, lease_seconds: float) -> List[int]:
+    """
+    Пульс процесса-уведомителя: продлевает его аренду и доводит число его долей до
+    ceil(total / живых процессов) — сначала свободными и просроченными (процесс умер),
+    затем забирая лишние у процессов, у которых долей больше нормы. Лишние доли процесс
+    сам не отпускает: он рассылает по ним, пока их не заберёт другой в этой же транзакции,
+    поэтому при перераспределении доля не остаётся без владельца.
+    Возвращает доли, закреплённые за owner.
+    """
+    expires_at = now + lease_seconds
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute('BEGIN IMMEDIATE')
+        cur.execute('INSERT OR REPLACE INTO notifier_workers (owner, expires_at) VALUES (?, ?)', (owner, expires_at))
+        cur.execute('DELETE FROM notifier_workers WHERE expires_at < ?', (now,))
+        cur.execute('SELECT COUNT(*) FROM notifier_workers')
+        target = -(-total // cur.fetchone()[0])
+
+        cur.execute('SELECT shard, owner, expires_at FROM notifier_leases WHERE shard < ?', (total,))
+        leases = cur.fetchall()
+        owned = [shard for shard, lease_owner, _ in leases if lease_owner == owner]
+        busy = {shard: lease_owner for shard, lease_owner, lease_expires in leases
+                if lease_owner != owner and lease_expires >= now}
+        if len(owned) < target:
+            free = [shard for shard in range(total) if shard not in busy and shard not in owned]
+            owned += free[:target - len(owned)]
+            counts = {}
+            for lease_owner in busy.values():
+                counts[lease_owner] = counts.get(lease_owner, 0) + 1
+            for shard, lease_owner in sorted(busy.items()):
+                if len(owned) >= target:
+                    break
+                if counts[lease_owner] > target:
+                    counts[lease_owner] -= 1
+                    owned.append(shard)
+        owned.sort()
+        cur.executemany('''
+            INSERT OR REPLACE INTO notifier_leases (shard, owner, expires_at)
+            VALUES (?, ?, ?)
+        ''', [(shard, owner, expires_at) for shard in owned])
+        conn.commit()
+    return owned
+
+def release_notifier_shards(owner: str):
+    """Отпускает все доли процесса при штатной остановке, не дожидаясь истечения аренды"""
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute('DELETE FROM notifier_leases WHERE owner = ?', (owner,))
+        cur.execute('DELETE FROM notifier_workers WHERE owner = ?', (owner,))
+        conn.commit()
+
+# ========== СОСТОЯНИЯ ДИАЛОГОВ (FSM) ==========
+
+def get_fsm_record(key: str) -> Optional[Tuple[Optional[str], str, float]]:
+    """(состояние, data в JSON, время изменения) или None"""
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute('SELECT state, data, updated_at FROM fsm_state WHERE key = ?', (key,))
+        return cur.fetchone()
+
+def save_fsm_records(upserts: List[Tuple[str, Optional[str], str, float]], deletes: List[str]):
+    """Записывает накопленные изменения одной транзакцией: upserts — (ключ, состояние, data, время)"""
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.executemany('''
+            INSERT OR REPLACE INTO fsm_state (key, state, data, updated_at)
+            VALUES (?, ?, ?, ?)
+        ''', upserts)
+        cur.executemany('DELETE FROM fsm_state WHERE key = ?', [(key,) for key in deletes])
+        conn.commit()
+
+def delete_expired_fsm(before: float) -> int:
+    """Удаляет состояния, не менявшиеся с момента before (брошенные диалоги)"""
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute('DELETE FROM fsm_state WHERE updated_at < ?', (before,))
+        conn.commit()
+        return cur.rowcount
@@ -0,0 +1,107 @@
+"""
+Асинхронный слой доступа к БД для хендлеров и уведомителя.
+Каждая функция повторяет одноимённую функцию из bot/db.py, но выполняется в пуле
+соединений (bot/db_pool.py), поэтому её нужно вызывать через await.
+"""
+import functools
+from typing import Optional
+
+from bot import db
+from bot.db_pool import DBPool
+
+_pool: Optional[DBPool] = None
+
+
+def get_pool() -> DBPool:
+    global _pool
+    if _pool is None:
+        _pool = DBPool()
+    return _pool
+
+
+def close_pool():
+    global _pool
+    if _pool is not None:
+        _pool.close()
+        _pool = None
+
+
+def query_stats() -> dict[str, dict]:
+    return get_pool().stats() if _pool is not None else {}
+
+
+def _read(func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await get_pool().read(func, *args, **kwargs)
+    return wrapper
+
+
+def _write(func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await get_pool().write(func, *args, **kwargs)
+    return wrapper
+
+
+# Счётчик изменений таблицы users в этом процессе: по нему уведомитель понимает,
+# что план рассылки устарел (пользователь сменил класс или переключил уведомления)
+users_version = 0
+
+
+def _users_write(func):
+    write = _write(func)
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        global users_version
+        try:
+            return await write(*args, **kwargs)
+        finally:
+            users_version += 1
+    return wrapper
+
+
+init_db = _write(db.init_db)
+
+# Расписание читается из снимка в памяти (bot/timetable.py), а не отсюда
+get_data_version = _read(db.get_data_version)
+
+# Пользователи
+set_user = _users_write(db.set_user)
+get_user = _read(db.get_user)
+
+# Уведомления
+get_all_users_with_notify = _read(db.get_all_users_with_notify)
+get_subscribers_by_classes = _read(db.get_subscribers_by_classes)
+set_notify = _users_write(db.set_notify)
+get_notify_status = _read(db.get_notify_status)
+mark_notification_sent = _write(db.mark_notification_sent)
+check_notification_sent = _read(db.check_notification_sent)
+get_notified_user_ids = _read(db.get_notified_user_ids)
+record_notifications = _write(db.record_notifications)
+claim_notifications = _write(db.claim_notifications)
+release_notifications = _write(db.release_notifications)
+set_last_notification = _write(db.set_last_notification)
+get_last_notification = _read(db.get_last_notification)
+get_last_notifications = _read(db.get_last_notifications)
+clear_last_notification = _write(db.clear_last_notification)
+
+# Замены
+get_replacements_for_date = _read(db.get_replacements_for_date)
+get_replacements_for_date_and_class = _read(db.get_replacements_for_date_and_class)
+get_replacement_changes = _read(db.get_replacement_changes)
+get_change_cursor = _read(db.get_change_cursor)
+set_change_cursor = _write(db.set_change_cursor)
+get_replacements_seq = _read(db.get_replacements_seq)
+get_class_replacements_page = _read(db.get_class_replacements_page)
+get_other_replacements_page = _read(db.get_other_replacements_page)
+
+# Процессы-уведомители
+claim_notifier_shards = _write(db.claim_notifier_shards)
+release_notifier_shards = _write(db.release_notifier_shards)
+
+# Состояния диалогов
+get_fsm_record = _read(db.get_fsm_record)
+save_fsm_records = _write(db.save_fsm_records)
+delete_expired_fsm = _write(db.delete_expired_fsm)
@@ -0,0 +1,118 @@
+import asyncio
+import functools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bot import db
+from bot.metrics import DB_QUERY_SECONDS, DB_QUERY_WAIT_SECONDS, DB_QUERY_ERRORS
+from bot.tracing import span
+from bot.config import DB_POOL_READERS, DB_SLOW_QUERY_MS
+
+logger = logging.getLogger(__name__)
+
+
+class QueryStats:
+    """Накопленная статистика по одной функции bot/db.py"""
+    __slots__ = ('count', 'errors', 'total', 'max', 'wait_total')
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.wait_total = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'total_ms': round(self.total * 1000, 3),
+            'avg_ms': round(self.total / self.count * 1000, 3) if self.count else 0.0,
+            'max_ms': round(self.max * 1000, 3),
+            'avg_wait_ms': round(self.wait_total / self.count * 1000, 3) if self.count else 0.0,
+        }
+
+
+class DBPool:
+    """
+    Пул долгоживущих соединений SQLite.
+    Чтение идёт в нескольких потоках-читателях, запись — в единственном потоке-писателе,
+    так что запросы никогда не выполняются в потоке event loop.
+    """
+
+    def __init__(self, readers: int = DB_POOL_READERS):
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._readers = ThreadPoolExecutor(
+            max_workers=readers, thread_name_prefix="db-read", initializer=self._open_connection
+        )
+        self._writer = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="db-write", initializer=self._open_connection
+        )
+        self._stats: dict[str, QueryStats] = {}
+        self._stats_lock = threading.Lock()
+
+    def _open_connection(self):
+        conn = db.open_thread_connection()
+        with self._connections_lock:
+            self._connections.append(conn)
+
+    async def read(self, func, *args, **kwargs):
+        return await self._submit(self._readers, func, args, kwargs)
+
+    async def write(self, func, *args, **kwargs):
+        return await self._submit(self._writer, func, args, kwargs)
+
+    async def _submit(self, executor, func, args, kwargs):
+        loop = asyncio.get_running_loop()
+        call = functools.partial(self._timed, func, time.perf_counter(), args, kwargs)
+        # Участок трассы обновления: запрос вместе с ожиданием свободного потока
+        with span('db', func.__name__):
+            return await loop.run_in_executor(executor, call)
+
+    def _timed(self, func, submitted: float, args, kwargs):
+        start = time.perf_counter()
+        failed = False
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            self._record(func.__name__, elapsed, start - submitted, failed)
+
+    def _record(self, name: str, elapsed: float, waited: float, failed: bool):
+        with self._stats_lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                stats = self._stats[name] = QueryStats()
+            stats.count += 1
+            stats.total += elapsed
+            stats.wait_total += waited
+            if elapsed > stats.max:
+                stats.max = elapsed
+            if failed:
+                stats.errors += 1
+        DB_QUERY_SECONDS.observe(elapsed, name)
+        DB_QUERY_WAIT_SECONDS.observe(waited, name)
+        if failed:
+            DB_QUERY_ERRORS.inc(name)
+        if elapsed * 1000 >= DB_SLOW_QUERY_MS:
+            logger.warning(f"Медленный запрос {name}: {elapsed * 1000:.1f} мс (ожидание {waited * 1000:.1f} мс)")
+
+    def stats(self) -> dict[str, dict]:
+        """Снимок статистики по запросам: {имя функции: {count, avg_ms, max_ms, ...}}"""
+        with self._stats_lock:
+            return {name: s.as_dict() for name, s in self._stats.items()}
+
+    def close(self):
+        self._readers.shutdown(wait=True)
+        self._writer.shutdown(wait=True)
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        logger.info("Пул соединений с БД закрыт")
@@ -0,0 +1,149 @@
+"""
+Хранилище состояний диалогов (FSM) в той же SQLite-базе, таблица fsm_state.
+Недавно использованные состояния держатся в памяти (LRU на FSM_CACHE_SIZE ключей),
+изменения копятся и пишутся в БД одной транзакцией раз в FSM_FLUSH_INTERVAL секунд.
+Состояния, которые не менялись дольше FSM_TTL (брошенный выбор класса), считаются
+пустыми и периодически удаляются из БД. Незавершённый выбор класса переживает перезапуск.
+"""
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Mapping, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey, StateType
+
+from bot import db_async
+from bot.config import FSM_CACHE_SIZE, FSM_TTL, FSM_FLUSH_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# Как часто удалять из БД просроченные состояния (с)
+PURGE_INTERVAL = 3600
+
+
+class _Record:
+    __slots__ = ('state', 'data', 'updated_at')
+
+    def __init__(self, state: Optional[str], data: str, updated_at: float):
+        self.state = state
+        self.data = data  # JSON: разбирается при каждом чтении, поэтому хендлер получает свою копию
+        self.updated_at = updated_at
+
+
+class SQLiteStorage(BaseStorage):
+    def __init__(self, cache_size: int = FSM_CACHE_SIZE, ttl: float = FSM_TTL,
+                 flush_interval: float = FSM_FLUSH_INTERVAL):
+        self.cache_size = cache_size
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        # ключ -> _Record или None (состояния нет — тоже запоминаем, чтобы не ходить в БД)
+        self._cache: OrderedDict[str, Optional[_Record]] = OrderedDict()
+        # ещё не записанные изменения: ключ -> _Record или None (удалить)
+        self._dirty: dict[str, Optional[_Record]] = {}
+        self._flusher: Optional[asyncio.Task] = None
+        self._last_purge: Optional[float] = None
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        return ':'.join(str(part) if part is not None else '' for part in (
+            key.bot_id, key.chat_id, key.user_id, key.thread_id, key.business_connection_id, key.destiny))
+
+    async def _load(self, skey: str) -> Optional[_Record]:
+        if skey in self._dirty:
+            record = self._dirty[skey]
+        elif skey in self._cache:
+            self._cache.move_to_end(skey)
+            record = self._cache[skey]
+        else:
+            row = await db_async.get_fsm_record(skey)
+            record = _Record(*row) if row else None
+            # Пока шёл запрос, ключ мог быть уже изменён — тогда прочитанное устарело
+            if skey not in self._cache and skey not in self._dirty:
+                self._cache[skey] = record
+                self._trim()
+            else:
+                record = self._dirty.get(skey, self._cache.get(skey))
+        if record is not None and record.updated_at < time.time() - self.ttl:
+            return None
+        return record
+
+    def _trim(self):
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _put(self, skey: str, state: Optional[str], data: Mapping[str, Any]):
+        record = _Record(state, json.dumps(dict(data), ensure_ascii=False), time.time()) if state or data else None
+        self._dirty[skey] = record
+        self._cache[skey] = record
+        self._cache.move_to_end(skey)
+        self._trim()
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        skey = self._key(key)
+        record = await self._load(skey)
+        state = state.state if isinstance(state, State) else state
+        self._put(skey, state, json.loads(record.data) if record else {})
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        record = await self._load(self._key(key))
+        return record.state if record else None
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        skey = self._key(key)
+        record = await self._load(skey)
+        self._put(skey, record.state if record else None, data)
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        record = await self._load(self._key(key))
+        return json.loads(record.data) if record else {}
+
+    async def flush(self):
+        """Записывает накопленные изменения; при ошибке они остаются до следующей попытки"""
+        if not self._dirty:
+            return
+        batch, self._dirty = self._dirty, {}
+        upserts = [(skey, r.state, r.data, r.updated_at) for skey, r in batch.items() if r is not None]
+        deletes = [skey for skey, r in batch.items() if r is None]
+        try:
+            await db_async.save_fsm_records(upserts, deletes)
+        except Exception as e:
+            logger.error(f"Не удалось сохранить состояния диалогов ({len(batch)}): {e}")
+            # Изменения, сделанные во время записи, новее — их не трогаем
+            for skey, record in batch.items():
+                self._dirty.setdefault(skey, record)
+
+    async def purge_expired(self) -> int:
+        before = time.time() - self.ttl
+        for skey in [k for k, r in self._cache.items() if r is not None and r.updated_at < before]:
+            del self._cache[skey]
+        deleted = await db_async.delete_expired_fsm(before)
+        if deleted:
+            logger.info(f"Удалено просроченных состояний диалогов: {deleted}")
+        return deleted
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+            if self._last_purge is None or time.monotonic() - self._last_purge >= PURGE_INTERVAL:
+                self._last_purge = time.monotonic()
+                try:
+                    await self.purge_expired()
+                except Exception as e:
+                    logger.error(f"Ошибка удаления просроченных состояний: {e}")
+
+    def stats(self) -> dict:
+        return {'cached': len(self._cache), 'dirty': len(self._dirty)}
+
+    async def close(self) -> None:
+        """Вызывается диспетчером при остановке: дописывает накопленное"""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        await self.flush()
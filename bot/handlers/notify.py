@@ -1,7 +1,7 @@
 from aiogram import Router, F
 from aiogram.types import CallbackQuery
 import logging
-from bot.db import get_notify_status, set_notify, get_user
+from bot.db_async import get_notify_status, set_notify, get_user
 from bot.keyboards import get_main_keyboard
 from bot.utils import format_class_display
 
@@ -12,10 +12,10 @@ router = Router()
 @router.callback_query(F.data == "toggle_notify")
 async def toggle_notify(callback: CallbackQuery):
     user_id = callback.from_user.id
-    current = get_notify_status(user_id)
+    current = await get_notify_status(user_id)
     new_status = not current
-    set_notify(user_id, new_status)
-    user_data = get_user(user_id)
+    await set_notify(user_id, new_status)
+    user_data = await get_user(user_id)
     logger.info(f"Пользователь {user_id} переключил уведомления: {new_status}")
     if user_data:
         class_name, profile = user_data
@@ -3,7 +3,6 @@ from aiogram.types import Message, CallbackQuery
 from aiogram.filters import CommandStart
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-import datetime
 import logging
 
 from bot.keyboards import (
@@ -12,18 +11,20 @@ from bot.keyboards import (
     get_profiles_keyboard,
     get_main_keyboard
 )
-from bot.db import (
-    get_parallels,
-    get_letters_by_parallel,
-    get_classes_with_profiles,
+from bot.db_async import (
     set_user,
     get_user,
     get_notify_status,
-    get_schedule,
     get_replacements_for_date_and_class  # добавили импорт
 )
+from bot.timetable import (
+    get_parallels,
+    get_letters_by_parallel,
+    get_classes_with_profiles,
+    get_schedule
+)
 from bot.utils import format_class_display, get_current_next_lesson, format_main_menu_text
-from bot.config import WEEKDAY_MAP
+from bot import clock
 
 logger = logging.getLogger(__name__)
 
@@ -35,7 +36,7 @@ class ClassChoice(StatesGroup):
     waiting_for_profile = State()
 
 async def send_main_menu(target, user_id, user_name):
-    user_data = get_user(user_id)
+    user_data = await get_user(user_id)
     if not user_data:
         logger.info(f"Пользователь {user_id} не выбрал класс, предлагаем выбор")
         parallels = get_parallels()
@@ -56,10 +57,9 @@ async def send_main_menu(target, user_id, user_name):
     class_display = format_class_display(class_name, profile)
     logger.debug(f"Пользователь {user_id}, класс {class_display}")
 
-    today_name = WEEKDAY_MAP[datetime.datetime.today().weekday()]
-    today_str = datetime.datetime.today().strftime("%Y-%m-%d")
-    schedule_today = get_schedule(class_name, profile, today_name)
-    replacements = get_replacements_for_date_and_class(today_str, class_name)  # получили замены
+    school = clock.state()
+    schedule_today = get_schedule(class_name, profile, school.day_name)
+    replacements = await get_replacements_for_date_and_class(school.date_str, class_name)  # получили замены
 
     current_info, next_info = get_current_next_lesson(schedule_today, replacements)
 
@@ -71,7 +71,7 @@ async def send_main_menu(target, user_id, user_name):
         no_lessons_message="😴 Сегодня уроков нет."
     )
 
-    notify_enabled = get_notify_status(user_id)
+    notify_enabled = await get_notify_status(user_id)
 
     if isinstance(target, Message):
         await target.answer(text, parse_mode="HTML", reply_markup=get_main_keyboard(notify_enabled))
@@ -84,7 +84,7 @@ async def cmd_start(message: Message, state: FSMContext):
     user_id = message.from_user.id
     user_name = message.from_user.first_name or "Пользователь"
     logger.info(f"Команда /start от пользователя {user_id} ({user_name})")
-    user_data = get_user(user_id)
+    user_data = await get_user(user_id)
     if user_data:
         await send_main_menu(message, user_id, user_name)
     else:
@@ -137,7 +137,7 @@ async def letter_chosen(callback: CallbackQuery, state: FSMContext):
         profile = sorted(profiles)[0]
     else:
         profile = None
-    set_user(callback.from_user.id, full_class, profile)
+    await set_user(callback.from_user.id, full_class, profile)
     await send_main_menu(callback, callback.from_user.id, callback.from_user.first_name or "Пользователь")
     await state.clear()
 
@@ -153,6 +153,6 @@ async def profile_chosen(callback: CallbackQuery, state: FSMContext):
     class_name = parts[1]
     profile = parts[2]
     logger.info(f"Пользователь {callback.from_user.id} выбрал класс {class_name} профиль {profile}")
-    set_user(callback.from_user.id, class_name, profile)
+    await set_user(callback.from_user.id, class_name, profile)
     await send_main_menu(callback, callback.from_user.id, callback.from_user.first_name or "Пользователь")
     await state.clear()
\ No newline at end of file
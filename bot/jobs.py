@@ -0,0 +1,91 @@
+import asyncio
+import datetime
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+
+from bot.config import INGEST_WORKERS
+from bot.metrics import JOB_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class JobStatus:
+    """Состояние фоновой задачи обновления данных (отдаётся в /health)"""
+    name: str
+    running: bool = False
+    last_start: Optional[datetime.datetime] = None
+    last_finish: Optional[datetime.datetime] = None
+    duration: Optional[float] = None
+    rows_changed: Optional[int] = None
+    error: Optional[str] = None
+    runs: int = 0
+    skipped: int = 0
+
+    def as_dict(self) -> dict:
+        return {
+            'running': self.running,
+            'last_start': self.last_start.isoformat(timespec='seconds') if self.last_start else None,
+            'last_finish': self.last_finish.isoformat(timespec='seconds') if self.last_finish else None,
+            'duration': round(self.duration, 3) if self.duration is not None else None,
+            'rows_changed': self.rows_changed,
+            'error': self.error,
+            'runs': self.runs,
+            'skipped': self.skipped,
+        }
+
+
+class JobRunner:
+    """
+    Выполняет синхронные задачи обновления (скачивание, разбор, запись в БД) в отдельных потоках,
+    чтобы event loop продолжал обслуживать Telegram. Одна и та же задача не запускается дважды одновременно.
+    """
+
+    def __init__(self, max_workers: int = INGEST_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        self._status: dict[str, JobStatus] = {}
+
+    async def run(self, name: str, func, after=None):
+        """
+        Запускает func() в пуле. after — корутина, получающая результат func
+        (выполняется в event loop, например для подмены снимка расписания).
+        """
+        status = self._status.setdefault(name, JobStatus(name))
+        if status.running:
+            status.skipped += 1
+            logger.warning(f"Задача {name} ещё выполняется с {status.last_start:%H:%M:%S}, запуск пропущен")
+            return None
+
+        status.running = True
+        status.last_start = datetime.datetime.now()
+        started = time.perf_counter()
+        result = None
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self._executor, func)
+            status.rows_changed = result['rows'] if isinstance(result, dict) else result
+            status.error = None
+            if after is not None:
+                await after(result)
+        except Exception as e:
+            status.error = f"{type(e).__name__}: {e}"
+            logger.exception(f"Ошибка в задаче {name}")
+        finally:
+            status.running = False
+            status.runs += 1
+            status.last_finish = datetime.datetime.now()
+            status.duration = time.perf_counter() - started
+            JOB_SECONDS.observe(status.duration, name)
+            logger.info(f"Задача {name} завершена за {status.duration:.1f} с")
+        return result
+
+    def statuses(self) -> dict[str, dict]:
+        return {name: status.as_dict() for name, status in self._status.items()}
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+runner = JobRunner()
@@ -3,6 +3,7 @@ from .reply import (
     get_letters_keyboard,
     get_profiles_keyboard,
     get_main_keyboard,
+    get_replacements_keyboard,
     get_classes_keyboard
 )
 
@@ -11,5 +12,6 @@ __all__ = [
     'get_letters_keyboard',
     'get_profiles_keyboard',
     'get_main_keyboard',
+    'get_replacements_keyboard',
     'get_classes_keyboard'
 ]
\ No newline at end of file
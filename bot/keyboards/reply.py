@@ -1,6 +1,16 @@
+from functools import lru_cache
+
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
+# Готовые клавиатуры общие для всех ответов, поэтому их нельзя изменять после получения.
+# Клавиатуры выбора класса кэшируются по набору параллелей/букв: пока загрузка
+# расписания не изменила список классов, они не пересобираются.
+
 def get_parallels_keyboard(parallels: list[str]) -> InlineKeyboardMarkup:
+    return _parallels_keyboard(tuple(parallels))
+
+@lru_cache(maxsize=8)
+def _parallels_keyboard(parallels: tuple[str, ...]) -> InlineKeyboardMarkup:
     buttons = []
     row = []
     for p in parallels:
@@ -13,6 +23,10 @@ def get_parallels_keyboard(parallels: list[str]) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 def get_letters_keyboard(letters: list[str], parallel: str) -> InlineKeyboardMarkup:
+    return _letters_keyboard(tuple(letters), parallel)
+
+@lru_cache(maxsize=128)
+def _letters_keyboard(letters: tuple[str, ...], parallel: str) -> InlineKeyboardMarkup:
     buttons = []
     row = []
     for letter in letters:
@@ -26,6 +40,10 @@ def get_letters_keyboard(letters: list[str], parallel: str) -> InlineKeyboardMar
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 def get_profiles_keyboard(class_name: str, profiles: list[str]) -> InlineKeyboardMarkup:
+    return _profiles_keyboard(class_name, tuple(profiles))
+
+@lru_cache(maxsize=256)
+def _profiles_keyboard(class_name: str, profiles: tuple[str, ...]) -> InlineKeyboardMarkup:
     buttons = []
     row = []
     for prof in profiles:
@@ -39,6 +57,9 @@ def get_profiles_keyboard(class_name: str, profiles: list[str]) -> InlineKeyboar
 
 def get_main_keyboard(notify_enabled: bool = True) -> InlineKeyboardMarkup:
     """Главное меню с динамической кнопкой уведомлений (без кнопки 'Сегодня')"""
+    return MAIN_KEYBOARDS[bool(notify_enabled)]
+
+def _build_main_keyboard(notify_enabled: bool) -> InlineKeyboardMarkup:
     notify_text = "🔔 Уведомления: ВКЛ" if notify_enabled else "🔕 Уведомления: ВЫКЛ"
     buttons = [
         [InlineKeyboardButton(text=notify_text, callback_data="toggle_notify")],
@@ -48,6 +69,27 @@ def get_main_keyboard(notify_enabled: bool = True) -> InlineKeyboardMarkup:
     ]
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
+# Оба варианта главного меню собираются один раз при импорте
+MAIN_KEYBOARDS = {enabled: _build_main_keyboard(enabled) for enabled in (True, False)}
+
+@lru_cache(maxsize=256)
+def get_replacements_keyboard(notify_enabled: bool, mine_page: int, other_page: int,
+                              mine_more: bool, other_more: bool) -> InlineKeyboardMarkup:
+    """Листание замен (отдельно свой класс и остальные) над кнопками главного меню"""
+    buttons = []
+    for title, page, more, make_data in (
+        ("Мой класс", mine_page, mine_more, lambda p: f"repl:{p}:{other_page}"),
+        ("Остальные", other_page, other_more, lambda p: f"repl:{mine_page}:{p}"),
+    ):
+        row = []
+        if page > 0:
+            row.append(InlineKeyboardButton(text=f"⬅️ {title}", callback_data=make_data(page - 1)))
+        if more:
+            row.append(InlineKeyboardButton(text=f"{title} ➡️", callback_data=make_data(page + 1)))
+        if row:
+            buttons.append(row)
+    return InlineKeyboardMarkup(inline_keyboard=buttons + MAIN_KEYBOARDS[bool(notify_enabled)].inline_keyboard)
+
 # (опционально) старая клавиатура, может пригодиться
 def get_classes_keyboard(classes: list[str]) -> InlineKeyboardMarkup:
     buttons = []
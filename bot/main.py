@@ -1,56 +1,202 @@
 import asyncio
+import hmac
 import logging
 import os
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiohttp import web  # добавить импорт
 
-from bot.config import BOT_TOKEN
-from bot.db import init_db
+from bot.config import BOT_TOKEN, BOT_GLOBAL_RATE, DEBUG_TOKEN, NOTIFIER_SHARDS, PUSH_REPLACEMENTS, UPDATES_MODE
+from bot.db_async import init_db, close_pool
+from bot.timetable import load_snapshot, get_snapshot
 from bot.handlers import start, schedule, notify
 from bot.notifier import notification_worker
-from bot.scheduler import setup_scheduler
+from bot.scheduler import setup_scheduler, sync_replacements_version
+from bot.replacement_push import init_push_cursor
+from bot.jobs import runner as job_runner
+from bot import outbound, metrics, tracing, profiler, webhook
+from bot.utils import render_cache
+from bot.fsm_storage import SQLiteStorage
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Обработчик для HTTP-запросов (чтобы Render видел открытый порт)
-async def handle_health(request):
+async def handle_root(request):
     return web.Response(text="OK")
 
-async def run_web_server():
+async def handle_health(request):
+    """Состояние бота и фоновых задач обновления (последний запуск, длительность, ошибки)"""
+    return web.json_response({
+        'status': 'ok',
+        'jobs': job_runner.statuses(),
+        'outbound': outbound.outbound.stats(),
+        'render_cache': render_cache.stats(),
+        'timetable': get_snapshot().stats(),
+        'webhook': webhook.stats(),
+    })
+
+async def handle_metrics(request):
+    """Метрики в текстовом формате Prometheus"""
+    return web.Response(
+        body=metrics.render().encode('utf-8'),
+        headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+    )
+
+async def handle_profile(request):
+    """
+    Профиль CPU за ?seconds=N секунд в collapsed-формате.
+    Нужен заголовок Authorization: Bearer <DEBUG_TOKEN>; без DEBUG_TOKEN эндпоинт отключён.
+    """
+    if not DEBUG_TOKEN:
+        raise web.HTTPNotFound()
+    # Сравнение за постоянное время; байты — потому что для str compare_digest принимает только ASCII
+    authorization = request.headers.get('Authorization', '').encode()
+    if not hmac.compare_digest(authorization, f"Bearer {DEBUG_TOKEN}".encode()):
+        raise web.HTTPUnauthorized()
+    try:
+        seconds = float(request.query.get('seconds', 10))
+    except ValueError:
+        raise web.HTTPBadRequest(text="seconds должен быть числом")
+    logger.info(f"Профилирование на {seconds} с по запросу {request.remote}")
+    try:
+        stacks = await asyncio.to_thread(profiler.sample, seconds)
+    except profiler.ProfilerBusy:
+        raise web.HTTPConflict(text="Профилирование уже идёт")
+    return web.Response(text=profiler.collapsed(stacks))
+
+@metrics.register_collector
+def collect_runtime_metrics():
+    """Текущие значения, которые накапливают очередь исходящих, кэш текстов и задачи обновления"""
+    queue = outbound.outbound.stats()
+    depth = metrics.Gauge('bot_outbound_queue_depth', 'Сообщений в очереди исходящих')
+    depth.set(queue['depth'])
+    waiting = metrics.Gauge('bot_outbound_rate_limited_waiting', 'Запросов, ждущих общего лимита отправки')
+    waiting.set(outbound.limiter.waiting)
+    sent = metrics.Counter('bot_outbound_messages_total', 'Задачи очереди исходящих по результату', ('result',))
+    for result in ('sent', 'failed', 'retried'):
+        sent.inc(result, amount=queue[result])
+
+    cache = render_cache.stats()
+    cache_requests = metrics.Counter('bot_render_cache_requests_total', 'Обращения к кэшу текстов экранов', ('result',))
+    cache_requests.inc('hit', amount=cache['hits'])
+    cache_requests.inc('miss', amount=cache['misses'])
+    cache_ratio = metrics.Gauge('bot_render_cache_hit_ratio', 'Доля попаданий в кэш текстов экранов')
+    cache_ratio.set(cache['hit_ratio'])
+    cache_size = metrics.Gauge('bot_render_cache_entries', 'Записей в кэше текстов экранов')
+    cache_size.set(cache['size'])
+
+    rows = metrics.Gauge('bot_job_rows_changed', 'Строк изменено последним запуском задачи', ('job',))
+    runs = metrics.Counter('bot_job_runs_total', 'Запуски задач обновления', ('job',))
+    skipped = metrics.Counter('bot_job_skipped_total', 'Пропущенные запуски (предыдущий ещё шёл)', ('job',))
+    failing = metrics.Gauge('bot_job_last_run_failed', '1, если последний запуск задачи завершился ошибкой', ('job',))
+    for name, status in job_runner.statuses().items():
+        rows.set(status['rows_changed'] or 0, name)
+        runs.inc(name, amount=status['runs'])
+        skipped.inc(name, amount=status['skipped'])
+        failing.set(1 if status['error'] else 0, name)
+    result = [depth, waiting, sent, cache_requests, cache_ratio, cache_size, rows, runs, skipped, failing]
+
+    hook = webhook.stats()
+    if hook is not None:
+        in_flight = metrics.Gauge('bot_webhook_updates_in_flight', 'Обновлений webhook в обработке')
+        in_flight.set(hook['in_flight'])
+        queued = metrics.Gauge('bot_webhook_updates_queued', 'Обновлений webhook в очереди')
+        queued.set(hook['queued'])
+        received = metrics.Counter('bot_webhook_updates_total', 'Обновлений получено через webhook')
+        received.inc(amount=hook['received'])
+        dropped = metrics.Counter('bot_webhook_updates_dropped_total', 'Обновлений webhook отброшено из-за переполненной очереди')
+        dropped.inc(amount=hook['dropped'])
+        result += [in_flight, queued, received, dropped]
+    return result
+
+def create_app() -> web.Application:
     app = web.Application()
-    app.router.add_get('/', handle_health)        # можно добавить и другие пути
+    app.router.add_get('/', handle_root)        # можно добавить и другие пути
     app.router.add_get('/health', handle_health)
+    app.router.add_get('/metrics', handle_metrics)
+    app.router.add_get('/debug/profile', handle_profile)
+    return app
 
+async def run_web_server(app: web.Application) -> web.AppRunner:
     port = int(os.environ.get("PORT", 10000))     # Render передаёт PORT
     runner = web.AppRunner(app)
     await runner.setup()
     site = web.TCPSite(runner, '0.0.0.0', port)
     await site.start()
     logger.info(f"HTTP-сервер запущен на порту {port}")
+    return runner
 
-async def main():
-    logger.info("Запуск бота")
-    bot = Bot(token=BOT_TOKEN)
-    dp = Dispatcher(storage=MemoryStorage())
+def create_bot(token: str = BOT_TOKEN, api_url: str | None = None) -> Bot:
+    """Бот с общим лимитером отправки; api_url — другой сервер Bot API (локальный или тестовый)"""
+    session = AiohttpSession(api=TelegramAPIServer.from_base(api_url)) if api_url else None
+    bot = Bot(token=token, session=session)
+    # Трассировка снаружи лимитера, чтобы в участок api попадало и ожидание своей очереди
+    bot.session.middleware(tracing.TracingRequestMiddleware())
+    outbound.install(bot)
+    return bot
 
+def create_dispatcher() -> Dispatcher:
+    """Диспетчер со всеми роутерами бота (роутер подключается только к одному диспетчеру за процесс)"""
+    dp = Dispatcher(storage=SQLiteStorage())
+    dp.update.outer_middleware(tracing.TracingMiddleware())
+    # Внутренний middleware диспетчера применяется и к хендлерам вложенных роутеров
+    dp.callback_query.middleware(metrics.CallbackTimingMiddleware())
     dp.include_router(start.router)
     dp.include_router(schedule.router)
     dp.include_router(notify.router)
+    return dp
+
+async def main():
+    logger.info("Запуск бота")
+    bot = create_bot()
+    dp = create_dispatcher()
 
-    init_db()
-    scheduler = setup_scheduler()
+    await init_db()
+    await load_snapshot()
+    # Версия замен в ключах кэша текстов — seq журнала в БД, а не 0 до первого обновления
+    await sync_replacements_version()
+    if PUSH_REPLACEMENTS:
+        await init_push_cursor()
+    scheduler = setup_scheduler(bot)
     scheduler.start()
 
-    # Запускаем HTTP-сервер (не блокируя основной цикл)
-    asyncio.create_task(run_web_server())
+    use_webhook = UPDATES_MODE == 'webhook'
+    if use_webhook and not webhook.is_configured():
+        logger.warning("UPDATES_MODE=webhook, но не задан WEBHOOK_BASE_URL — работаем через polling")
+        use_webhook = False
+
+    app = create_app()
+    secret = webhook.setup(app, dp, bot) if use_webhook else None
+
+    outbound.outbound.start()
 
-    # Запускаем фоновую задачу уведомлений
-    asyncio.create_task(notification_worker(bot))
+    # Запускаем фоновую задачу уведомлений (или её выполняют отдельные процессы-уведомители)
+    if NOTIFIER_SHARDS:
+        logger.info(f"Уведомления рассылают процессы-уведомители ({NOTIFIER_SHARDS} долей), "
+                    f"боту остаётся {BOT_GLOBAL_RATE:.0f} сообщений/с")
+    else:
+        asyncio.create_task(notification_worker(bot))
 
-    await bot.delete_webhook(drop_pending_updates=True)
-    await dp.start_polling(bot)
+    try:
+        if use_webhook:
+            # HTTP-сервер принимает обновления; адрес сообщаем Telegram, когда он уже слушает порт
+            runner = await run_web_server(app)
+            try:
+                await webhook.register(bot, dp, secret)
+                await asyncio.Event().wait()
+            finally:
+                await runner.cleanup()
+        else:
+            # Запускаем HTTP-сервер (не блокируя основной цикл)
+            asyncio.create_task(run_web_server(app))
+            await bot.delete_webhook(drop_pending_updates=True)
+            await dp.start_polling(bot)
+    finally:
+        await outbound.outbound.stop()
+        job_runner.shutdown()
+        close_pool()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,192 @@
+"""
+Метрики в текстовом формате Prometheus (отдаются на /metrics).
+Счётчики и гистограммы обновляются в местах измерения; значения, которые уже
+накапливаются в других модулях (очередь исходящих, кэш текстов, задачи обновления),
+снимаются в момент запроса через зарегистрированные сборщики.
+"""
+import bisect
+import threading
+import time
+
+from aiogram import BaseMiddleware
+
+# Границы корзин гистограмм задержки, секунды
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DURATION_BUCKETS = (0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+SIZE_BUCKETS = (1, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _le(bound: float) -> str:
+    return 'le="' + _format_value(float(bound)) + '"'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = ''
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        super().__init__(name, help, labels)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_format_labels(self.labels, key)} {_format_value(v)}" for key, v in values]
+
+
+class Gauge(Counter):
+    type = 'gauge'
+
+    def set(self, value: float, *label_values):
+        with self._lock:
+            self._values[label_values] = value
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        # метки -> [счётчики по корзинам..., сумма, количество]
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, value: float, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            data = self._values.get(label_values)
+            if data is None:
+                data = self._values[label_values] = [0] * len(self.buckets) + [0.0, 0]
+            if index < len(self.buckets):
+                data[index] += 1
+            data[-2] += value
+            data[-1] += 1
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = sorted((key, list(data)) for key, data in self._values.items())
+        lines = self.header()
+        for key, data in values:
+            labels = _format_labels(self.labels, key)
+            cumulative = 0
+            for bound, count in zip(self.buckets, data):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, _le(bound))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, _le(float('inf')))} {data[-1]}")
+            lines.append(f"{self.name}_sum{labels} {_format_value(data[-2])}")
+            lines.append(f"{self.name}_count{labels} {data[-1]}")
+        return lines
+
+
+_metrics: list[_Metric] = []
+_collectors = []
+
+
+def _register(metric):
+    _metrics.append(metric)
+    return metric
+
+
+def register_collector(func):
+    """func() -> список метрик (Gauge/Counter), заполненных текущими значениями на момент запроса"""
+    _collectors.append(func)
+    return func
+
+
+def render() -> str:
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    for collect in _collectors:
+        for metric in collect():
+            lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+# ---- Метрики, обновляемые в местах измерения ----
+
+HANDLER_SECONDS = _register(Histogram(
+    'bot_callback_handler_seconds', 'Время обработки нажатия кнопки', ('callback', 'status')))
+DB_QUERY_SECONDS = _register(Histogram(
+    'bot_db_query_seconds', 'Время выполнения функций bot/db.py в пуле соединений', ('function',)))
+DB_QUERY_WAIT_SECONDS = _register(Histogram(
+    'bot_db_query_wait_seconds', 'Ожидание свободного потока пула соединений', ('function',)))
+DB_QUERY_ERRORS = _register(Counter(
+    'bot_db_query_errors_total', 'Функции bot/db.py, завершившиеся исключением', ('function',)))
+WAVE_RECIPIENTS = _register(Histogram(
+    'bot_notify_wave_recipients', 'Получателей в волне уведомлений', buckets=SIZE_BUCKETS))
+WAVE_SECONDS = _register(Histogram(
+    'bot_notify_wave_seconds', 'Длительность рассылки волны уведомлений', buckets=DURATION_BUCKETS))
+WAVE_FAILURES = _register(Counter(
+    'bot_notify_failures_total', 'Уведомления, которые не удалось отправить'))
+JOB_SECONDS = _register(Histogram(
+    'bot_job_duration_seconds', 'Длительность задач обновления данных', ('job',), buckets=DURATION_BUCKETS))
+
+
+# Типы нажатий, известные хендлерам; всё остальное — "other", чтобы произвольные
+# callback_data от клиентов не раздували число временных рядов
+CALLBACK_TYPES = {
+    'today', 'week', 'replacements', 'repl', 'toggle_notify', 'change_class', 'parallel', 'letter', 'profile',
+}
+
+
+def callback_type(data: str | None) -> str:
+    if not data:
+        return 'other'
+    if data in CALLBACK_TYPES:
+        return data
+    for sep in (':', '_'):
+        prefix = data.split(sep, 1)[0]
+        if prefix in CALLBACK_TYPES:
+            return prefix
+    return 'other'
+
+
+class CallbackTimingMiddleware(BaseMiddleware):
+    """Измеряет время обработки каждого нажатия (вместе с фильтрами и ответом в Telegram)"""
+
+    async def __call__(self, handler, event, data):
+        started = time.perf_counter()
+        status = 'ok'
+        try:
+            return await handler(event, data)
+        except Exception:
+            status = 'error'
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started, callback_type(event.data), status)
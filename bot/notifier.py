@@ -1,104 +1,286 @@
 import asyncio
 import datetime
 import logging
-from zoneinfo import ZoneInfo
+import time
 from aiogram import Bot
-from bot.db import (
+from bot import db_async, clock
+from bot.db_async import (
     get_all_users_with_notify,
-    get_schedule,
-    mark_notification_sent,
-    check_notification_sent,
-    get_last_notification,
-    set_last_notification
+    get_last_notifications,
+    claim_notifications,
+    release_notifications,
+    record_notifications
 )
+from bot.timetable import get_snapshot, sync_snapshot
+from bot.notifier_shards import ShardLease, PROCESS_OWNER
+from bot.outbound import outbound, PRIORITY_NOTIFY
+from bot.metrics import WAVE_RECIPIENTS, WAVE_SECONDS, WAVE_FAILURES
 from bot.config import WEEKDAY_MAP, LESSON_TIMES, TIMEZONE
 
 logger = logging.getLogger(__name__)
 
 # Время за сколько минут до урока отправлять уведомление
 NOTIFY_BEFORE_MINUTES = 16
-tz = ZoneInfo(TIMEZONE)
+# Дольше волна идти не может (урок уже начнётся): отметку claim_notifications старше этого
+# другой процесс считает брошенной, даже если её владелец ещё жив
+CLAIM_TIMEOUT = NOTIFY_BEFORE_MINUTES * 60
+# Доставленные записываются по ходу волны раз в столько секунд: если процесс упадёт
+# посреди волны, повторно уведомление получат только отправленные после последней записи
+RECORD_INTERVAL = 1.0
 
-def get_next_lesson_start_time(now_time):
+
+class DispatchGroup:
+    """Получатели с одинаковым уведомлением: один класс и профиль, один урок"""
+    __slots__ = ('class_name', 'profile', 'subject', 'room', 'user_ids')
+
+    def __init__(self, class_name, profile, subject, room, user_ids):
+        self.class_name = class_name
+        self.profile = profile
+        self.subject = subject
+        self.room = room
+        self.user_ids = user_ids
+
+
+class DispatchPlan:
     """
-    Определяет номер следующего урока и время его начала.
-    Возвращает (next_lesson_number, start_time) или (None, None), если уроков больше нет.
-    now_time: время в московском поясе (time object).
+    План рассылки на один учебный день: номер урока -> группы получателей.
+    Строится из одного запроса к users и снимка расписания; пока не изменились
+    дата, версия расписания или таблица users, используется повторно.
     """
-    for i, (start, end) in enumerate(LESSON_TIMES, start=1):
-        if now_time < start:
-            return i, start
-        # после окончания урока проверяем следующий
-    return None, None
-
-def should_notify_now(now_time):
-    next_lesson, next_start = get_next_lesson_start_time(now_time)
-    if not next_lesson:
-        return None
-    notify_time = (datetime.datetime.combine(datetime.date.today(), next_start) -
-                   datetime.timedelta(minutes=NOTIFY_BEFORE_MINUTES)).time()
-    # Учитываем случай, если notify_time меньше 00:00 (не должно быть)
-    if notify_time <= now_time < next_start:
-        return next_lesson
-    return None
-
-async def notification_worker(bot: Bot):
-    logger.info(f"Уведомитель запущен (за {NOTIFY_BEFORE_MINUTES} мин до урока, часовой пояс {TIMEZONE})")
+
+    def __init__(self, date: datetime.date, key: tuple, users, snapshot, last_messages: dict[int, int]):
+        self.date = date
+        self.key = key
+        self.last_messages = last_messages
+        by_class = {}
+        for user_id, class_name, profile in users:
+            by_class.setdefault((class_name, profile), []).append(user_id)
+
+        day_name = WEEKDAY_MAP[date.weekday()]
+        self.slots: dict[int, list[DispatchGroup]] = {}
+        for (class_name, profile), user_ids in by_class.items():
+            for lesson_num, subject, room in snapshot.get_schedule(class_name, profile, day_name):
+                self.slots.setdefault(lesson_num, []).append(
+                    DispatchGroup(class_name, profile, subject, room, tuple(user_ids))
+                )
+
+    def groups(self, lesson_number: int) -> list[DispatchGroup]:
+        return self.slots.get(lesson_number, [])
+
+    def recipients(self, lesson_number: int) -> int:
+        return sum(len(group.user_ids) for group in self.groups(lesson_number))
+
+
+_plan: DispatchPlan | None = None
+
+
+def _plan_key(date: datetime.date, lease: ShardLease | None) -> tuple:
+    return date, get_snapshot().version, db_async.users_version, lease.shards if lease else None
+
+
+async def get_dispatch_plan(date: datetime.date, lease: ShardLease | None = None,
+                            refresh: bool = False) -> DispatchPlan:
+    """
+    Возвращает план на дату, перестраивая его только при изменении данных.
+    С lease в план попадают только подписчики долей этого процесса; refresh —
+    перестроить в любом случае (отдельный процесс не видит изменений users в боте).
+    """
+    global _plan
+    key = _plan_key(date, lease)
+    if refresh or _plan is None or _plan.key != key:
+        users = await get_all_users_with_notify()
+        if lease is not None:
+            users = [user for user in users if lease.owns(user[0])]
+        last_messages = await get_last_notifications()
+        _plan = DispatchPlan(date, key, users, get_snapshot(), last_messages)
+        logger.info(f"План уведомлений на {date} построен: {len(users)} подписчиков, уроков {len(_plan.slots)}")
+    return _plan
+
+
+def notify_time(date: datetime.date, lesson_number: int) -> datetime.datetime:
+    return clock.lesson_start(date, lesson_number) - datetime.timedelta(minutes=NOTIFY_BEFORE_MINUTES)
+
+
+def next_fire(now: datetime.datetime, last_fired: tuple | None) -> tuple[datetime.datetime, datetime.date, int]:
+    """
+    Ближайшая рассылка после last_fired = (дата, урок): (время отправки, дата, номер урока).
+    Если окно уведомления (за NOTIFY_BEFORE_MINUTES до начала урока) уже открыто, время отправки — сейчас.
+    """
+    date = now.date()
     while True:
+        if date.weekday() < 5:
+            for lesson_number in range(1, len(LESSON_TIMES) + 1):
+                if last_fired is not None and (date, lesson_number) <= last_fired:
+                    continue
+                if now >= clock.lesson_start(date, lesson_number):
+                    continue
+                return max(now, notify_time(date, lesson_number)), date, lesson_number
+        date += datetime.timedelta(days=1)
+
+
+def open_waves(now: datetime.datetime, last_fired: tuple | None) -> list[tuple[datetime.date, int]]:
+    """Уже разосланные волны, уроки которых ещё не начались: [(дата, урок)]"""
+    if last_fired is None:
+        return []
+    date = now.date()
+    return [(date, lesson_number) for lesson_number in range(1, len(LESSON_TIMES) + 1)
+            if (date, lesson_number) <= last_fired
+            and notify_time(date, lesson_number) <= now < clock.lesson_start(date, lesson_number)]
+
+
+def format_notification(lesson_number: int, subject: str, room: str) -> str:
+    start_time = LESSON_TIMES[lesson_number - 1][0].strftime('%H:%M')
+    return (
+        f"🔔 <b>Скоро урок ({lesson_number})</b>\n"
+        f"📚 {subject}\n"
+        f"🚪 Кабинет: {room}\n"
+        f"⏰ Начало в {start_time}\n"
+    )
+
+
+async def deliver(bot: Bot, user_id: int, text: str, last_msg_id: int | None):
+    """Удаляет предыдущее уведомление пользователя и отправляет новое"""
+    if last_msg_id:
         try:
-            now = datetime.datetime.now(tz)
-            # Выходные пропускаем
-            if now.weekday() >= 5:
-                await asyncio.sleep(60)
+            await bot.delete_message(chat_id=user_id, message_id=last_msg_id)
+            logger.debug(f"Удалено предыдущее уведомление для user {user_id}")
+        except Exception as e:
+            logger.debug(f"Не удалось удалить предыдущее уведомление для {user_id}: {e}")
+    return await bot.send_message(user_id, text, parse_mode="HTML")
+
+
+async def send_wave(bot: Bot, plan: DispatchPlan, lesson_number: int, owner: str = PROCESS_OWNER):
+    """
+    Отправляет уведомления об уроке всем получателям из плана через общую очередь исходящих.
+    Получатели сначала занимаются в sent_notifications (claim_notifications), поэтому
+    каждый получит уведомление один раз, даже если волну повторит другой процесс-уведомитель.
+    К БД — занять получателей, записывать доставленные (раз в RECORD_INTERVAL) и освободить
+    не доставленные, если были ошибки отправки.
+    """
+    logger.info(f"Рассылка уведомлений об уроке {lesson_number}: {plan.recipients(lesson_number)} получателей")
+    started = time.perf_counter()
+    date_str = plan.date.isoformat()
+    candidates = [user_id for group in plan.groups(lesson_number) for user_id in group.user_ids]
+    claimed = set(await claim_notifications(date_str, lesson_number, candidates, owner, time.time(), CLAIM_TIMEOUT))
+    if len(claimed) < len(candidates):
+        logger.debug(f"Урок {lesson_number}: {len(candidates) - len(claimed)} получателей уже уведомлены")
+    pending = {}
+    for group in plan.groups(lesson_number):
+        text = format_notification(lesson_number, group.subject, group.room)
+        for user_id in group.user_ids:
+            if user_id not in claimed:
                 continue
+            last_msg_id = plan.last_messages.get(user_id)
+            pending[user_id] = outbound.submit(
+                lambda uid=user_id, t=text, last=last_msg_id: deliver(bot, uid, t, last),
+                chat_id=user_id,
+                priority=PRIORITY_NOTIFY
+            )
 
-            next_lesson_to_notify = should_notify_now(now.time())
-            if next_lesson_to_notify is not None:
-                users = get_all_users_with_notify()
-                logger.debug(f"Проверка уведомлений для {len(users)} пользователей (урок {next_lesson_to_notify})")
-                for user_id, class_name, profile in users:
-                    logger.debug(f"Обработка user {user_id}, класс {class_name}")
-                    if check_notification_sent(user_id, next_lesson_to_notify):
-                        logger.debug(f"Уведомление для урока {next_lesson_to_notify} уже отправлено user {user_id}")
-                        continue
-
-                    today_name = WEEKDAY_MAP[now.weekday()]
-                    schedule = get_schedule(class_name, profile, today_name)
-                    lesson_info = None
-                    for lesson_num, subject, room in schedule:
-                        if lesson_num == next_lesson_to_notify:
-                            lesson_info = (subject, room)
-                            break
-                    if lesson_info:
-                        logger.info(f"Найден урок {next_lesson_to_notify} для user {user_id}: {subject} {room}")
-                        subject, room = lesson_info
-                        start_time = LESSON_TIMES[next_lesson_to_notify-1][0].strftime('%H:%M')
-                        text = (
-                            f"🔔 <b>Скоро урок ({next_lesson_to_notify})</b>\n"
-                            f"📚 {subject}\n"
-                            f"🚪 Кабинет: {room}\n"
-                            f"⏰ Начало в {start_time}\n"
-                        )
-
-                        # Удаление предыдущего уведомления
-                        last_msg_id = get_last_notification(user_id)
-                        if last_msg_id:
-                            try:
-                                await bot.delete_message(chat_id=user_id, message_id=last_msg_id)
-                                logger.info(f"Удалено предыдущее уведомление для user {user_id}")
-                            except Exception as e:
-                                logger.debug(f"Не удалось удалить предыдущее уведомление для {user_id}: {e}")
-
-                        try:
-                            sent_msg = await bot.send_message(user_id, text, parse_mode="HTML")
-                            set_last_notification(user_id, sent_msg.message_id)
-                            mark_notification_sent(user_id, next_lesson_to_notify)
-                            logger.info(f"Уведомление отправлено пользователю {user_id} (урок {next_lesson_to_notify})")
-                        except Exception as e:
-                            logger.error(f"Ошибка отправки пользователю {user_id}: {e}")
-                    else:
-                        logger.debug(f"Урок {next_lesson_to_notify} не найден в расписании user {user_id}")
-            await asyncio.sleep(60)  # проверка каждую минуту
-        except Exception as e:
+    # Результаты — в порядке завершения, чтобы застрявшая отправка не задерживала запись остальных
+    completed = asyncio.Queue()
+    for user_id, future in pending.items():
+        future.add_done_callback(lambda f, uid=user_id: completed.put_nowait((uid, f)))
+    delivered = []
+    batch = []
+    failed = []
+    left = len(pending)
+    record_at = time.monotonic() + RECORD_INTERVAL
+    while left:
+        try:
+            user_id, future = await asyncio.wait_for(completed.get(), max(0.0, record_at - time.monotonic()))
+        except asyncio.TimeoutError:
+            future = None
+        if future is not None:
+            left -= 1
+            error = future.exception() if not future.cancelled() else asyncio.CancelledError()
+            if error is not None:
+                logger.error(f"Ошибка отправки пользователю {user_id}: {error}")
+                failed.append(user_id)
+            else:
+                message = future.result()
+                plan.last_messages[user_id] = message.message_id
+                batch.append((user_id, message.message_id))
+        if batch and (not left or time.monotonic() >= record_at):
+            await record_notifications(date_str, lesson_number, batch)
+            delivered += batch
+            batch = []
+        if time.monotonic() >= record_at:
+            record_at = time.monotonic() + RECORD_INTERVAL
+
+    if failed:
+        # Не доставленные освобождаем: отметка в sent_notifications означает отправленное уведомление
+        await release_notifications(date_str, lesson_number, failed, owner)
+    WAVE_RECIPIENTS.observe(len(pending))
+    WAVE_SECONDS.observe(time.perf_counter() - started)
+    if len(pending) > len(delivered):
+        WAVE_FAILURES.inc(amount=len(pending) - len(delivered))
+    logger.info(f"Урок {lesson_number}: отправлено {len(delivered)} из {len(pending)} уведомлений")
+
+
+async def _wait(delay: float, lease: ShardLease | None) -> bool:
+    """Ждёт delay секунд; с lease возвращает True раньше срока, если процессу достались новые доли"""
+    if lease is None:
+        await asyncio.sleep(delay)
+        return False
+    try:
+        await asyncio.wait_for(lease.acquired.wait(), timeout=delay)
+    except asyncio.TimeoutError:
+        return False
+    return True
+
+
+async def catch_up(bot: Bot, lease: ShardLease, last_fired: tuple | None):
+    """
+    Процессу достались новые доли: волны, которые уже прошли, а уроки ещё не начались,
+    повторяются по его подписчикам. Так уведомление получат подписчики доли, которая была
+    без владельца или у упавшего процесса; кому уже отправлено, отсеет claim_notifications.
+    """
+    lease.acquired.clear()
+    waves = open_waves(clock.now(), last_fired)
+    if not waves:
+        return
+    await sync_snapshot()
+    for date, lesson_number in waves:
+        logger.info(f"Урок {lesson_number}: новые доли {sorted(lease.shards)}, повторная волна")
+        plan = await get_dispatch_plan(date, lease, refresh=True)
+        await send_wave(bot, plan, lesson_number, lease.owner)
+
+
+async def notification_worker(bot: Bot, lease: ShardLease | None = None):
+    """
+    Рассылает уведомления перед каждым уроком. Без lease — всем подписчикам (в процессе бота),
+    с lease — только подписчикам долей этого процесса-уведомителя.
+    """
+    logger.info(f"Уведомитель запущен (за {NOTIFY_BEFORE_MINUTES} мин до урока, часовой пояс {TIMEZONE})")
+    last_fired = None
+    while True:
+        try:
+            now = clock.now()
+            fire_at, date, lesson_number = next_fire(now, last_fired)
+            delay = (fire_at - now).total_seconds()
+            if delay > 0:
+                logger.debug(f"Следующая рассылка: урок {lesson_number} {date} в {fire_at:%H:%M}")
+                if await _wait(delay, lease):
+                    await catch_up(bot, lease, last_fired)
+                    continue
+
+            lesson_start = clock.lesson_start(date, lesson_number)
+            if lease is not None and not lease.shards:
+                logger.info(f"Урок {lesson_number}: у процесса нет долей, рассылка пропущена")
+            elif clock.now() < lesson_start:
+                if lease is not None:
+                    # Расписание и подписчиков меняет процесс бота — сверяем и перечитываем перед каждой волной
+                    await sync_snapshot()
+                    plan = await get_dispatch_plan(date, lease, refresh=True)
+                else:
+                    plan = await get_dispatch_plan(date)
+                await send_wave(bot, plan, lesson_number, lease.owner if lease else PROCESS_OWNER)
+            else:
+                logger.warning(f"Урок {lesson_number} уже начался, рассылка пропущена")
+            last_fired = (date, lesson_number)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
             logger.exception("Ошибка в notification_worker")
-            await asyncio.sleep(60)
\ No newline at end of file
+            await asyncio.sleep(60)
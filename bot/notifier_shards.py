@@ -0,0 +1,74 @@
+"""
+Распределение подписчиков между процессами-уведомителями.
+Подписчики делятся на NOTIFIER_SHARDS долей по user_id; каждый процесс раз в треть
+срока аренды отмечается в БД (пульс) и получает свои доли — поровну между живыми
+процессами. Доли умершего процесса забирают остальные, когда истечёт его аренда;
+при перераспределении между живыми доля переходит одной транзакцией.
+Получив новые доли, процесс повторяет уже начатые волны (notifier.catch_up) — так
+до подписчиков доходят уведомления, разосланные, пока доля была без владельца или
+у упавшего процесса. Повторную отправку исключает claim_notifications: отметка в
+sent_notifications ставится до отправки.
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+
+from bot import db_async
+from bot.config import NOTIFIER_SHARDS, NOTIFIER_LEASE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Кем этот процесс подписывает отметки claim_notifications, если у него нет аренды долей
+PROCESS_OWNER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+def shard_of(user_id: int, total: int = NOTIFIER_SHARDS) -> int:
+    return user_id % total
+
+
+class ShardLease:
+    def __init__(self, total: int = NOTIFIER_SHARDS, lease_seconds: float = NOTIFIER_LEASE_SECONDS,
+                 owner: str | None = None):
+        self.total = total
+        self.lease_seconds = lease_seconds
+        self.owner = owner or PROCESS_OWNER
+        self.shards: frozenset[int] = frozenset()
+        # Взводится, когда процессу достались доли, которых у него не было
+        self.acquired = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def owns(self, user_id: int) -> bool:
+        return shard_of(user_id, self.total) in self.shards
+
+    async def renew(self):
+        shards = frozenset(await db_async.claim_notifier_shards(
+            self.owner, self.total, time.time(), self.lease_seconds))
+        if shards != self.shards:
+            logger.info(f"Уведомитель {self.owner}: доли {sorted(shards)} из {self.total}")
+            if shards - self.shards:
+                self.acquired.set()
+            self.shards = shards
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                await self.renew()
+            except Exception as e:
+                # Без пульса аренда истечёт, и доли заберут другие процессы;
+                # пока она не истекла, продолжаем рассылать по своим
+                logger.error(f"Не удалось продлить аренду долей {self.owner}: {e}")
+
+    async def start(self):
+        await self.renew()
+        self._task = asyncio.create_task(self._heartbeat())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        await db_async.release_notifier_shards(self.owner)
+        self.shards = frozenset()
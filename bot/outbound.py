@@ -0,0 +1,288 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import logging
+import time
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+
+from bot.config import (
+    OUTBOUND_GLOBAL_RATE,
+    BOT_GLOBAL_RATE,
+    OUTBOUND_CHAT_INTERVAL,
+    OUTBOUND_INTERACTIVE_RESERVE,
+    OUTBOUND_WORKERS,
+    OUTBOUND_MAX_RETRIES
+)
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты исходящих запросов: меньше — важнее
+PRIORITY_INTERACTIVE = 0  # ответы на нажатия кнопок
+PRIORITY_NOTIFY = 1       # уведомления о начале урока
+PRIORITY_BULK = 2         # массовые рассылки
+
+# Приоритет текущего запроса к Bot API; воркеры очереди выставляют его для своих задач
+current_priority = contextvars.ContextVar('outbound_priority', default=PRIORITY_INTERACTIVE)
+# Запрос выполняет воркер очереди (тогда 429 повторяет очередь, а не RateLimitMiddleware)
+in_queue = contextvars.ContextVar('outbound_in_queue', default=False)
+
+# Прямой вызов из хендлера повторяем после 429, только если ждать не дольше стольких секунд:
+# дольше пользователь ждать ответа на нажатие не станет
+INTERACTIVE_RETRY_LIMIT = 5
+# Резерв под ответы на нажатия действует, пока они были не дольше стольких секунд назад;
+# без нажатий уведомления и рассылки идут на полном лимите
+INTERACTIVE_RESERVE_WINDOW = 2.0
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def take(self) -> float:
+        """Забирает токен и возвращает 0 или возвращает, сколько секунд ждать следующего"""
+        now = time.monotonic()
+        if now < self.paused_until:
+            return self.paused_until - now
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def give_back(self):
+        """Возвращает взятый, но не использованный токен"""
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class RateLimiter:
+    """
+    Ограничения Telegram на отправку: общий лимит сообщений в секунду на бота
+    и минимальный интервал между сообщениями в один чат.
+    Когда общий лимит исчерпан, первыми проходят запросы с более важным приоритетом.
+    Пока идут ответы на нажатия, уведомлениям и рассылкам достаётся не больше
+    (1 - interactive_reserve) лимита — остальное остаётся свободным для нажатий.
+    """
+
+    def __init__(self, global_rate: float = OUTBOUND_GLOBAL_RATE, chat_interval: float = OUTBOUND_CHAT_INTERVAL,
+                 interactive_reserve: float = OUTBOUND_INTERACTIVE_RESERVE):
+        # небольшой запас на всплеск, чтобы за любую секунду не выйти за global_rate заметно
+        self._bucket = TokenBucket(global_rate, capacity=max(1.0, global_rate / 10))
+        # Второе ведро — для уведомлений и рассылок: они берут токен из обоих
+        self._background = None
+        if interactive_reserve > 0:
+            background_rate = global_rate * (1 - interactive_reserve)
+            self._background = TokenBucket(background_rate, capacity=max(1.0, background_rate / 10))
+        self._interactive_at = float('-inf')
+        self._chat_interval = chat_interval
+        self._chat_next: dict[int, float] = {}
+        self._waiters = []
+        self._seq = itertools.count()
+        self._pump_task = None
+
+    async def acquire(self, chat_id, priority: int):
+        if priority == PRIORITY_INTERACTIVE:
+            self._interactive_at = time.monotonic()
+        if chat_id is not None:
+            await self._acquire_chat(chat_id)
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        if self._pump_task is None or self._pump_task.done():
+            self._pump_task = asyncio.create_task(self._pump())
+        await future
+
+    async def _acquire_chat(self, chat_id):
+        now = time.monotonic()
+        slot = max(now, self._chat_next.get(chat_id, 0.0))
+        self._chat_next[chat_id] = slot + self._chat_interval
+        if len(self._chat_next) > 10000:
+            self._chat_next = {c: t for c, t in self._chat_next.items() if t > now}
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    async def _pump(self):
+        while self._waiters:
+            wait = self._bucket.take()
+            if wait:
+                await asyncio.sleep(wait)
+                continue
+            priority, _seq, future = self._waiters[0]
+            if future.done():
+                # ожидающий отменён — токен достаётся следующему
+                heapq.heappop(self._waiters)
+                self._bucket.give_back()
+                continue
+            if (priority > PRIORITY_INTERACTIVE and self._background is not None
+                    and time.monotonic() - self._interactive_at < INTERACTIVE_RESERVE_WINDOW):
+                wait = self._background.take()
+                if wait:
+                    # Доля фоновых исчерпана: токен остаётся ответам на нажатия, которые придут за это время
+                    self._bucket.give_back()
+                    await asyncio.sleep(wait)
+                    continue
+            heapq.heappop(self._waiters)
+            future.set_result(None)
+
+    def retry_after(self, chat_id, seconds: float):
+        """Telegram ответил 429: не пишем в этот чат (или никуда, если чат неизвестен) seconds секунд"""
+        if chat_id is None:
+            self._bucket.pause(seconds)
+            return
+        now = time.monotonic()
+        self._chat_next[chat_id] = max(self._chat_next.get(chat_id, 0.0), now + seconds)
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+
+class RateLimitMiddleware(BaseRequestMiddleware):
+    """
+    Пропускает каждый запрос к Bot API, адресованный чату, через общий RateLimiter.
+    Интервал между сообщениями в один чат соблюдается только для send*-методов:
+    правка и удаление сообщений идут лишь под общим лимитом.
+    Вызовы из хендлеров (не из OutboundQueue) после 429 повторяются здесь же.
+    """
+
+    def __init__(self, limiter: RateLimiter, max_retries: int = OUTBOUND_MAX_RETRIES):
+        self.limiter = limiter
+        self.max_retries = max_retries
+
+    async def __call__(self, make_request, bot, method):
+        chat_id = getattr(method, 'chat_id', None)
+        per_chat = type(method).__name__.startswith('Send')
+        attempts = 0
+        while True:
+            if chat_id is not None:
+                await self.limiter.acquire(chat_id if per_chat else None, current_priority.get())
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                # Запросы без чата (answerCallbackQuery) лимитер не пропускает через себя,
+                # и их 429 не повод останавливать всю отправку — повторяем только сам запрос
+                if chat_id is not None:
+                    self.limiter.retry_after(chat_id, e.retry_after)
+                attempts += 1
+                if in_queue.get() or attempts > self.max_retries or e.retry_after > INTERACTIVE_RETRY_LIMIT:
+                    raise
+                logger.warning(f"Flood control на {type(method).__name__}: повтор через {e.retry_after} с")
+                await asyncio.sleep(e.retry_after)
+
+
+class _Job:
+    __slots__ = ('factory', 'chat_id', 'priority', 'future', 'attempts')
+
+    def __init__(self, factory, chat_id, priority, future):
+        self.factory = factory
+        self.chat_id = chat_id
+        self.priority = priority
+        self.future = future
+        self.attempts = 0
+
+
+class OutboundQueue:
+    """
+    Общая очередь исходящих сообщений с пулом воркеров.
+    Задача — функция без аргументов, возвращающая корутину (например, lambda: bot.send_message(...)).
+    Темп отправки задаёт RateLimitMiddleware, очередь отвечает за параллельность,
+    порядок по приоритету и повтор после TelegramRetryAfter.
+    """
+
+    def __init__(self, workers: int = OUTBOUND_WORKERS, max_retries: int = OUTBOUND_MAX_RETRIES):
+        self._queue = asyncio.PriorityQueue()
+        self._seq = itertools.count()
+        self._workers_count = workers
+        self._workers = []
+        self._max_retries = max_retries
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+
+    def start(self):
+        if not self._workers:
+            self._workers = [
+                asyncio.create_task(self._worker(), name=f"outbound-{i}")
+                for i in range(self._workers_count)
+            ]
+            logger.info(f"Очередь исходящих сообщений запущена ({self._workers_count} воркеров)")
+
+    async def stop(self):
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def submit(self, factory, chat_id=None, priority: int = PRIORITY_BULK) -> asyncio.Future:
+        """Ставит задачу в очередь; future получит результат вызова или исключение"""
+        self.start()
+        job = _Job(factory, chat_id, priority, asyncio.get_running_loop().create_future())
+        self._put(job)
+        return job.future
+
+    async def send(self, factory, chat_id=None, priority: int = PRIORITY_BULK):
+        return await self.submit(factory, chat_id, priority)
+
+    def _put(self, job: _Job):
+        self._queue.put_nowait((job.priority, next(self._seq), job))
+
+    async def _worker(self):
+        while True:
+            _priority, _seq, job = await self._queue.get()
+            token = current_priority.set(job.priority)
+            queued = in_queue.set(True)
+            try:
+                job.attempts += 1
+                result = await job.factory()
+            except TelegramRetryAfter as e:
+                if job.attempts <= self._max_retries:
+                    self.retried += 1
+                    logger.warning(f"Flood control для чата {job.chat_id}: повтор через {e.retry_after} с")
+                    asyncio.get_running_loop().call_later(e.retry_after, self._put, job)
+                else:
+                    self.failed += 1
+                    if not job.future.done():
+                        job.future.set_exception(e)
+            except Exception as e:
+                self.failed += 1
+                if not job.future.done():
+                    job.future.set_exception(e)
+            else:
+                self.sent += 1
+                if not job.future.done():
+                    job.future.set_result(result)
+            finally:
+                in_queue.reset(queued)
+                current_priority.reset(token)
+                self._queue.task_done()
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def stats(self) -> dict:
+        return {
+            'depth': self.depth,
+            'sent': self.sent,
+            'failed': self.failed,
+            'retried': self.retried,
+        }
+
+
+# Лимит процесса бота; процессы-уведомители заменяют его своей долей (scripts/notifier_workers.py)
+limiter = RateLimiter(BOT_GLOBAL_RATE)
+outbound = OutboundQueue()
+
+
+def install(bot):
+    """Подключает общий лимитер ко всем запросам бота"""
+    bot.session.middleware(RateLimitMiddleware(limiter))
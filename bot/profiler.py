@@ -0,0 +1,54 @@
+"""
+Профилирование по запросу: в течение заданного времени периодически снимает стеки
+всех потоков процесса и возвращает их в collapsed-формате (одна строка на стек:
+"поток;функция;...;функция количество"), который понимают flamegraph.pl и speedscope.
+Снятие стеков идёт в отдельном потоке, бот продолжает работать.
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+from bot.config import PROFILE_INTERVAL, PROFILE_MAX_SECONDS
+
+_running = threading.Lock()
+
+
+class ProfilerBusy(Exception):
+    """Профилирование уже запущено другим запросом"""
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def sample(seconds: float, interval: float = PROFILE_INTERVAL) -> Counter:
+    """Снимает стеки всех потоков, кроме своего, каждые interval секунд; возвращает {стек: количество}"""
+    seconds = max(0.1, min(seconds, PROFILE_MAX_SECONDS))
+    if not _running.acquire(blocking=False):
+        raise ProfilerBusy()
+    try:
+        own = threading.get_ident()
+        stacks = Counter()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                labels.append(names.get(ident, str(ident)))
+                stacks[';'.join(reversed(labels))] += 1
+            time.sleep(interval)
+        return stacks
+    finally:
+        _running.release()
+
+
+def collapsed(stacks: Counter) -> str:
+    return ''.join(f"{stack} {count}\n" for stack, count in stacks.most_common())
@@ -0,0 +1,116 @@
+import asyncio
+import datetime
+import logging
+from aiogram import Bot
+from bot import clock
+from bot.db_async import (
+    get_change_cursor,
+    set_change_cursor,
+    get_replacement_changes,
+    get_replacements_seq,
+    get_subscribers_by_classes
+)
+from bot.outbound import outbound, PRIORITY_BULK
+from bot.utils import format_replacement_changes, replacements_version, set_replacements_version
+from bot.config import LESSON_TIMES
+
+logger = logging.getLogger(__name__)
+
+# Имя курсора в change_cursors: seq последнего разосланного изменения замен
+CURSOR = 'replacements_push'
+# Сколько записей журнала читать за один запрос
+BATCH_SIZE = 1000
+
+_lock = asyncio.Lock()
+
+
+async def init_push_cursor():
+    """При первом запуске начинаем с текущего конца журнала, чтобы не рассылать старые изменения"""
+    if await get_change_cursor(CURSOR) is None:
+        seq = await get_replacements_seq()
+        await set_change_cursor(CURSOR, seq)
+        logger.info(f"Курсор рассылки изменений замен установлен на seq {seq}")
+
+
+def _is_upcoming(date: str, lesson_number: int, now: datetime.datetime) -> bool:
+    """Урок ещё не закончился (о прошедших изменениях сообщать незачем)"""
+    today = now.date().isoformat()
+    if date != today:
+        return date > today
+    if not 1 <= lesson_number <= len(LESSON_TIMES):
+        return True
+    return now.time() < LESSON_TIMES[lesson_number - 1][1]
+
+
+def collapse_changes(changes, now: datetime.datetime) -> dict[str, list[tuple]]:
+    """
+    Записи журнала -> {класс: [(op, date, lesson_number, subject, teacher, room)]}.
+    Несколько правок одного урока схлопываются в последнюю; замена, добавленная
+    и удалённая в пределах пачки, не попадает в сообщение вовсе.
+    """
+    first_op = {}
+    last = {}
+    for seq, op, date, lesson_number, class_name, subject, teacher, room in changes:
+        key = (class_name, date, lesson_number)
+        first_op.setdefault(key, op)
+        last[key] = (op, date, lesson_number, subject, teacher, room)
+
+    by_class = {}
+    for (class_name, date, lesson_number), change in last.items():
+        if change[0] == 'removed' and first_op[(class_name, date, lesson_number)] == 'added':
+            continue
+        if not _is_upcoming(date, lesson_number, now):
+            continue
+        by_class.setdefault(class_name, []).append(change)
+    return by_class
+
+
+async def push_replacement_changes(bot: Bot) -> int:
+    """
+    Рассылает новые записи журнала replacement_changes подписчикам затронутых классов:
+    одно сообщение на пользователя со всеми его изменениями. Возвращает число отправленных сообщений.
+    """
+    async with _lock:
+        cursor = await get_change_cursor(CURSOR)
+        if cursor is None:
+            await init_push_cursor()
+            return 0
+
+        changes = []
+        while True:
+            batch = await get_replacement_changes(cursor, BATCH_SIZE)
+            changes.extend(batch)
+            if len(batch) < BATCH_SIZE:
+                break
+            cursor = batch[-1][0]
+        if not changes:
+            return 0
+        last_seq = changes[-1][0]
+        # Пользователь откроет экран замен по кнопке из сообщения — к этому моменту
+        # кэш уже должен считать замены до last_seq (версия — тот же seq журнала)
+        if last_seq > replacements_version():
+            set_replacements_version(last_seq)
+
+        by_class = collapse_changes(changes, clock.now())
+        subscribers = await get_subscribers_by_classes(list(by_class))
+        texts = {class_name: format_replacement_changes(class_changes) for class_name, class_changes in by_class.items()}
+
+        pending = {}
+        for user_id, class_name in subscribers:
+            text = texts[class_name]
+            pending[user_id] = outbound.submit(
+                lambda uid=user_id, t=text: bot.send_message(uid, t, parse_mode="HTML"),
+                chat_id=user_id,
+                priority=PRIORITY_BULK
+            )
+        results = await asyncio.gather(*pending.values(), return_exceptions=True)
+        sent = 0
+        for user_id, result in zip(pending, results):
+            if isinstance(result, Exception):
+                logger.warning(f"Не удалось отправить изменения замен пользователю {user_id}: {result}")
+            else:
+                sent += 1
+
+        await set_change_cursor(CURSOR, last_seq)
+        logger.info(f"Изменения замен (до seq {last_seq}) по {len(by_class)} классам: отправлено {sent} из {len(pending)} сообщений")
+        return sent
@@ -1,35 +1,138 @@
+import asyncio
+import datetime
 import logging
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 from scripts.update_replacements import update_replacements
 from scripts.update_schedule import update_schedule
+from bot.db import compact_sent_notifications
+from bot.jobs import runner
+from bot import clock
+from bot.timetable import sync_snapshot
+from bot.db_async import get_replacements_seq
+from bot.utils import replacements_version, set_replacements_version
+from bot.replacement_push import push_replacement_changes
+from bot.config import NOTIFICATION_RETENTION_DAYS, PUSH_REPLACEMENTS, DATA_CHECK_INTERVAL, TIMEZONE
 
 logger = logging.getLogger(__name__)
 
-def setup_scheduler():
-    """Настраивает и возвращает планировщик задач"""
+async def _reload_snapshot_if_changed(report):
+    if report and report['changed']:
+        await sync_snapshot()
+
+async def sync_replacements_version() -> bool:
+    """Берёт версию замен для ключей кэша текстов из БД (seq журнала); True — она изменилась"""
+    seq = await get_replacements_seq()
+    if seq == replacements_version():
+        return False
+    set_replacements_version(seq)
+    return True
+
+_bot = None
+_push_tasks = set()
+
+async def _push_changes(bot):
+    try:
+        await push_replacement_changes(bot)
+    except Exception:
+        logger.exception("Ошибка рассылки изменений замен")
+
+def _start_push():
+    if PUSH_REPLACEMENTS and _bot is not None:
+        # Рассылка идёт в фоне под общим лимитом отправки и не держит задачу обновления
+        task = asyncio.create_task(_push_changes(_bot))
+        _push_tasks.add(task)
+        task.add_done_callback(_push_tasks.discard)
+
+async def check_data_versions():
+    """Подхватывает расписание и замены, обновлённые в БД другим процессом (scripts/update_*.py)"""
+    try:
+        await sync_snapshot()
+        if await sync_replacements_version():
+            logger.info(f"Замены изменились в БД: версия {replacements_version()}")
+            # Курсор рассылки отстаёт от журнала так же, как версия кэша
+            _start_push()
+    except Exception:
+        logger.exception("Ошибка проверки версий данных")
+
+async def _on_replacements_updated(report):
+    # Без изменений (таблица та же или не скачалась) закэшированные тексты остаются верными
+    if not (report and report['changed']):
+        return
+    await sync_replacements_version()
+    _start_push()
+
+async def run_update_replacements():
+    await runner.run("update_replacements", update_replacements, after=_on_replacements_updated)
+
+async def run_update_schedule():
+    """Загружает расписание в пуле задач и, если что-то изменилось, подменяет снимок в памяти бота"""
+    await runner.run("update_schedule", update_schedule, after=_reload_snapshot_if_changed)
+
+def compact_notifications():
+    """Сворачивает отметки об уведомлениях старше NOTIFICATION_RETENTION_DAYS дней"""
+    today = clock.today()
+    cutoff = today - datetime.timedelta(days=NOTIFICATION_RETENTION_DAYS)
+    return compact_sent_notifications(cutoff.isoformat())
+
+async def run_compact_notifications():
+    await runner.run("compact_notifications", compact_notifications)
+
+def setup_scheduler(bot=None):
+    """Настраивает и возвращает планировщик задач; bot нужен для рассылки изменений замен"""
+    global _bot
+    _bot = bot
     scheduler = AsyncIOScheduler()
 
     # Обновление замен каждый день в 3:00
     scheduler.add_job(
-        update_replacements,
+        run_update_replacements,
         trigger=CronTrigger(hour="*/4"),
         id="update_replacements_daily",
         name="Ежедневное обновление замен",
         replace_existing=True,
+        max_instances=1,
+        coalesce=True,
         misfire_grace_time=36000  # даём час на выполнение, если бот был выключен
     )
     logger.info("Запланировано ежедневное обновление замен в 3:00")
 
     # Обновление расписания каждые 4 дня в 3:00
     scheduler.add_job(
-        update_schedule,
+        run_update_schedule,
         trigger=CronTrigger(hour="*/8"),
         id="update_schedule_every_4_days",
         name="Обновление расписания раз в 4 дня",
         replace_existing=True,
+        max_instances=1,
+        coalesce=True,
         misfire_grace_time=36000
     )
     logger.info("Запланировано обновление расписания каждые 4 дня в 3:00")
 
-    return scheduler
\ No newline at end of file
+    # Сверка расписания и замен в памяти с БД
+    scheduler.add_job(
+        check_data_versions,
+        trigger=IntervalTrigger(seconds=DATA_CHECK_INTERVAL),
+        id="check_data_versions",
+        name="Сверка версий расписания и замен с БД",
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True
+    )
+
+    # Сжатие истории уведомлений раз в сутки, ночью
+    scheduler.add_job(
+        run_compact_notifications,
+        trigger=CronTrigger(hour=3, minute=30, timezone=TIMEZONE),
+        id="compact_notifications_daily",
+        name="Сжатие истории уведомлений",
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True,
+        misfire_grace_time=36000
+    )
+    logger.info(f"Запланировано ежедневное сжатие истории уведомлений (хранится {NOTIFICATION_RETENTION_DAYS} дн.)")
+
+    return scheduler
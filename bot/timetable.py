@@ -0,0 +1,248 @@
+import logging
+import re
+import sys
+import threading
+from array import array
+from typing import Optional
+
+from bot import db
+from bot.config import DAYS, LESSON_TIMES
+from bot.db_async import get_pool
+
+logger = logging.getLogger(__name__)
+
+_parallel_re = re.compile(r'^(\d+)')
+_letter_re = re.compile(r'^\d+([а-яА-Я]+)')
+
+LESSONS_PER_DAY = len(LESSON_TIMES)
+_DAY_INDEX = {day: i for i, day in enumerate(DAYS)}
+# В сетке класса на каждый урок два кода: предмет и кабинет
+_GRID_SIZE = len(DAYS) * LESSONS_PER_DAY * 2
+
+
+def _slot(day_index: int, lesson_number: int) -> int:
+    return (day_index * LESSONS_PER_DAY + lesson_number - 1) * 2
+
+
+class StringTable:
+    """Интернированные строки: каждая хранится один раз, в сетке расписания — её номер (0 — пустая строка)"""
+    __slots__ = ('_strings', '_codes')
+
+    def __init__(self):
+        self._strings = ['']
+        self._codes = {'': 0}
+
+    def code(self, value: str) -> int:
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self._strings)
+            self._strings.append(sys.intern(value))
+        return code
+
+    def __getitem__(self, code: int) -> str:
+        return self._strings[code]
+
+    def __len__(self):
+        return len(self._strings)
+
+
+class Lesson:
+    """Урок из снимка; распаковывается как кортеж (урок, предмет, кабинет)"""
+    __slots__ = ('day', 'number', 'subject', 'room')
+
+    def __init__(self, day: str, number: int, subject: str, room: str):
+        self.day = day
+        self.number = number
+        self.subject = subject
+        self.room = room
+
+    def __iter__(self):
+        yield self.number
+        yield self.subject
+        yield self.room
+
+    def __repr__(self):
+        return f"Lesson({self.day!r}, {self.number}, {self.subject!r}, {self.room!r})"
+
+
+class WeekLesson(Lesson):
+    """Урок в расписании на неделю; распаковывается как (день, урок, предмет, кабинет)"""
+    __slots__ = ()
+
+    def __iter__(self):
+        yield self.day
+        yield self.number
+        yield self.subject
+        yield self.room
+
+
+class TimetableSnapshot:
+    """
+    Неизменяемый индекс расписания всей школы; чтение не обращается к БД.
+    Предметы и кабинеты хранятся в таблицах строк, а расписание каждого класса (с профилем) —
+    плотным массивом кодов: дни x уроки x (предмет, кабинет). Урок по (класс, день, номер)
+    находится индексной арифметикой; уроки отдаются лёгкими объектами Lesson поверх массива.
+    Снимок не меняется, поэтому кортежи get_schedule собираются один раз на (класс, профиль, день)
+    и дальше отдаются из _views — горячий путь меню не создаёт объектов.
+    """
+    __slots__ = ('version', '_subjects', '_rooms', '_grids', '_count', '_classes', '_parallels', '_letters', '_views')
+
+    def __init__(self, rows, version: int):
+        self.version = version
+        self._subjects = StringTable()
+        self._rooms = StringTable()
+        self._grids: dict[tuple, array] = {}
+        self._views: dict[tuple, tuple] = {}
+        self._count = 0
+        for class_name, profile, day, lesson_number, subject, room in rows:
+            day_index = _DAY_INDEX.get(day)
+            if day_index is None or not 1 <= lesson_number <= LESSONS_PER_DAY:
+                logger.warning(f"Урок вне сетки расписания пропущен: {class_name} {profile} {day} {lesson_number}")
+                continue
+            grid = self._grids.get((class_name, profile))
+            if grid is None:
+                grid = self._grids[(class_name, profile)] = array('H', bytes(_GRID_SIZE * 2))
+            slot = _slot(day_index, lesson_number)
+            if not grid[slot]:
+                self._count += 1
+            grid[slot] = self._subjects.code(subject)
+            grid[slot + 1] = self._rooms.code(room)
+
+        self._classes = tuple(sorted(self._grids, key=lambda c: (c[0], c[1] or '')))
+
+        letters = {}
+        for class_name in {c for c, _ in self._classes}:
+            m_parallel = _parallel_re.match(class_name)
+            m_letter = _letter_re.match(class_name)
+            if m_parallel and m_letter:
+                letters.setdefault(m_parallel.group(1), set()).add(m_letter.group(1))
+        self._parallels = tuple(sorted(letters, key=int))
+        self._letters = {p: tuple(sorted(ls)) for p, ls in letters.items()}
+
+    def __len__(self):
+        return self._count
+
+    def _lesson(self, grid, day_index: int, number: int, view=Lesson) -> Optional[Lesson]:
+        slot = _slot(day_index, number)
+        subject = grid[slot]
+        if not subject:
+            return None
+        return view(DAYS[day_index], number, self._subjects[subject], self._rooms[grid[slot + 1]])
+
+    def lesson(self, class_name: str, profile: Optional[str], day: str, number: int) -> Optional[Lesson]:
+        """Один урок или None"""
+        grid = self._grids.get((class_name, profile))
+        day_index = _DAY_INDEX.get(day)
+        if grid is None or day_index is None or not 1 <= number <= LESSONS_PER_DAY:
+            return None
+        return self._lesson(grid, day_index, number)
+
+    def get_schedule(self, class_name: str, profile: Optional[str], day: Optional[str] = None) -> tuple:
+        """То же, что bot.db.get_schedule: (урок, предмет, кабинет) за день или (день, урок, предмет, кабинет) за неделю"""
+        key = (class_name, profile, day)
+        lessons = self._views.get(key)
+        if lessons is None:
+            grid = self._grids.get((class_name, profile))
+            # Неизвестные класс и день не запоминаем, чтобы произвольные ключи не раздували кэш
+            if grid is None or (day and day not in _DAY_INDEX):
+                return ()
+            # Гонка потоков безопасна: оба соберут одинаковый кортеж
+            lessons = self._views[key] = self._build_schedule(grid, day)
+        return lessons
+
+    def _build_schedule(self, grid, day: Optional[str]) -> tuple:
+        if day:
+            days, view = (_DAY_INDEX[day],), Lesson
+        else:
+            days, view = range(len(DAYS)), WeekLesson
+        # Списки строк напрямую: вызов StringTable.__getitem__ на каждый урок заметно дороже
+        subjects = self._subjects._strings
+        rooms = self._rooms._strings
+        lessons = []
+        for day_index in days:
+            slot = _slot(day_index, 1)
+            day_name = DAYS[day_index]
+            for number in range(1, LESSONS_PER_DAY + 1):
+                subject = grid[slot]
+                if subject:
+                    lessons.append(view(day_name, number, subjects[subject], rooms[grid[slot + 1]]))
+                slot += 2
+        return tuple(lessons)
+
+    def stats(self) -> dict:
+        return {
+            'version': self.version,
+            'lessons': self._count,
+            'classes': len(self._grids),
+            'subjects': len(self._subjects) - 1,
+            'rooms': len(self._rooms) - 1,
+        }
+
+    def get_classes_with_profiles(self) -> tuple:
+        return self._classes
+
+    def get_parallels(self) -> tuple:
+        return self._parallels
+
+    def get_letters_by_parallel(self, parallel: str) -> tuple:
+        return self._letters.get(parallel, ())
+
+
+_snapshot = TimetableSnapshot((), version=0)
+# Версия таблицы schedule в БД (db.get_data_version), из которой построен текущий снимок
+_source_version = None
+_swap_lock = threading.Lock()
+
+
+def get_snapshot() -> TimetableSnapshot:
+    """Текущий снимок; внутри одного запроса лучше взять его один раз"""
+    return _snapshot
+
+
+def reload_snapshot() -> TimetableSnapshot:
+    """Перечитывает таблицу schedule и атомарно подменяет снимок с новой версией"""
+    global _snapshot, _source_version
+    # Версию читаем до строк: если таблицу заменят между запросами, следующая проверка перечитает снова
+    source_version = db.get_data_version('schedule')
+    rows = db.get_all_schedule()
+    with _swap_lock:
+        snapshot = TimetableSnapshot(rows, version=_snapshot.version + 1)
+        _snapshot = snapshot
+        _source_version = source_version
+    logger.info(f"Снимок расписания обновлён: версия {snapshot.version}, уроков {len(snapshot)}")
+    return snapshot
+
+
+async def load_snapshot() -> TimetableSnapshot:
+    """Строит снимок в потоке-читателе пула, не блокируя event loop"""
+    return await get_pool().read(reload_snapshot)
+
+
+def reload_snapshot_if_changed() -> Optional[TimetableSnapshot]:
+    """Перечитывает снимок, только если расписание в БД сменилось (в том числе другим процессом)"""
+    if db.get_data_version('schedule') == _source_version:
+        return None
+    return reload_snapshot()
+
+
+async def sync_snapshot() -> Optional[TimetableSnapshot]:
+    """Проверка версии — один запрос по первичному ключу; снимок перестраивается только при изменении"""
+    return await get_pool().read(reload_snapshot_if_changed)
+
+
+# Удобные обёртки над текущим снимком для хендлеров и уведомителя
+
+def get_schedule(class_name: str, profile: Optional[str], day: Optional[str] = None) -> tuple:
+    return _snapshot.get_schedule(class_name, profile, day)
+
+
+def get_classes_with_profiles() -> tuple:
+    return _snapshot.get_classes_with_profiles()
+
+
+def get_parallels() -> tuple:
+    return _snapshot.get_parallels()
+
+
+def get_letters_by_parallel(parallel: str) -> tuple:
+    return _snapshot.get_letters_by_parallel(parallel)
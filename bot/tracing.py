@@ -0,0 +1,105 @@
+"""
+Трассировка обработки обновлений: время хендлера, каждого обращения к БД и каждого
+запроса к Bot API в пределах одного обновления. Обновления дольше SLOW_TRACE_MS
+пишутся в лог с разбивкой по этим участкам.
+"""
+import contextvars
+import logging
+import time
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+
+from bot.config import SLOW_TRACE_MS
+from bot.metrics import callback_type
+
+logger = logging.getLogger(__name__)
+
+# Больше участков в одну трассу не записываем (защита от циклов с тысячами запросов)
+MAX_SPANS = 200
+
+
+class Trace:
+    __slots__ = ('name', 'started', 'spans', 'dropped')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.perf_counter()
+        self.spans = []  # [(вид, имя, начало от старта трассы, длительность)]
+        self.dropped = 0
+
+    def add(self, kind: str, name: str, started: float, duration: float):
+        if len(self.spans) >= MAX_SPANS:
+            self.dropped += 1
+            return
+        self.spans.append((kind, name, started - self.started, duration))
+
+    def format(self, total: float) -> str:
+        parts = [f"{self.name} {total * 1000:.1f} мс"]
+        # Участки записываются по завершении, а выводятся по началу: хендлер — раньше своих запросов
+        for kind, name, offset, duration in sorted(self.spans, key=lambda item: item[2]):
+            parts.append(f"  +{offset * 1000:.1f} мс {kind} {name}: {duration * 1000:.1f} мс")
+        if self.dropped:
+            parts.append(f"  ... ещё {self.dropped} участков")
+        return "\n".join(parts)
+
+
+current_trace = contextvars.ContextVar('trace', default=None)
+
+
+class span:
+    """
+    Участок текущей трассы: `with span('db', name): ...`.
+    Вне обработки обновления (уведомитель, задачи обновления) ничего не делает.
+    """
+    __slots__ = ('kind', 'name', 'trace', 'started')
+
+    def __init__(self, kind: str, name: str):
+        self.kind = kind
+        self.name = name
+
+    def __enter__(self):
+        self.trace = current_trace.get()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.trace is not None:
+            self.trace.add(self.kind, self.name, self.started, time.perf_counter() - self.started)
+        return False
+
+
+def _update_name(update) -> str:
+    event_type = update.event_type
+    if event_type == 'callback_query':
+        return f"callback_query:{callback_type(update.callback_query.data)}"
+    if event_type == 'message' and update.message.text and update.message.text.startswith('/'):
+        return f"message:{update.message.text.split()[0]}"
+    return event_type
+
+
+class TracingMiddleware(BaseMiddleware):
+    """Внешний middleware на update: открывает трассу и пишет в лог медленные обновления"""
+
+    def __init__(self, threshold_ms: float = SLOW_TRACE_MS):
+        self.threshold = threshold_ms / 1000
+
+    async def __call__(self, handler, event, data):
+        trace = Trace(_update_name(event))
+        token = current_trace.set(trace)
+        try:
+            with span('handler', trace.name):
+                return await handler(event, data)
+        finally:
+            current_trace.reset(token)
+            total = time.perf_counter() - trace.started
+            if total >= self.threshold:
+                logger.warning(f"Медленное обновление {trace.format(total)}")
+
+
+class TracingRequestMiddleware(BaseRequestMiddleware):
+    """Записывает каждый запрос к Bot API участком трассы (вместе с ожиданием лимита отправки)"""
+
+    async def __call__(self, make_request, bot, method):
+        with span('api', type(method).__name__):
+            return await make_request(bot, method)
@@ -4,8 +4,15 @@ from .helpers import (
     format_date_short,
     get_current_next_lesson,
     format_lesson_block,
-    format_main_menu_text
+    format_main_menu_text,
+    format_today_text,
+    format_week_text,
+    format_replacements_page,
+    format_replacement_changes,
+    message_length,
+    fit_message
 )
+from .render_cache import render_cache, replacements_version, set_replacements_version
 
 __all__ = [
     'format_class_display',
@@ -13,5 +20,14 @@ __all__ = [
     'format_date_short',
     'get_current_next_lesson',
     'format_lesson_block',
-    'format_main_menu_text'
+    'format_main_menu_text',
+    'format_today_text',
+    'format_week_text',
+    'format_replacements_page',
+    'format_replacement_changes',
+    'message_length',
+    'fit_message',
+    'render_cache',
+    'replacements_version',
+    'set_replacements_version'
 ]
\ No newline at end of file
@@ -1,7 +1,7 @@
 import datetime
 import logging
-from zoneinfo import ZoneInfo
-from bot.config import LESSON_TIMES, TIMEZONE
+from bot import clock
+from bot.config import DAYS, LESSON_TIMES, MAX_MESSAGE_LENGTH, REPLACEMENT_FIELD_LIMIT
 
 logger = logging.getLogger(__name__)
 
@@ -32,79 +32,46 @@ def format_date_short(date_str: str) -> str:
 
 # ---- Функции для главного меню ----
 
-def get_current_next_lesson(schedule_today, replacements=None):
+def get_current_next_lesson(schedule_today, replacements=None, at: datetime.datetime | None = None):
     """
     schedule_today: список кортежей (lesson_num, subject, room) для сегодня
     replacements: словарь {lesson_num: (teacher, room)} или None
+    at: момент времени (по умолчанию сейчас, по школьным часам)
     """
-    # Текущее время в московском часовом поясе
-    tz = ZoneInfo(TIMEZONE)
-    now_time = datetime.datetime.now(tz).time()
-
-    current_lesson_num = None
-    next_lesson_num = None
-
-    for i, (start, end) in enumerate(LESSON_TIMES, start=1):
-        if start <= now_time <= end:
-            current_lesson_num = i
-            if i < len(LESSON_TIMES):
-                next_lesson_num = i + 1
-            break
-        if i < len(LESSON_TIMES):
-            next_start = LESSON_TIMES[i][0]
-            if end <= now_time < next_start:
-                next_lesson_num = i + 1
-                break
-        else:
-            if end <= now_time:
-                current_lesson_num = None
-                next_lesson_num = None
-
-    schedule_dict = {num: (subj, room) for num, subj, room in schedule_today}
+    school = clock.state(at)
+    at = at or clock.now()
     repl_dict = replacements if replacements else {}
 
     current_info = None
-    if current_lesson_num and current_lesson_num in schedule_dict:
-        subj, room = schedule_dict[current_lesson_num]
-        start, end = LESSON_TIMES[current_lesson_num - 1]
-        repl_teacher, repl_room = repl_dict.get(current_lesson_num, (None, None))
-
-        now = datetime.datetime.now(tz)
-        start_dt = datetime.datetime.combine(now.date(), start, tzinfo=tz)
-        end_dt = datetime.datetime.combine(now.date(), end, tzinfo=tz)
-
-        total_seconds = (end_dt - start_dt).total_seconds()
-        elapsed = (now - start_dt).total_seconds()
-        progress = min(100, int(elapsed / total_seconds * 100)) if total_seconds > 0 else 0
-        remaining_min = max(0, int((end_dt - now).total_seconds() // 60))
-
-        current_info = {
-            'number': current_lesson_num,
-            'subject': subj,
-            'room': room,
-            'start': start,
-            'end': end,
-            'progress': progress,
-            'remaining_min': remaining_min,
-            'repl_teacher': repl_teacher,
-            'repl_room': repl_room
-        }
-
     next_info = None
-    if next_lesson_num and next_lesson_num in schedule_dict:
-        subj, room = schedule_dict[next_lesson_num]
-        start, end = LESSON_TIMES[next_lesson_num - 1]
-        repl_teacher, repl_room = repl_dict.get(next_lesson_num, (None, None))
-
-        next_info = {
-            'number': next_lesson_num,
-            'subject': subj,
-            'room': room,
-            'start': start,
-            'end': end,
-            'repl_teacher': repl_teacher,
-            'repl_room': repl_room
-        }
+    for num, subj, room in schedule_today:
+        if num == school.current:
+            start, end = LESSON_TIMES[num - 1]
+            repl_teacher, repl_room = repl_dict.get(num, (None, None))
+            progress, remaining_min = clock.lesson_progress(num, at)
+            current_info = {
+                'number': num,
+                'subject': subj,
+                'room': room,
+                'start': start,
+                'end': end,
+                'progress': progress,
+                'remaining_min': remaining_min,
+                'repl_teacher': repl_teacher,
+                'repl_room': repl_room
+            }
+        elif num == school.next:
+            start, end = LESSON_TIMES[num - 1]
+            repl_teacher, repl_room = repl_dict.get(num, (None, None))
+            next_info = {
+                'number': num,
+                'subject': subj,
+                'room': room,
+                'start': start,
+                'end': end,
+                'repl_teacher': repl_teacher,
+                'repl_room': repl_room
+            }
 
     return current_info, next_info
 
@@ -160,4 +127,145 @@ def format_main_menu_text(user_name, class_display, current_info, next_info, no_
             parts.append(format_lesson_block(next_info, is_current=False))
     else:
         parts.append(no_lessons_message or "😴 Сегодня уроков нет.")
-    return "\n".join(parts)
\ No newline at end of file
+    return "\n".join(parts)
+
+# ---- Тексты экранов расписания и замен ----
+
+def format_today_text(class_name, profile, day_name, schedule, replacements):
+    """
+    schedule: уроки на день [(lesson_num, subject, room)]
+    replacements: словарь {lesson_num: (teacher, room)}
+    """
+    if not schedule:
+        return f"📭 На {day_name} уроков нет."
+    lines = [f"📚 <b>Расписание на {day_name}</b> ({format_class_display(class_name, profile)}):\n"]
+    for lesson_num, subject, room in schedule:
+        lines.append(format_lesson_with_replacement(lesson_num, subject, room, replacements.get(lesson_num)))
+    return "\n".join(lines) + "\n"
+
+def format_week_text(class_name, profile, schedule, week_dates, replacements_by_day):
+    """
+    schedule: уроки на неделю [(day, lesson_num, subject, room)]
+    week_dates: {день: 'YYYY-MM-DD'} для оставшихся дней недели
+    replacements_by_day: {день: {lesson_num: (teacher, room)}}
+    """
+    # Группируем расписание по дням
+    by_day = {}
+    for day, lesson_num, subject, room in schedule:
+        by_day.setdefault(day, []).append((lesson_num, subject, room))
+
+    parts = [f"📆 <b>Расписание на неделю</b> для {format_class_display(class_name, profile)}:\n\n"]
+    for day in DAYS:
+        if day in by_day:
+            day_header = f"📅 <b>{day.capitalize()}</b>"
+            # Если для этого дня известна дата, добавим её
+            if day in week_dates:
+                day_header += f" ({format_date_short(week_dates[day])})"
+            parts.append(day_header + ":\n")
+
+            day_replacements = replacements_by_day.get(day, {})
+            for lesson_num, subject, room in sorted(by_day[day], key=lambda x: x[0]):
+                repl_info = day_replacements.get(lesson_num)
+                parts.append(format_lesson_with_replacement(lesson_num, subject, room, repl_info) + "\n")
+            parts.append("\n")
+        else:
+            parts.append(f"📅 <b>{day.capitalize()}</b>: нет уроков\n\n")
+    return "".join(parts)
+
+def message_length(text: str) -> int:
+    """Длина текста так, как её считает Telegram — в UTF-16 символах (эмодзи — за два)."""
+    return len(text.encode('utf-16-le')) // 2
+
+def fit_message(lines, limit: int = MAX_MESSAGE_LENGTH) -> str:
+    """
+    Склеивает строки сообщения через перевод строки. Если текст не влезает в limit,
+    хвост отбрасывается целыми строками (теги в каждой строке закрыты) и заменяется на «…».
+    Теги HTML тоже учитываются в длине — с запасом, Telegram их не считает.
+    """
+    text = "\n".join(lines)
+    if message_length(text) <= limit:
+        return text
+    tail = "\n…"
+    budget = limit - message_length(tail)
+    kept = 0
+    total = -1
+    for line in lines:
+        total += message_length(line) + 1
+        if total > budget:
+            break
+        kept += 1
+    logger.warning(f"Сообщение длиннее {limit} символов: оставлено строк {kept} из {len(lines)}")
+    return "\n".join(lines[:kept]) + tail
+
+def _clip(value, limit: int = REPLACEMENT_FIELD_LIMIT):
+    if value and len(value) > limit:
+        return value[:limit - 1] + "…"
+    return value
+
+def _format_replacement_details(teacher, room):
+    if not (teacher or room):
+        return ""
+    details = []
+    if teacher:
+        details.append(f"👤 {_clip(teacher)}")
+    if room:
+        details.append(f"🚪 {_clip(room)}")
+    return " (" + ", ".join(details) + ")"
+
+def _page_suffix(page: int, has_more: bool) -> str:
+    return f" (стр. {page + 1})" if page or has_more else ""
+
+def format_replacements_page(user_list, other_list, mine_page=0, other_page=0, mine_more=False, other_more=False):
+    """
+    Страница экрана замен.
+    user_list: [(date, lesson, subject, teacher, room)] — замены класса пользователя,
+    other_list: [(date, lesson, class_name, subject, teacher, room)] — остальных классов.
+    Обе части уже отсортированы запросом; *_more — есть ли следующая страница.
+    Длинные поля обрезаются, а если страница всё равно не влезает в лимит Telegram —
+    её хвост (замены других классов) отбрасывается, см. fit_message.
+    """
+    parts = []
+
+    # Блок замен для класса пользователя
+    parts.append(f"<b>🔔 Замены для вашего класса</b>{_page_suffix(mine_page, mine_more)}:\n")
+    if user_list:
+        current_date = None
+        for date, lesson, subject, teacher, room in user_list:
+            if date != current_date:
+                current_date = date
+                parts.append(f"\n📅 {format_date_short(date)}:")
+            parts.append(f"  • {lesson} урок — <b>{_clip(subject)}</b>" + _format_replacement_details(teacher, room))
+    else:
+        parts.append("   Нет замен для вашего класса.")
+
+    # Разделитель
+    parts.append(f"\n\n<b>📌 Остальные замены</b>{_page_suffix(other_page, other_more)}:\n")
+
+    if other_list:
+        current_date = None
+        for date, lesson, repl_class, subject, teacher, room in other_list:
+            if date != current_date:
+                current_date = date
+                parts.append(f"\n📅 {format_date_short(date)}:")
+            parts.append(f"  • {lesson} урок — <b>{_clip(repl_class)}</b>, {_clip(subject)}" + _format_replacement_details(teacher, room))
+    else:
+        parts.append("   Нет других замен.")
+
+    return fit_message(parts)
+
+def format_replacement_changes(changes) -> str:
+    """
+    Сообщение об изменениях замен одного класса.
+    changes: [(op, date, lesson_number, subject, teacher, room)], op — 'added', 'changed' или 'removed'.
+    """
+    parts = ["🔄 <b>Изменения в заменах</b>"]
+    current_date = None
+    for op, date, lesson, subject, teacher, room in sorted(changes, key=lambda c: (c[1], c[2])):
+        if date != current_date:
+            current_date = date
+            parts.append(f"\n📅 {format_date_short(date)}:")
+        if op == 'removed':
+            parts.append(f"  • {lesson} урок — замена отменена")
+        else:
+            parts.append(f"  • {lesson} урок — <b>{_clip(subject)}</b>" + _format_replacement_details(teacher, room))
+    return fit_message(parts)
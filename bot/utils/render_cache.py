@@ -0,0 +1,60 @@
+from collections import OrderedDict
+
+from bot.config import RENDER_CACHE_SIZE
+
+
+class RenderCache:
+    """
+    LRU-кэш готовых текстов экранов (для замен — текст вместе с признаками следующих страниц).
+    Ключ включает версии данных, поэтому после обновления расписания или замен
+    старые записи просто перестают запрашиваться и вытесняются.
+    """
+
+    def __init__(self, maxsize: int = RENDER_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self._items.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self._items.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self._items[key] = value
+        self._items.move_to_end(key)
+        if len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def clear(self):
+        self._items.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'size': len(self._items),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+render_cache = RenderCache()
+
+# Версия замен — seq последней записи журнала replacement_changes в БД; при запуске и периодически
+# сверяется с БД (bot/scheduler.py), поэтому замены, загруженные другим процессом, тоже сбрасывают кэш
+_replacements_version = 0
+
+
+def replacements_version() -> int:
+    return _replacements_version
+
+
+def set_replacements_version(seq: int):
+    global _replacements_version
+    _replacements_version = seq
@@ -0,0 +1,149 @@
+"""
+Приём обновлений через webhook на том же aiohttp-сервере, что отдаёт /health и /metrics.
+Telegram получает ответ 200 сразу, обновление кладётся в ограниченную очередь, которую
+разбирают WEBHOOK_MAX_IN_FLIGHT обработчиков. Если очередь полна, обновление отбрасывается
+и учитывается в метрике — запрос Telegram при этом не ждёт и не держит соединение.
+"""
+import asyncio
+import logging
+import secrets
+
+from aiogram import Bot, Dispatcher
+from aiogram.methods import TelegramMethod
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+from bot.config import (
+    WEBHOOK_BASE_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_MAX_IN_FLIGHT, WEBHOOK_MAX_CONNECTIONS,
+    WEBHOOK_QUEUE_SIZE,
+)
+
+logger = logging.getLogger(__name__)
+
+# Сколько ждать обработки уже принятых обновлений при остановке сервера (с)
+DRAIN_TIMEOUT = 10
+
+
+class BoundedRequestHandler(SimpleRequestHandler):
+    """
+    SimpleRequestHandler с очередью обновлений: сразу отвечает Telegram, а обрабатывает
+    не больше max_in_flight обновлений одновременно. Использует только открытые методы
+    aiogram (handle, register, close, Dispatcher.feed_raw_update).
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, secret_token: str,
+                 max_in_flight: int = WEBHOOK_MAX_IN_FLIGHT, queue_size: int = WEBHOOK_QUEUE_SIZE):
+        super().__init__(dispatcher, bot, handle_in_background=True, secret_token=secret_token)
+        self.max_in_flight = max_in_flight
+        self._queue = asyncio.Queue(maxsize=queue_size)
+        self._workers = []
+        self._closing = False
+        self.in_flight = 0
+        self.received = 0
+        self.dropped = 0
+
+    @property
+    def queued(self) -> int:
+        return self._queue.qsize()
+
+    @property
+    def queue_size(self) -> int:
+        return self._queue.maxsize
+
+    def register(self, app: web.Application, /, path: str, **kwargs):
+        super().register(app, path=path, **kwargs)
+        app.on_startup.append(self._start_workers)
+
+    async def _start_workers(self, app: web.Application):
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.max_in_flight)]
+
+    async def handle(self, request: web.Request) -> web.Response:
+        bot = await self.resolve_bot(request)
+        if not self.verify_secret(request.headers.get("X-Telegram-Bot-Api-Secret-Token", ""), bot):
+            return web.Response(body="Unauthorized", status=401)
+        update = await request.json(loads=bot.session.json_loads)
+        self.received += 1
+        if self._closing:
+            self.dropped += 1
+        else:
+            try:
+                self._queue.put_nowait((bot, update))
+            except asyncio.QueueFull:
+                self.dropped += 1
+                logger.warning(f"Очередь webhook переполнена ({self.queue_size}): обновление {update.get('update_id')} отброшено")
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    __call__ = handle
+
+    async def _worker(self):
+        while True:
+            bot, update = await self._queue.get()
+            self.in_flight += 1
+            try:
+                result = await self.dispatcher.feed_raw_update(bot=bot, update=update, **self.data)
+                if isinstance(result, TelegramMethod):
+                    await self.dispatcher.silent_call_request(bot=bot, result=result)
+            except Exception as e:
+                logger.exception(f"Ошибка обработки обновления {update.get('update_id')}: {e}")
+            finally:
+                self.in_flight -= 1
+                self._queue.task_done()
+
+    async def close(self):
+        """Дорабатывает принятые обновления (не дольше DRAIN_TIMEOUT), останавливает обработчики и закрывает сессию бота"""
+        self._closing = True
+        pending = self.queued + self.in_flight
+        if pending:
+            logger.info(f"Ожидание {pending} обновлений перед остановкой")
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout=DRAIN_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.warning(f"Не дождались обработки {self.queued + self.in_flight} обновлений")
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        await super().close()
+
+
+handler: BoundedRequestHandler | None = None
+
+
+def is_configured() -> bool:
+    return bool(WEBHOOK_BASE_URL)
+
+
+def setup(app: web.Application, dp: Dispatcher, bot: Bot) -> str:
+    """Подключает приём обновлений к приложению до его запуска; возвращает секрет для setWebhook"""
+    global handler
+    secret = WEBHOOK_SECRET or secrets.token_urlsafe(32)
+    handler = BoundedRequestHandler(dp, bot, secret_token=secret)
+    handler.register(app, path=WEBHOOK_PATH)
+    # Старт и остановка приложения вызывают startup/shutdown диспетчера, как при polling
+    setup_application(app, dp, bot=bot)
+    return secret
+
+
+async def register(bot: Bot, dp: Dispatcher, secret: str):
+    """Сообщает Telegram адрес webhook (вызывать, когда сервер уже принимает запросы)"""
+    url = WEBHOOK_BASE_URL.rstrip('/') + WEBHOOK_PATH
+    await bot.set_webhook(
+        url,
+        secret_token=secret,
+        max_connections=WEBHOOK_MAX_CONNECTIONS,
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+    logger.info(f"Webhook установлен: {url}")
+
+
+def stats() -> dict | None:
+    if handler is None:
+        return None
+    return {
+        'in_flight': handler.in_flight,
+        'max_in_flight': handler.max_in_flight,
+        'queued': handler.queued,
+        'queue_size': handler.queue_size,
+        'received': handler.received,
+        'dropped': handler.dropped,
+    }
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Проверка длины сообщений с заменами.
+Рендерит худшие случаи — полные страницы замен и большие пачки изменений
+с каждой заменой на отдельную дату и огромными ячейками — и проверяет, что текст
+укладывается в лимит Telegram, а обычная полная страница выводится без обрезки.
+Если нет, скрипт завершается с кодом 1.
+
+    python scripts/check_message_limits.py
+"""
+
+import datetime
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.config import MAX_MESSAGE_LENGTH, REPLACEMENTS_PAGE_SIZE
+from bot.utils import format_replacements_page, format_replacement_changes, message_length
+
+START = datetime.date(2026, 2, 16)
+
+
+def dates(count: int) -> list[str]:
+    return [(START + datetime.timedelta(days=i)).isoformat() for i in range(count)]
+
+
+def page(subject: str, teacher: str, room: str, class_name: str) -> str:
+    days = dates(REPLACEMENTS_PAGE_SIZE)
+    mine = [(d, 10, subject, teacher, room) for d in days]
+    others = [(d, 10, class_name, subject, teacher, room) for d in days]
+    return format_replacements_page(mine, others, 98, 98, True, True)
+
+
+def changes(count: int, subject: str, teacher: str, room: str) -> str:
+    return format_replacement_changes([('changed', d, 10, subject, teacher, room) for d in dates(count)])
+
+
+def main() -> int:
+    huge = "Очень длинная ячейка 🙃 " * 200
+    # Название -> (текст, должен ли он уложиться без обрезки)
+    cases = {
+        'replacements_page.typical': (page('Математика', 'Иванова И.И.', '101', '10б'), True),
+        'replacements_page.huge_cells': (page(huge, huge, huge, huge), False),
+        'replacement_changes.typical': (changes(REPLACEMENTS_PAGE_SIZE, 'Математика', 'Иванова И.И.', '101'), True),
+        'replacement_changes.many': (changes(500, 'Математика', 'Иванова И.И.', '101'), False),
+        'replacement_changes.huge_cells': (changes(50, huge, huge, huge), False),
+    }
+
+    failures = []
+    for name, (text, whole) in cases.items():
+        length = message_length(text)
+        if length > MAX_MESSAGE_LENGTH:
+            failures.append(f"{name}: {length} символов при лимите {MAX_MESSAGE_LENGTH}")
+        elif whole and text.endswith("\n…"):
+            failures.append(f"{name}: обычное сообщение обрезано")
+        print(f"{'FAIL' if failures and failures[-1].startswith(name) else 'ok  '} {name} ({length})")
+
+    if failures:
+        print("\nСообщения не укладываются в лимит:")
+        for failure in failures:
+            print("  " + failure)
+        return 1
+    print("\nВсе сообщения укладываются в лимит")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Проверка планов запросов bot/db.py.
+На временной БД вызывает каждую функцию модуля, перехватывает выполненные ею запросы
+и прогоняет их через EXPLAIN QUERY PLAN. Если запрос читает таблицу целиком (SCAN),
+а для функции это не разрешено явно, скрипт завершается с кодом 1.
+
+    python scripts/check_query_plans.py
+"""
+
+import inspect
+import logging
+import os
+import sys
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot import db
+
+logger = logging.getLogger(__name__)
+
+TODAY = '2026-02-16'
+
+# Функция -> аргументы для вызова на тестовых данных
+CALLS = {
+    'add_schedule': ('5а', None, 'понедельник', 1, 'Математика', '101'),
+    'clear_schedule': (),
+    'load_schedule_staging': ([('5а', None, 'понедельник', 1, 'Математика', '101', 'schedule_5')],),
+    'swap_schedule_from_staging': (['schedule_5'],),
+    'get_data_version': ('schedule',),
+    'get_schedule': ('10а', 'техн', 'понедельник'),
+    'get_all_schedule': (),
+    'get_source_cache': (),
+    'set_source_cache': ([('schedule_5', 'http://example/5.csv', '"etag"', None, 'hash')],),
+    'set_user': (1, '10а', 'техн'),
+    'get_user': (1,),
+    'get_all_users_with_notify': (),
+    'get_subscribers_by_classes': (['10а', '5а'],),
+    'set_notify': (1, True),
+    'get_notify_status': (1,),
+    'mark_notification_sent': (1, 2),
+    'check_notification_sent': (1, 2),
+    'get_notified_user_ids': (TODAY, 2),
+    'record_notifications': (TODAY, 2, [(1, 100), (2, 101)]),
+    'claim_notifications': (TODAY, 3, [1, 2, 5], 'host:1', 1000.0, 960.0),
+    'release_notifications': (TODAY, 3, [5], 'host:1'),
+    'compact_sent_notifications': (TODAY,),
+    'set_last_notification': (1, 100),
+    'get_last_notification': (1,),
+    'get_last_notifications': (),
+    'clear_last_notification': (1,),
+    'add_replacement': (TODAY, 3, '10а', 'Физика', 'Иванова Н.П.', '214'),
+    'clear_old_replacements': ('2026-02-01',),
+    'apply_replacements_diff': ([(TODAY, 3, '10а', 'Химия', None, '214'), ('2026-02-17', 1, '5а', 'Физика', None, None)], TODAY),
+    'get_replacement_changes': (0,),
+    'get_replacements_seq': (),
+    'get_change_cursor': ('replacements_push',),
+    'set_change_cursor': ('replacements_push', 3),
+    'get_replacements_for_date': (TODAY,),
+    'get_replacements_for_date_and_class': (TODAY, '10а'),
+    'get_class_replacements_page': ('10а', TODAY, 16, 0),
+    'get_other_replacements_page': ('10а', TODAY, 16, 16),
+    'claim_notifier_shards': ('host:1', 8, 1000.0, 30.0),
+    'release_notifier_shards': ('host:1',),
+    'get_fsm_record': ('1:1:1:::default',),
+    'save_fsm_records': ([('1:1:1:::default', 'ClassChoice:waiting_for_letter', '{"chosen_parallel": "10"}', 1.0)],
+                         ['1:2:2:::default']),
+    'delete_expired_fsm': (0.0,),
+}
+
+# Функции, которые намеренно читают таблицу целиком (загрузка в память, служебные таблицы)
+FULL_SCAN_ALLOWED = {
+    'clear_schedule': {'schedule'},
+    'load_schedule_staging': {'schedule_staging'},
+    'swap_schedule_from_staging': {'schedule_staging'},
+    'get_all_schedule': {'schedule'},
+    'get_source_cache': {'source_cache'},
+    'get_last_notifications': {'last_notification'},
+    # служебные таблицы на единицы строк (по строке на процесс и на долю)
+    'claim_notifications': {'notifier_workers'},
+    'claim_notifier_shards': {'notifier_workers', 'notifier_leases'},
+    'release_notifier_shards': {'notifier_leases'},
+}
+
+# Служебные функции без собственных запросов к данным
+NOT_QUERIES = {'get_connection', 'open_thread_connection', 'init_db', 'sync_indexes', '_bump_data_version'}
+
+
+def seed(conn):
+    cur = conn.cursor()
+    cur.executemany(
+        'INSERT INTO users (user_id, class_name, profile, notify) VALUES (?, ?, ?, ?)',
+        [(i, '10а' if i % 2 else '5а', 'техн' if i % 2 else None, i % 3 != 0) for i in range(1, 50)]
+    )
+    cur.executemany(
+        'INSERT INTO schedule (class_name, profile, day, lesson_number, subject, room, source) VALUES (?, ?, ?, ?, ?, ?, ?)',
+        [(c, p, d, n, 'Предмет', '101', s)
+         for c, p, s in [('10а', 'техн', 'schedule_10'), ('5а', None, 'schedule_5')]
+         for d in ('понедельник', 'вторник')
+         for n in range(1, 8)]
+    )
+    cur.executemany(
+        'INSERT INTO replacements (date, lesson_number, class_name, subject, teacher, room) VALUES (?, ?, ?, ?, ?, ?)',
+        [(d, n, c, 'Предмет', 'Учитель', '200')
+         for d in ('2026-02-10', TODAY, '2026-02-17')
+         for c in ('10а', '5а')
+         for n in range(1, 4)]
+    )
+    cur.executemany(
+        'INSERT INTO sent_notifications (user_id, date, lesson_number) VALUES (?, ?, ?)',
+        [(u, d, 2) for u in range(1, 20) for d in ('2026-02-01', TODAY)]
+    )
+    conn.commit()
+
+
+def scanned_tables(conn, sql: str) -> list[tuple[str, str]]:
+    """[(таблица, строка плана)] для каждого полного просмотра таблицы в плане запроса"""
+    scans = []
+    for _id, _parent, _notused, detail in conn.execute('EXPLAIN QUERY PLAN ' + sql):
+        if detail.startswith('SCAN '):
+            table = detail.split()[1]
+            scans.append((table, detail))
+    return scans
+
+
+def main() -> int:
+    logging.basicConfig(level=logging.WARNING, format='%(message)s')
+    failures = []
+
+    defined = {name for name, func in inspect.getmembers(db, inspect.isfunction) if func.__module__ == db.__name__}
+    for name in sorted(defined - NOT_QUERIES - CALLS.keys()):
+        failures.append(f"{name}: функция не покрыта проверкой (добавьте её в CALLS)")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, 'plans.db')
+        db.init_db()
+        conn = db.open_thread_connection()
+        seed(conn)
+        # Планы строятся вторым соединением прямо в момент выполнения запроса:
+        # временные таблицы (schedule_staging) к концу функции уже удалены
+        explain_conn = db.open_thread_connection()
+        db._local.conn = conn
+
+        for name, args in CALLS.items():
+            scans = []
+
+            def on_statement(sql):
+                verb = sql.lstrip().split(None, 1)[0].upper()
+                if verb in ('SELECT', 'UPDATE', 'DELETE', 'INSERT'):
+                    scans.extend((sql, table, detail) for table, detail in scanned_tables(explain_conn, sql))
+
+            conn.set_trace_callback(on_statement)
+            try:
+                getattr(db, name)(*args)
+            finally:
+                conn.set_trace_callback(None)
+
+            allowed = FULL_SCAN_ALLOWED.get(name, set())
+            bad = [(sql, detail) for sql, table, detail in scans if table not in allowed]
+            for sql, detail in bad:
+                failures.append(f"{name}: {detail}\n    {' '.join(sql.split())}")
+            print(f"FAIL {name}" if bad else f"ok   {name}")
+        explain_conn.close()
+        conn.close()
+
+    if failures:
+        print("\nЗапросы с полным просмотром таблиц:")
+        for failure in failures:
+            print("  " + failure)
+        return 1
+    print("\nВсе запросы используют индексы")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
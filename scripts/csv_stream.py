@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Потоковое декодирование и разбор скачанных CSV: байты декодируются по мере чтения
+строк csv.reader, строки сразу уходят в разборщик (parse_schedule_data, parse_replacements),
+без полной копии текста и списка всех строк в памяти.
+
+Кодировка: сначала строгий UTF-8, затем кодировка, с которой этот источник разобрался
+в прошлый раз, затем определённая chardet по первым SNIFF_BYTES байтам, затем windows-1251.
+Если ни одна не подошла целиком, разбор повторяется с заменой нераспознанных символов.
+"""
+
+import codecs
+import csv
+import io
+import logging
+
+import chardet
+
+logger = logging.getLogger(__name__)
+
+# Сколько первых байт отдавать chardet
+SNIFF_BYTES = 64 * 1024
+FALLBACK_ENCODING = 'windows-1251'
+
+# Источник -> кодировка, с которой он разобрался в прошлый раз (живёт, пока жив процесс)
+_encodings: dict[str, str] = {}
+
+
+def iter_csv_rows(content: bytes, encoding: str, errors: str = 'strict'):
+    """Строки CSV по одной; при errors='strict' ошибка декодирования всплывает во время итерации"""
+    text = io.TextIOWrapper(io.BytesIO(content), encoding=encoding, errors=errors, newline='')
+    return csv.reader(text)
+
+
+def sniff_encoding(content: bytes) -> str | None:
+    return chardet.detect(content[:SNIFF_BYTES]).get('encoding')
+
+
+def _candidates(content: bytes, source: str):
+    """Кодировки для проверки по порядку, под каноническими именами Python и без повторов"""
+    def names():
+        yield 'utf-8'
+        if source in _encodings:
+            yield _encodings[source]
+        sniffed = sniff_encoding(content)
+        if sniffed:
+            yield sniffed
+        yield FALLBACK_ENCODING
+
+    seen = set()
+    for name in names():
+        try:
+            encoding = codecs.lookup(name).name
+        except LookupError:
+            logger.info(f"{source}: неизвестная кодировка {name}")
+            continue
+        if encoding not in seen:
+            seen.add(encoding)
+            yield encoding
+
+
+def parse_csv(content: bytes, source: str, parse):
+    """Разбирает content функцией parse(строки) в первой подходящей кодировке; возвращает её результат"""
+    for encoding in _candidates(content, source):
+        # Ловим только ошибку декодирования: остальные исключения — ошибки разбора, их не повторяем
+        try:
+            result = parse(iter_csv_rows(content, encoding))
+        except UnicodeDecodeError as e:
+            logger.info(f"{source}: не {encoding} ({e})")
+            continue
+        if _encodings.get(source) != encoding:
+            logger.info(f"{source}: кодировка {encoding}")
+            _encodings[source] = encoding
+        return result
+
+    encoding = _encodings.get(source, FALLBACK_ENCODING)
+    logger.warning(f"{source}: ни одна кодировка не подошла целиком, разбор как {encoding} с заменой символов")
+    return parse(iter_csv_rows(content, encoding, errors='replace'))
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Локальная подмена Telegram Bot API для нагрузочных проверок (см. scripts/load_test.py).
+Отвечает на getMe, deleteWebhook, getUpdates, sendMessage, editMessageText, deleteMessage
+и answerCallbackQuery; умеет добавлять задержку и отвечать 429 с retry_after.
+
+    python scripts/fake_bot_api.py --port 8082 --latency 0.05 --rate-limit-ratio 0.01
+
+Бот подключается так: create_bot(api_url="http://127.0.0.1:8082").
+"""
+
+import argparse
+import asyncio
+import itertools
+import logging
+import random
+import time
+from collections import Counter, deque
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+BOT_USER = {'id': 100000, 'is_bot': True, 'first_name': 'Расписание', 'username': 'schedule_load_bot'}
+
+
+class FakeBotAPI:
+    """
+    Состояние сервера: очередь входящих обновлений для getUpdates и счётчики вызовов.
+    on_call(method, params) вызывается после каждого успешного ответа — так нагрузочный
+    тест узнаёт, когда бот закончил обработку нажатия.
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0,
+                 rate_limit_ratio: float = 0.0, retry_after: int = 1, seed: int = 1):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit_ratio = rate_limit_ratio
+        self.retry_after = retry_after
+        self.calls = Counter()
+        self.rate_limited = Counter()
+        self.on_call = None
+        self._random = random.Random(seed)
+        self._updates = deque()
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1000)
+        self._has_updates = asyncio.Event()
+
+    def push_update(self, update: dict) -> int:
+        """Ставит обновление (без update_id) в очередь getUpdates и возвращает присвоенный id"""
+        update_id = next(self._update_ids)
+        self._updates.append({'update_id': update_id, **update})
+        self._has_updates.set()
+        return update_id
+
+    def _message(self, chat_id, text, message_id=None) -> dict:
+        return {
+            'message_id': message_id or next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': int(chat_id), 'type': 'private'},
+            'from': BOT_USER,
+            'text': text or '',
+        }
+
+    async def _get_updates(self, params: dict):
+        offset = int(params.get('offset') or 0)
+        limit = int(params.get('limit') or 100)
+        timeout = float(params.get('timeout') or 0)
+        while self._updates and self._updates[0]['update_id'] < offset:
+            self._updates.popleft()
+        if not self._updates and timeout:
+            self._has_updates.clear()
+            try:
+                await asyncio.wait_for(self._has_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return list(itertools.islice(self._updates, limit))
+
+    async def handle(self, request: web.Request):
+        method = request.match_info['method']
+        if request.content_type == 'application/json':
+            params = await request.json()
+        else:
+            params = dict(await request.post())
+
+        if method == 'getUpdates':
+            return web.json_response({'ok': True, 'result': await self._get_updates(params)})
+
+        self.calls[method] += 1
+        delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            await asyncio.sleep(delay)
+
+        if method != 'getMe' and self._random.random() < self.rate_limit_ratio:
+            self.rate_limited[method] += 1
+            return web.json_response({
+                'ok': False,
+                'error_code': 429,
+                'description': f"Too Many Requests: retry after {self.retry_after}",
+                'parameters': {'retry_after': self.retry_after},
+            }, status=429)
+
+        if method == 'getMe':
+            result = BOT_USER
+        elif method == 'sendMessage':
+            result = self._message(params.get('chat_id'), params.get('text'))
+        elif method == 'editMessageText':
+            result = self._message(params.get('chat_id'), params.get('text'), int(params.get('message_id') or 0))
+        elif method in ('deleteMessage', 'answerCallbackQuery', 'deleteWebhook'):
+            result = True
+        else:
+            return web.json_response({'ok': False, 'error_code': 404, 'description': 'Not Found: method not found'},
+                                     status=404)
+
+        if self.on_call is not None:
+            self.on_call(method, params)
+        return web.json_response({'ok': True, 'result': result})
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post('/bot{token}/{method}', self.handle)
+        return app
+
+
+async def start_server(api: FakeBotAPI, host: str = '127.0.0.1', port: int = 0) -> tuple[web.AppRunner, str]:
+    """Запускает сервер в текущем event loop; возвращает runner и базовый URL"""
+    runner = web.AppRunner(api.create_app(), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    sockets = site._server.sockets
+    actual_port = sockets[0].getsockname()[1]
+    return runner, f"http://{host}:{actual_port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальный фейковый Telegram Bot API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8082)
+    parser.add_argument('--latency', type=float, default=0.0, help="задержка ответа, с")
+    parser.add_argument('--jitter', type=float, default=0.0, help="случайная добавка к задержке, с")
+    parser.add_argument('--rate-limit-ratio', type=float, default=0.0, help="доля ответов 429")
+    parser.add_argument('--retry-after', type=int, default=1)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    api = FakeBotAPI(args.latency, args.jitter, args.rate_limit_ratio, args.retry_after)
+    web.run_app(api.create_app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import hashlib
+import logging
+import os
+import random
+import sys
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import aiohttp
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.db import get_source_cache, set_source_cache
+from bot.config import FETCH_CONCURRENCY, FETCH_RETRIES, FETCH_BACKOFF, FETCH_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+# Статусы результата скачивания
+CHANGED = 'changed'            # новое содержимое — нужно разобрать и записать
+NOT_MODIFIED = 'not_modified'  # сервер ответил 304 по ETag / Last-Modified
+UNCHANGED = 'unchanged'        # скачано, но хэш совпал с прошлым
+FAILED = 'failed'              # все попытки неудачны
+
+# Ответы, после которых имеет смысл повторить запрос
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+@dataclass
+class FetchResult:
+    source: str
+    url: str
+    status: str
+    content: Optional[bytes] = None
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    content_hash: Optional[str] = None
+    attempts: int = 0
+    elapsed: float = 0.0
+    error: Optional[str] = None
+
+    @property
+    def changed(self) -> bool:
+        return self.status == CHANGED
+
+
+class RetryableStatus(Exception):
+    pass
+
+
+async def _fetch_one(session, semaphore, source, url, cached, retries, backoff) -> FetchResult:
+    cached_url, etag, last_modified, content_hash = cached or (None, None, None, None)
+    headers = {}
+    if cached_url == url:
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+    else:
+        content_hash = None
+
+    started = time.perf_counter()
+    error = None
+    for attempt in range(1, retries + 1):
+        try:
+            async with semaphore:
+                async with session.get(url, headers=headers) as response:
+                    if response.status == 304:
+                        logger.info(f"{source}: не изменилось (304)")
+                        return FetchResult(source, url, NOT_MODIFIED, etag=etag, last_modified=last_modified,
+                                           content_hash=content_hash, attempts=attempt,
+                                           elapsed=time.perf_counter() - started)
+                    if response.status in RETRY_STATUSES:
+                        raise RetryableStatus(f"HTTP {response.status}")
+                    response.raise_for_status()
+                    content = await response.read()
+                    new_etag = response.headers.get('ETag')
+                    new_last_modified = response.headers.get('Last-Modified')
+        except (aiohttp.ClientError, asyncio.TimeoutError, RetryableStatus) as e:
+            error = f"{type(e).__name__}: {e}"
+            if isinstance(e, aiohttp.ClientResponseError) and e.status not in RETRY_STATUSES:
+                break
+            if attempt < retries:
+                delay = backoff * 2 ** (attempt - 1) * (1 + random.random() / 2)
+                logger.warning(f"{source}: попытка {attempt} не удалась ({error}), повтор через {delay:.1f} с")
+                await asyncio.sleep(delay)
+            continue
+
+        new_hash = hashlib.sha256(content).hexdigest()
+        status = UNCHANGED if new_hash == content_hash else CHANGED
+        logger.info(f"{source}: скачано {len(content)} байт, {'без изменений' if status == UNCHANGED else 'есть изменения'}")
+        return FetchResult(source, url, status, content=content, etag=new_etag, last_modified=new_last_modified,
+                           content_hash=new_hash, attempts=attempt, elapsed=time.perf_counter() - started)
+
+    logger.error(f"{source}: не удалось скачать {url}: {error}")
+    return FetchResult(source, url, FAILED, attempts=attempt, elapsed=time.perf_counter() - started, error=error)
+
+
+async def fetch_sources(sources: dict[str, str], concurrency: int = FETCH_CONCURRENCY,
+                        retries: int = FETCH_RETRIES, backoff: float = FETCH_BACKOFF,
+                        timeout: float = FETCH_TIMEOUT) -> dict[str, FetchResult]:
+    """
+    Скачивает все источники {source: url} параллельно (не больше concurrency соединений сразу).
+    Для уже виденных источников отправляет условный запрос и сравнивает хэш содержимого.
+    Валидаторы не сохраняются — после успешной записи данных вызовите commit_sources().
+    """
+    cache = get_source_cache()
+    semaphore = asyncio.Semaphore(concurrency)
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+    async with aiohttp.ClientSession(connector=connector, timeout=client_timeout) as session:
+        results = await asyncio.gather(*(
+            _fetch_one(session, semaphore, source, url, cache.get(source), retries, backoff)
+            for source, url in sources.items()
+        ))
+    return {result.source: result for result in results}
+
+
+def fetch_sources_sync(sources: dict[str, str], **kwargs) -> dict[str, FetchResult]:
+    """Обёртка для синхронных скриптов обновления (вызываются не из event loop)"""
+    return asyncio.run(fetch_sources(sources, **kwargs))
+
+
+def commit_sources(results):
+    """Запоминает валидаторы источников, данные которых уже записаны в БД"""
+    entries = [
+        (r.source, r.url, r.etag, r.last_modified, r.content_hash)
+        for r in results
+        if r.status in (CHANGED, UNCHANGED)
+    ]
+    if entries:
+        set_source_cache(entries)
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Локальная подмена Google Sheets для проверки скачивания без сети.
+Раздаёт CSV-файлы из каталога с ETag / Last-Modified и отвечает 304 на условные запросы.
+
+    python scripts/fixture_server.py archive/last_scripts/data --port 8081
+
+Файл "5 классы.csv" доступен по адресу http://127.0.0.1:8081/5%20классы.csv.
+Параметр ?fail=N заставляет первые N запросов к файлу вернуть 503 (проверка повторов).
+"""
+
+import argparse
+import email.utils
+import hashlib
+import logging
+import os
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+
+def create_app(directory: str) -> web.Application:
+    failures = {}
+
+    async def serve(request: web.Request):
+        name = request.match_info['name']
+        path = os.path.join(directory, name)
+        if os.path.dirname(os.path.abspath(path)) != os.path.abspath(directory) or not os.path.isfile(path):
+            raise web.HTTPNotFound()
+
+        fail = int(request.query.get('fail', 0))
+        if fail:
+            count = failures.get(request.path_qs, 0)
+            if count < fail:
+                failures[request.path_qs] = count + 1
+                raise web.HTTPServiceUnavailable()
+
+        with open(path, 'rb') as f:
+            content = f.read()
+        etag = '"' + hashlib.md5(content).hexdigest() + '"'
+        last_modified = email.utils.formatdate(os.path.getmtime(path), usegmt=True)
+
+        if request.headers.get('If-None-Match') == etag or (
+                'If-None-Match' not in request.headers
+                and request.headers.get('If-Modified-Since') == last_modified):
+            return web.Response(status=304, headers={'ETag': etag, 'Last-Modified': last_modified})
+        return web.Response(body=content, content_type='text/csv', charset='utf-8',
+                            headers={'ETag': etag, 'Last-Modified': last_modified})
+
+    app = web.Application()
+    app.router.add_get('/{name}', serve)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальный сервер CSV-фикстур")
+    parser.add_argument('directory')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    web.run_app(create_app(args.directory), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Нагрузочный тест: настоящий Dispatcher бота (bot/main.py) против локального фейкового
+Bot API (scripts/fake_bot_api.py) на временной БД с синтетической школой (benchmarks/synthetic.py).
+
+Фейковый сервер работает в отдельном потоке со своим event loop, чтобы его работа
+не попадала в замеры задержки event loop бота.
+
+Симулированные пользователи нажимают «Сегодня», «Неделя», «Замены» и «Уведомления»;
+в конце рассылается одна волна уведомлений о уроке. Отчёт: p50/p95/p99 задержки
+обработки нажатия (от постановки обновления до answerCallbackQuery), задержка event loop
+и время рассылки волны.
+
+    python scripts/load_test.py --users 2000 --presses 3 --latency 0.03 --rate-limit-ratio 0.005
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot import clock, db, outbound
+from bot.db_async import init_db, close_pool
+from bot.main import create_bot, create_dispatcher
+from bot.notifier import get_dispatch_plan, send_wave
+from bot.timetable import load_snapshot
+from benchmarks.synthetic import School, SchoolConfig, populate
+from scripts.fake_bot_api import FakeBotAPI, start_server
+
+logger = logging.getLogger(__name__)
+
+TOKEN = '123456:LOADTEST'
+ACTIONS = ['today', 'week', 'replacements', 'toggle_notify']
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summary(values: list[float]) -> dict:
+    """Перцентили в миллисекундах"""
+    return {
+        'count': len(values),
+        'p50_ms': round(percentile(values, 50) * 1000, 1),
+        'p95_ms': round(percentile(values, 95) * 1000, 1),
+        'p99_ms': round(percentile(values, 99) * 1000, 1),
+        'max_ms': round(max(values, default=0.0) * 1000, 1),
+    }
+
+
+class LoopLagMonitor:
+    """Насколько позже запланированного просыпается корутина — мера блокировки event loop"""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.lags = []
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, loop.time() - expected))
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+
+
+class ServerThread:
+    """FakeBotAPI в отдельном потоке со своим event loop"""
+
+    def __init__(self, api: FakeBotAPI):
+        self.api = api
+        self.url = None
+        self._loop = asyncio.new_event_loop()
+        self._runner = None
+        self._thread = threading.Thread(target=self._loop.run_forever, name="fake-bot-api", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        self._runner, self.url = asyncio.run_coroutine_threadsafe(start_server(self.api), self._loop).result()
+
+    def push_update(self, update: dict):
+        self._loop.call_soon_threadsafe(self.api.push_update, update)
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+
+class PressTracker:
+    """
+    Связывает отправленные нажатия с ответом бота answerCallbackQuery.
+    on_call вызывается в потоке сервера, press — в event loop бота.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._ids = 0
+        self.latencies = []
+        self.timeouts = 0
+
+    def on_call(self, method: str, params: dict):
+        if method != 'answerCallbackQuery':
+            return
+        with self._lock:
+            entry = self._pending.pop(str(params.get('callback_query_id')), None)
+        if entry is not None:
+            started, future = entry
+            self.latencies.append(time.perf_counter() - started)
+            self._loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+    async def press(self, server: ServerThread, user_id: int, data: str, timeout: float):
+        self._ids += 1
+        callback_id = str(self._ids)
+        future = self._loop.create_future()
+        with self._lock:
+            self._pending[callback_id] = (time.perf_counter(), future)
+        server.push_update({
+            'callback_query': {
+                'id': callback_id,
+                'from': {'id': user_id, 'is_bot': False, 'first_name': 'Ученик'},
+                'chat_instance': str(user_id),
+                'data': data,
+                'message': {
+                    'message_id': 1,
+                    'date': int(time.time()),
+                    'chat': {'id': user_id, 'type': 'private'},
+                    'text': 'Главное меню',
+                },
+            }
+        })
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self._pending.pop(callback_id, None)
+            self.timeouts += 1
+
+
+def next_school_day(today: datetime.date) -> datetime.date:
+    day = today + datetime.timedelta(days=1)
+    while day.weekday() >= 5:
+        day += datetime.timedelta(days=1)
+    return day
+
+
+async def run(args) -> dict:
+    school = School(SchoolConfig(letters=args.letters, users=args.users, replacements=args.replacements))
+    tmp = tempfile.TemporaryDirectory()
+    db.DB_PATH = os.path.join(tmp.name, 'load.db')
+    if args.global_rate:
+        outbound.limiter = outbound.RateLimiter(global_rate=args.global_rate)
+
+    await init_db()
+    conn = db.get_connection()
+    populate(conn, school)
+    conn.close()
+    await load_snapshot()
+
+    api = FakeBotAPI(args.latency, args.jitter, args.rate_limit_ratio, args.retry_after)
+    tracker = PressTracker(asyncio.get_running_loop())
+    api.on_call = tracker.on_call
+    server = ServerThread(api)
+    server.start()
+
+    bot = create_bot(TOKEN, api_url=server.url)
+    dp = create_dispatcher()
+    outbound.outbound.start()
+    polling = asyncio.create_task(dp.start_polling(bot, handle_signals=False, close_bot_session=False))
+
+    monitor = LoopLagMonitor()
+    monitor.start()
+    rnd = random.Random(args.seed)
+    user_ids = [user_id for user_id, _c, _p, _n in school.users]
+
+    async def simulate(user_id: int):
+        for _ in range(args.presses):
+            await asyncio.sleep(rnd.expovariate(1 / args.think) if args.think else 0)
+            await tracker.press(server, user_id, rnd.choice(ACTIONS), args.timeout)
+
+    logger.warning(f"Нажатия: {len(user_ids)} пользователей x {args.presses}")
+    started = time.perf_counter()
+    await asyncio.gather(*(simulate(user_id) for user_id in user_ids))
+    presses_duration = time.perf_counter() - started
+    press_lags = list(monitor.lags)
+
+    # Волна уведомлений: урок с наибольшим числом получателей в ближайший учебный день
+    plan = await get_dispatch_plan(next_school_day(clock.today()))
+    lesson_number = max(plan.slots, key=plan.recipients) if plan.slots else 1
+    recipients = plan.recipients(lesson_number)
+    logger.warning(f"Волна уведомлений: урок {lesson_number}, {recipients} получателей")
+    monitor.lags.clear()
+    sent_before = outbound.outbound.sent
+    started = time.perf_counter()
+    await send_wave(bot, plan, lesson_number)
+    wave_duration = time.perf_counter() - started
+    wave_lags = list(monitor.lags)
+
+    await monitor.stop()
+    await dp.stop_polling()
+    await asyncio.gather(polling, return_exceptions=True)
+    await outbound.outbound.stop()
+    await bot.session.close()
+    server.stop()
+    close_pool()
+    tmp.cleanup()
+
+    return {
+        'config': {k: v for k, v in vars(args).items() if k != 'json'},
+        'callbacks': {
+            **summary(tracker.latencies),
+            'timeouts': tracker.timeouts,
+            'duration_s': round(presses_duration, 2),
+            'throughput_rps': round(len(tracker.latencies) / presses_duration, 1) if presses_duration else 0.0,
+        },
+        'loop_lag': {'callbacks': summary(press_lags), 'wave': summary(wave_lags)},
+        'wave': {
+            'lesson': lesson_number,
+            'recipients': recipients,
+            'sent': outbound.outbound.sent - sent_before,
+            'duration_s': round(wave_duration, 2),
+            'per_second': round(recipients / wave_duration, 1) if wave_duration else 0.0,
+        },
+        'api_calls': dict(api.calls),
+        'api_rate_limited': dict(api.rate_limited),
+        'outbound': outbound.outbound.stats(),
+    }
+
+
+def print_report(report: dict):
+    cb = report['callbacks']
+    print(f"\nНажатия: {cb['count']} за {cb['duration_s']} с ({cb['throughput_rps']}/с), таймаутов {cb['timeouts']}")
+    print(f"  задержка обработки: p50 {cb['p50_ms']} мс, p95 {cb['p95_ms']} мс, p99 {cb['p99_ms']} мс, max {cb['max_ms']} мс")
+    for phase, lag in report['loop_lag'].items():
+        print(f"Задержка event loop ({phase}): p50 {lag['p50_ms']} мс, p99 {lag['p99_ms']} мс, max {lag['max_ms']} мс")
+    wave = report['wave']
+    print(f"Волна уведомлений (урок {wave['lesson']}): {wave['sent']} из {wave['recipients']} "
+          f"за {wave['duration_s']} с ({wave['per_second']}/с)")
+    print(f"Вызовы Bot API: {report['api_calls']}, ответов 429: {report['api_rate_limited']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест бота против фейкового Bot API")
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--presses', type=int, default=3, help="нажатий на пользователя")
+    parser.add_argument('--think', type=float, default=1.0, help="средняя пауза между нажатиями, с")
+    parser.add_argument('--letters', type=int, default=4, help="классов в параллели синтетической школы")
+    parser.add_argument('--replacements', type=int, default=300)
+    parser.add_argument('--latency', type=float, default=0.02, help="задержка ответа Bot API, с")
+    parser.add_argument('--jitter', type=float, default=0.01)
+    parser.add_argument('--rate-limit-ratio', type=float, default=0.0, help="доля ответов 429")
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--global-rate', type=float, help="заменить OUTBOUND_GLOBAL_RATE (сообщений/с)")
+    parser.add_argument('--timeout', type=float, default=10.0, help="сколько ждать ответа на нажатие, с")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help="сохранить отчёт в JSON")
+    args = parser.parse_args()
+
+    # Хендлеры логируют каждое нажатие; оставляем только предупреждения
+    logging.basicConfig(level=logging.WARNING, format='%(message)s')
+    logging.getLogger().setLevel(logging.WARNING)
+
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Процессы-уведомители: рассылка уведомлений об уроках вне процесса бота, по нескольким ядрам.
+Работает при NOTIFIER_SHARDS > 0 (тогда сам бот уведомления не рассылает). Подписчики делятся
+на NOTIFIER_SHARDS долей, процессы распределяют их между собой через БД (bot/notifier_shards.py),
+поэтому процессы можно запускать и на разных машинах с общей базой.
+
+    NOTIFIER_SHARDS=8 python scripts/notifier_workers.py --processes 4
+
+Процессам этого запуска поровну делится NOTIFIER_GLOBAL_RATE — часть лимита отправки бота;
+сам бот при NOTIFIER_SHARDS > 0 отправляет не быстрее оставшейся BOT_GLOBAL_RATE.
+Упавший процесс перезапускается; пока он не поднялся, его доли забирают остальные.
+"""
+
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot import outbound
+from bot.config import NOTIFIER_SHARDS, NOTIFIER_GLOBAL_RATE
+
+logger = logging.getLogger(__name__)
+
+# Как часто проверять, живы ли процессы (с)
+SUPERVISE_INTERVAL = 5
+
+
+async def run_worker(global_rate: float):
+    from bot.db_async import init_db, close_pool
+    from bot.main import create_bot
+    from bot.notifier import notification_worker
+    from bot.notifier_shards import ShardLease
+
+    # Ответов на нажатия в процессе-уведомителе нет — резерв под них не нужен
+    outbound.limiter = outbound.RateLimiter(global_rate=global_rate, interactive_reserve=0)
+    await init_db()
+    bot = create_bot()
+    outbound.outbound.start()
+    lease = ShardLease()
+    await lease.start()
+    try:
+        await notification_worker(bot, lease)
+    finally:
+        await lease.stop()
+        await outbound.outbound.stop()
+        await bot.session.close()
+        close_pool()
+
+
+def worker_main(global_rate: float):
+    logging.basicConfig(level=logging.INFO, format=f'%(asctime)s - {os.getpid()} - %(levelname)s - %(message)s')
+    try:
+        asyncio.run(run_worker(global_rate))
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Процессы-уведомители")
+    parser.add_argument('--processes', type=int, default=min(os.cpu_count() or 1, max(NOTIFIER_SHARDS, 1)),
+                        help="сколько процессов запустить (по умолчанию — по числу ядер, не больше долей)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if NOTIFIER_SHARDS <= 0:
+        logger.error("NOTIFIER_SHARDS не задан: уведомления рассылает сам бот")
+        sys.exit(1)
+    if args.processes > NOTIFIER_SHARDS:
+        logger.warning(f"Процессов ({args.processes}) больше, чем долей ({NOTIFIER_SHARDS}): лишние будут простаивать")
+    rate = NOTIFIER_GLOBAL_RATE / args.processes
+
+    if args.processes == 1:
+        worker_main(rate)
+        return
+
+    context = multiprocessing.get_context('spawn')
+    processes = []
+    try:
+        for _ in range(args.processes):
+            process = context.Process(target=worker_main, args=(rate,), daemon=True)
+            process.start()
+            processes.append(process)
+        logger.info(f"Запущено процессов-уведомителей: {args.processes}, лимит {rate:.1f} сообщений/с на процесс")
+        while True:
+            time.sleep(SUPERVISE_INTERVAL)
+            for i, process in enumerate(processes):
+                if not process.is_alive():
+                    logger.error(f"Процесс {process.pid} завершился с кодом {process.exitcode}, перезапуск")
+                    processes[i] = context.Process(target=worker_main, args=(rate,), daemon=True)
+                    processes[i].start()
+    except KeyboardInterrupt:
+        logger.info("Остановка процессов-уведомителей")
+    finally:
+        for process in processes:
+            process.join(timeout=15)
+            if process.is_alive():
+                process.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,65 +2,50 @@
 # -*- coding: utf-8 -*-
 
 import csv
-import requests
 import sys
 import os
 import logging
-from datetime import datetime, timedelta
-from io import StringIO
+from datetime import datetime
 
 # Добавляем путь к корню проекта для импорта модулей бота
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from bot.db import init_db, add_replacement, clear_old_replacements
+from bot import clock
+from bot.db import init_db, apply_replacements_diff
 from bot.config import REPLACEMENTS_URL
+from scripts.fetcher import fetch_sources_sync, commit_sources, FAILED
+from scripts.csv_stream import parse_csv
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def download_csv(url):
-    logger.info(f"Скачивание данных по URL: {url}")
-    try:
-        response = requests.get(url, timeout=30)
-        response.raise_for_status()
-
-        import chardet
-        detected = chardet.detect(response.content)
-        encoding = detected.get('encoding', 'utf-8')
-        logger.info(f"Определена кодировка: {encoding}")
-
-        content = response.content.decode(encoding, errors='replace').encode('utf-8').decode('utf-8')
-        csv_data = StringIO(content)
-        reader = csv.reader(csv_data)
-        rows = list(reader)
-        logger.info(f"Скачано строк: {len(rows)}")
-        return rows
-    except Exception as e:
-        logger.error(f"Ошибка при скачивании: {e}")
-        return None
-
 def parse_replacements(rows):
-    if not rows:
-        return 0
-
-    header_idx = None
-    for i, row in enumerate(rows):
+    """
+    Строки таблицы замен (любой итерируемый, например csv.reader) -> [(date, lesson_number,
+    class_name, subject, teacher, room)] начиная с сегодня. Разбор за один проход.
+    None — таблицу не удалось разобрать (тогда замены в БД трогать нельзя).
+    """
+    rows = iter(rows)
+    head = []
+    for row in rows:
+        if len(head) < 10:
+            head.append(row)
         if not row or len(row) == 0:
             continue
         first_cell = row[0].strip()
         if first_cell.startswith('\ufeff'):
             first_cell = first_cell[1:].strip()
         if first_cell == 'дата':
-            header_idx = i
+            headers = row
             break
-
-    if header_idx is None:
+    else:
+        if not head:
+            return None
         logger.error("Не найден заголовок таблицы замен")
-        for idx, r in enumerate(rows[:10]):
+        for idx, r in enumerate(head):
             logger.info(f"Строка {idx}: {r}")
-        return 0
+        return None
 
-    headers = rows[header_idx]
     try:
         date_idx = headers.index('дата')
         lesson_idx = headers.index('урок')
@@ -70,13 +55,15 @@ def parse_replacements(rows):
         room_idx = headers.index('Кабинет')
     except ValueError as e:
         logger.error(f"Не найдена нужная колонка: {e}")
-        return 0
+        return None
 
-    today = datetime.today().date()
-    added = 0
+    today = clock.today()
+    replacements = []
     skipped = 0
+    # Дат в таблице немного, а strptime — самое дорогое в разборе строки
+    dates = {}
 
-    for row in rows[header_idx+1:]:
+    for row in rows:
         if len(row) <= max(date_idx, lesson_idx, class_idx, subject_idx):
             continue
 
@@ -84,11 +71,14 @@ def parse_replacements(rows):
         if not date_str:
             continue
 
-        try:
-            if len(date_str) <= 5:
-                date_str = f"{date_str}.{datetime.today().year}"
-            row_date = datetime.strptime(date_str, "%d.%m.%Y").date()
-        except ValueError:
+        if date_str not in dates:
+            try:
+                full_date = f"{date_str}.{today.year}" if len(date_str) <= 5 else date_str
+                dates[date_str] = datetime.strptime(full_date, "%d.%m.%Y").date()
+            except ValueError:
+                dates[date_str] = None
+        row_date = dates[date_str]
+        if row_date is None:
             continue
 
         if row_date < today:
@@ -109,25 +99,49 @@ def parse_replacements(rows):
         if room and room.lower() == 'каб':
             room = None
 
-        add_replacement(row_date.isoformat(), lesson_num, class_name, subject, teacher, room)
-        added += 1
+        replacements.append((row_date.isoformat(), lesson_num, class_name, subject, teacher, room))
 
-    logger.info(f"Добавлено замен: {added}, пропущено (прошлые или битые): {skipped}")
-    return added
+    logger.info(f"Разобрано замен: {len(replacements)}, пропущено (прошлые или битые): {skipped}")
+    return replacements
 
-def update_replacements():
-    """Функция для вызова из планировщика или из командной строки"""
+def update_replacements(url: str | None = None):
+    """
+    Функция для вызова из планировщика или из командной строки.
+    Если таблица замен не изменилась с прошлого раза, ни разбор, ни запись в БД не выполняются.
+    Иначе в БД применяется только разница с текущими заменами (см. apply_replacements_diff).
+    Возвращает отчёт: {'rows': число изменённых замен, 'changed': были ли изменения, 'seq': номер в журнале}.
+    """
     logger.info("="*50)
     logger.info("Обновление таблицы замен...")
     init_db()
-    rows = download_csv(REPLACEMENTS_URL)
-    if rows:
-        today_str = datetime.today().date().isoformat()
-        clear_old_replacements(today_str)
-        added = parse_replacements(rows)
-        logger.info(f"Обновление завершено. Всего актуальных замен в БД: {added}")
-    else:
+    report = {'rows': 0, 'changed': False, 'seq': None}
+    result = fetch_sources_sync({'replacements': url or REPLACEMENTS_URL})['replacements']
+    if result.status == FAILED:
         logger.error("Не удалось получить данные.")
+        return report
+    if not result.changed:
+        commit_sources([result])
+        logger.info("Таблица замен не изменилась, обновление не требуется.")
+        return report
+
+    try:
+        replacements = parse_csv(result.content, 'replacements', parse_replacements)
+    except csv.Error as e:
+        # Битый файл (например, NUL в данных): замены в БД не трогаем
+        logger.error(f"Ошибка при разборе CSV: {e}")
+        replacements = None
+    if replacements is None:
+        logger.error("Не удалось разобрать данные.")
+        return report
+
+    today_str = clock.today().isoformat()
+    diff = apply_replacements_diff(replacements, today_str)
+    commit_sources([result])
+    report['rows'] = diff['added'] + diff['changed'] + diff['removed']
+    report['changed'] = report['rows'] > 0
+    report['seq'] = diff['seq']
+    logger.info(f"Обновление завершено. Актуальных замен в таблице: {len(replacements)}, изменений: {report['rows']}")
+    return report
 
 def main():
     update_replacements()
@@ -1,19 +1,18 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import csv
-import requests
 import sys
 import os
 import re
-import chardet
 import logging
-from io import StringIO
+import time
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from bot.db import init_db, clear_schedule, add_schedule
+from bot.db import init_db, load_schedule_staging, swap_schedule_from_staging
 from bot.config import SCHEDULE_URLS
+from scripts.fetcher import fetch_sources_sync, commit_sources
+from scripts.csv_stream import parse_csv
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -27,83 +26,42 @@ def extract_class_info(cell):
         return class_name, profile
     return cell, None
 
-def download_csv_with_encoding(url):
-    logger.info(f"Скачивание: {url}")
-    response = requests.get(url, timeout=30)
-    response.raise_for_status()
-
-    content = response.content
-    detected = chardet.detect(content)
-    encoding = detected.get('encoding', 'utf-8')
-    logger.info(f"Определена кодировка: {encoding}")
-
-    try:
-        text = content.decode(encoding)
-    except UnicodeDecodeError:
-        for enc in ['utf-8', 'windows-1251', 'cp1251', 'iso-8859-1']:
-            try:
-                text = content.decode(enc)
-                logger.info(f"Успешно декодировано как {enc}")
-                break
-            except UnicodeDecodeError:
-                continue
-        else:
-            raise Exception("Не удалось декодировать CSV ни в одной из известных кодировок")
-    return text
-
 def parse_schedule_data(rows, source_name):
+    """
+    Разбирает строки CSV одной параллели за один проход (rows — любой итерируемый, например csv.reader).
+    Возвращает список записей (class_name, profile, day, lesson_number, subject, room) —
+    в БД они попадают одной пачкой из update_schedule.
+    """
     class_pattern = re.compile(r'\d+[а-яА-Я]+')
-    header_idx = None
+    days = ['понедельник', 'вторник', 'среда', 'четверг', 'пятница']
     classes = []
+    current_day = None
+    parsed = []
 
     for i, row in enumerate(rows):
         if not row:
             continue
-        found = []
-        for j, cell in enumerate(row):
-            if class_pattern.search(cell) and 'каб' not in cell.lower():
-                class_name, profile = extract_class_info(cell)
-                found.append({
-                    'name': class_name,
-                    'profile': profile,
-                    'subject_idx': j,
-                    'room_idx': j + 1
-                })
-        if found:
-            header_idx = i
-            classes = found
-            logger.info(f"  Найдены классы: {[c['name'] for c in classes]} в строке {i}")
-            break
 
-    if not classes:
-        logger.warning(f"  Не удалось найти строку с классами в {source_name}")
-        return 0
-
-    days = ['понедельник', 'вторник', 'среда', 'четверг', 'пятница']
-    start_idx = None
-    for i in range(header_idx + 1, len(rows)):
-        if rows[i] and rows[i][0] and rows[i][0].strip() in days:
-            start_idx = i
-            logger.info(f"  Первый день найден: {rows[i][0]} в строке {i}")
-            break
-
-    if start_idx is None:
-        logger.warning(f"  Не найден день недели в {source_name}")
-        return 0
-
-    current_day = None
-    added = 0
-    i = start_idx
-
-    while i < len(rows):
-        row = rows[i]
-        if not row:
-            i += 1
+        # Сначала ищем строку с классами
+        if not classes:
+            for j, cell in enumerate(row):
+                if class_pattern.search(cell) and 'каб' not in cell.lower():
+                    class_name, profile = extract_class_info(cell)
+                    classes.append({
+                        'name': class_name,
+                        'profile': profile,
+                        'subject_idx': j,
+                        'room_idx': j + 1
+                    })
+            if classes:
+                logger.info(f"  Найдены классы: {[c['name'] for c in classes]} в строке {i}")
             continue
 
         # Проверка: строка является днём?
         day_cell = row[0].strip() if row[0] else ''
         if day_cell in days:
+            if current_day is None:
+                logger.info(f"  Первый день найден: {row[0]} в строке {i}")
             current_day = day_cell
             logger.debug(f"  Установлен день: {current_day} (строка {i})")
 
@@ -117,10 +75,12 @@ def parse_schedule_data(rows, source_name):
                         subject = row[subj_idx].strip() if subj_idx < len(row) else ''
                         room = row[room_idx].strip() if room_idx < len(row) else ''
                         if subject and subject.lower() not in ['', 'каб', 'предмет']:
-                            add_schedule(cls['name'], cls['profile'], current_day, lesson_num, subject, room)
-                            added += 1
+                            parsed.append((cls['name'], cls['profile'], current_day, lesson_num, subject, room))
                     logger.debug(f"    + обработан первый урок {lesson_num} из строки дня")
-            i += 1
+            continue
+
+        # До первого дня после строки с классами ничего не разбираем
+        if current_day is None:
             continue
 
         # Проверка: строка является уроком?
@@ -131,52 +91,81 @@ def parse_schedule_data(rows, source_name):
             lesson_num = int(row[1].strip())
 
         if lesson_num is not None and 1 <= lesson_num <= 8:
-            if current_day is None:
-                logger.warning(f"Урок {lesson_num} встретился до указания дня, пропускаем строку {i}")
-                i += 1
-                continue
-
             for cls in classes:
                 subj_idx = cls['subject_idx']
                 room_idx = cls['room_idx']
                 subject = row[subj_idx].strip() if subj_idx < len(row) else ''
                 room = row[room_idx].strip() if room_idx < len(row) else ''
                 if subject and subject.lower() not in ['', 'каб', 'предмет']:
-                    add_schedule(cls['name'], cls['profile'], current_day, lesson_num, subject, room)
-                    added += 1
-            i += 1
-            continue
+                    parsed.append((cls['name'], cls['profile'], current_day, lesson_num, subject, room))
 
         # Всё остальное пропускаем
-        i += 1
 
-    logger.info(f"  Добавлено записей для {source_name}: {added}")
-    return added
+    if not classes:
+        logger.warning(f"  Не удалось найти строку с классами в {source_name}")
+        return []
+    if current_day is None:
+        logger.warning(f"  Не найден день недели в {source_name}")
+        return []
+
+    logger.info(f"  Разобрано записей для {source_name}: {len(parsed)}")
+    return parsed
 
-def update_schedule():
-    """Функция для вызова из планировщика или из командной строки"""
+def update_schedule(urls: dict[str, str] | None = None):
+    """
+    Функция для вызова из планировщика или из командной строки.
+    Все таблицы скачиваются параллельно; разбираются и записываются только изменившиеся.
+    Возвращает отчёт: {'rows': число записанных строк, 'changed': [источники], 'timings': {фаза: секунды}}.
+    """
     logger.info("="*50)
-    logger.info("Начало полного обновления расписания...")
+    logger.info("Начало обновления расписания...")
     init_db()
-    clear_schedule()
+    urls = urls or SCHEDULE_URLS
+
+    timings = {'download': 0.0, 'parse': 0.0, 'load': 0.0, 'swap': 0.0}
+    started = time.perf_counter()
+    results = fetch_sources_sync({f"schedule_{class_num}": url for class_num, url in urls.items()})
+    timings['download'] = time.perf_counter() - started
 
-    total_added = 0
-    for class_num, url in SCHEDULE_URLS.items():
-        logger.info(f"\n--- Обработка {class_num} класса ---")
+    all_rows = []
+    changed = []
+    for source, result in results.items():
+        if not result.changed:
+            continue
+        logger.info(f"\n--- Обработка {source} ---")
         try:
-            text = download_csv_with_encoding(url)
-            csv_data = StringIO(text)
-            reader = csv.reader(csv_data)
-            rows = list(reader)
-            logger.info(f"Скачано строк: {len(rows)}")
-
-            added = parse_schedule_data(rows, f"{class_num} класс")
-            logger.info(f"Добавлено записей для {class_num} класса: {added}")
-            total_added += added
+            started = time.perf_counter()
+            parsed = parse_csv(result.content, source, lambda rows: parse_schedule_data(rows, source))
+            timings['parse'] += time.perf_counter() - started
         except Exception as e:
-            logger.exception(f"Ошибка при обработке {class_num} класса: {e}")
-
-    logger.info(f"\nВсего добавлено записей: {total_added}")
+            logger.exception(f"Ошибка при обработке {source}: {e}")
+            continue
+        if parsed:
+            all_rows.extend(row + (source,) for row in parsed)
+            changed.append(source)
+
+    # Валидаторы запоминаем только для записанных (или не изменившихся) таблиц,
+    # чтобы неразобранная таблица была скачана и разобрана заново в следующий раз
+    committed = [r for r in results.values() if not r.changed or r.source in changed]
+
+    if not all_rows:
+        # Живую таблицу не трогаем: пользователи продолжают видеть прежнее расписание
+        logger.info("Изменившихся таблиц расписания нет, таблица schedule не изменена")
+        commit_sources(committed)
+        return {'rows': 0, 'changed': [], 'timings': timings}
+
+    started = time.perf_counter()
+    total = load_schedule_staging(all_rows)
+    timings['load'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    swap_schedule_from_staging(changed)
+    timings['swap'] = time.perf_counter() - started
+    commit_sources(committed)
+
+    report = ", ".join(f"{phase} {seconds:.2f} с" for phase, seconds in timings.items())
+    logger.info(f"\nЗаписано строк: {total} из источников {changed} ({report})")
+    return {'rows': total, 'changed': changed, 'timings': timings}
 
 def main():
     update_schedule()